@@ -6,8 +6,535 @@
 # Demonstrates Python's dynamic typing, built-in data structures,
 # datetime module, type hints, and exception handling
 
-from datetime import datetime
-from typing import List, Dict, Optional
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import math
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from collections.abc import Mapping, Sequence, Sized
+from contextlib import nullcontext
+from datetime import date as Date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache, partial
+from itertools import accumulate, chain, count, filterfalse, groupby, islice
+from operator import lt, sub
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+# Date format accepted everywhere a date is entered
+DATE_FORMAT = '%Y-%m-%d'
+
+# Field names exposed by every expense record, in display order
+EXPENSE_FIELDS = ('Date', 'Amount', 'Category', 'Description')
+
+# Amounts are stored as integer minor units: by default two decimal places,
+# i.e. whole cents. A tracker can use another currency scale (0 for yen, 3
+# for dinars, ...).
+DEFAULT_CURRENCY_SCALE = 2
+CENTS_PER_UNIT = 10 ** DEFAULT_CURRENCY_SCALE
+MAX_CURRENCY_SCALE = 9
+_SCALE_FACTORS = tuple(10 ** scale for scale in range(MAX_CURRENCY_SCALE + 1))
+
+# Amounts are stored as signed 64-bit minor units
+_MIN_MINOR_UNITS = -2 ** 63
+_MAX_MINOR_UNITS = 2 ** 63 - 1
+
+# Day ordinal of 1970-01-01, the epoch used by numpy.datetime64
+_EPOCH_ORDINAL = 719163
+
+# Rows read to size the columns of print_expenses() when no widths are given
+PRINT_SAMPLE_ROWS = 1_000
+
+# Table lines print_expenses() collects before each write
+_PRINT_CHUNK_LINES = 4_096
+
+# Time buckets supported by ExpenseTracker.get_rollup()
+ROLLUP_GRANULARITIES = ('day', 'week', 'month', 'year')
+
+# Date index keys pack a day ordinal above a 40-bit row position, so one
+# sorted array of integers orders rows by date and then by insertion
+_ROW_BITS = 40
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+# ===================================================================
+# DATE HELPERS
+# ===================================================================
+
+def _parse_date(date: str) -> int:
+    """
+    Validate a YYYY-MM-DD date string and return its proleptic Gregorian ordinal.
+
+    Dates are compared as plain integers once parsed, so each date string
+    only has to be parsed a single time. Zero-padded ASCII dates, the usual
+    case, are checked by position and converted with date.fromisoformat(),
+    several times faster than datetime.strptime(). Anything else goes
+    through strptime(), which also accepts forms such as '2025-5-1', so
+    exactly the same strings are accepted as before.
+
+    Raises:
+        ValueError: If the string is not a valid YYYY-MM-DD date
+    """
+    if (len(date) == 10 and date[4] == '-' and date[7] == '-'
+            and date.isascii() and date.replace('-', '').isdigit()):
+        return Date.fromisoformat(date).toordinal()
+    operation = _active_operation.stats
+    if operation is not None:
+        operation.date_parses += 1
+    return datetime.strptime(date, DATE_FORMAT).toordinal()
+
+@lru_cache(maxsize=1 << 16)
+def _format_date(ordinal: int) -> str:
+    """Return the YYYY-MM-DD string for a day ordinal, caching recent dates."""
+    return Date.fromordinal(ordinal).isoformat()
+
+def _bucket_keys(ordinal: int) -> Tuple[int, int, int, int]:
+    """
+    Return the day, week, month and year bucket keys for a day ordinal.
+
+    Keys increase with time, so a date range maps to a contiguous key range:
+    weeks are keyed by the ordinal of their Monday and months by
+    year * 12 + month - 1.
+    """
+    day = Date.fromordinal(ordinal)
+    return ordinal, ordinal - day.weekday(), day.year * 12 + day.month - 1, day.year
+
+# Days per month in a common year
+_MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+def _period_cover(start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the fewest day, month and year buckets that exactly cover a date range.
+
+    Whole years and whole months inside [start, end] are covered by a single
+    bucket each, and only the days at the ragged edges by day buckets, so a
+    range of any length takes at most about a hundred buckets.
+
+    Yields:
+        Tuple[int, int]: (ROLLUP_GRANULARITIES level, bucket key) pairs
+    """
+    ordinal = start
+    while ordinal <= end:
+        day = Date.fromordinal(ordinal)
+        if day.day == 1:
+            leap = day.year % 4 == 0 and (day.year % 100 != 0 or day.year % 400 == 0)
+            month_end = ordinal + _MONTH_DAYS[day.month - 1] + (leap and day.month == 2) - 1
+            if day.month == 1:
+                year_end = ordinal + 365 + leap - 1
+                if year_end <= end:
+                    yield 3, day.year
+                    ordinal = year_end + 1
+                    continue
+            if month_end <= end:
+                yield 2, day.year * 12 + day.month - 1
+                ordinal = month_end + 1
+                continue
+        yield 0, ordinal
+        ordinal += 1
+
+def _bucket_label(granularity: str, key: int) -> str:
+    """Return the display label of a rollup bucket key."""
+    if granularity == 'day':
+        return _format_date(key)
+    if granularity == 'week':
+        year, week, _ = Date.fromordinal(key).isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == 'month':
+        return f"{key // 12:04d}-{key % 12 + 1:02d}"
+    return f"{key:04d}"
+
+def _to_cents(amount, scale: int = DEFAULT_CURRENCY_SCALE) -> int:
+    """
+    Convert an amount to whole minor units (cents at the default scale).
+
+    The amount is rounded as the decimal number that was written, with
+    halves rounded away from zero: 1.005 becomes 101 cents, although the
+    binary float 1.005 is slightly below it. Floats are read through their
+    shortest repr, which is the decimal the user typed. Only amounts that
+    land within rounding error of a half go through Decimal; everything
+    else stays on a float fast path.
+
+    Args:
+        amount: Number or numeric string
+        scale (int): Decimal places kept
+
+    Raises:
+        ValueError: If the amount is not a number, or is NaN
+        OverflowError: If the amount is infinite, or its minor units do
+            not fit in 64 bits
+        TypeError: If the amount is neither a number nor a string
+    """
+    factor = _SCALE_FACTORS[scale]
+    if type(amount) is int:
+        minor = amount * factor
+    else:
+        scaled = float(amount) * factor
+        minor = round(scaled)
+        if -0.499999 < scaled - minor < 0.499999 and -1e9 < scaled < 1e9:
+            # Float error stays far below 1e-6 at this magnitude, so it cannot
+            # move the value across a rounding boundary
+            return minor
+        exact = Decimal(float.__repr__(amount) if isinstance(amount, float) else str(amount).strip())
+        minor = int(exact.scaleb(scale).to_integral_value(ROUND_HALF_UP))
+    if not _MIN_MINOR_UNITS <= minor <= _MAX_MINOR_UNITS:
+        raise OverflowError("amount out of range")
+    return minor
+
+def _check_currency_scale(scale: int) -> int:
+    """Return a currency scale after checking that it is supported."""
+    if not isinstance(scale, int) or not 0 <= scale <= MAX_CURRENCY_SCALE:
+        raise ValueError(f"currency_scale must be an integer from 0 to {MAX_CURRENCY_SCALE}")
+    return scale
+
+# ===================================================================
+# BULK INGEST HELPERS
+# ===================================================================
+
+def _row_values(row) -> Tuple:
+    """Return the four expense fields of a tuple, list or mapping row."""
+    if isinstance(row, Mapping):
+        return tuple(row[name] for name in EXPENSE_FIELDS)
+    return tuple(row)
+
+def _validate_rows(rows: List, first_index: int, date_cache: Dict[str, int],
+                   scale: int = DEFAULT_CURRENCY_SCALE):
+    """
+    Validate a batch of rows without printing anything.
+
+    Date strings repeat heavily in real exports, so each distinct string is
+    parsed once and its ordinal reused through date_cache. Amounts are
+    converted to minor units with the given currency scale.
+
+    Returns:
+        Tuple[List[Tuple], List[Dict]]: Valid (ordinal, cents, category,
+        description) tuples and rejection records
+    """
+    valid = []
+    rejected = []
+    for index, row in enumerate(rows, first_index):
+        try:
+            date, amount, category, description = row if type(row) is tuple else _row_values(row)
+        except (KeyError, TypeError, ValueError):
+            rejected.append({'row': index, 'reason': "expected Date, Amount, Category and Description",
+                             'values': row})
+            continue
+
+        ordinal = date_cache.get(date) if isinstance(date, str) else None
+        if ordinal is None:
+            try:
+                ordinal = _parse_date(date)
+            except (TypeError, ValueError):
+                rejected.append({'row': index, 'reason': "invalid date", 'values': row})
+                continue
+            date_cache[date] = ordinal
+
+        try:
+            cents = _to_cents(amount, scale)
+        except (ValueError, TypeError, OverflowError):
+            rejected.append({'row': index, 'reason': "invalid amount", 'values': row})
+            continue
+
+        if not isinstance(category, str) or not isinstance(description, str):
+            rejected.append({'row': index, 'reason': "category and description must be text",
+                             'values': row})
+            continue
+        valid.append((ordinal, cents, category, description))
+    return valid, rejected
+
+def _validate_structured(records, first_index: int, scale: int = DEFAULT_CURRENCY_SCALE):
+    """
+    Validate a batch of a NumPy structured array with vectorized operations.
+
+    Dates are converted with numpy.datetime64 and amounts are rounded to
+    minor units for the whole batch at once. Only rows that fail, and the
+    rare amounts within rounding error of a half, are visited one at a
+    time.
+
+    Returns:
+        Tuple[List[Tuple], List[Dict]]: Same as _validate_rows()
+    """
+    import numpy
+
+    dates = records['Date']
+    valid_mask = numpy.ones(len(records), dtype=bool)
+    if dates.dtype.kind in 'US':
+        # datetime64 also accepts partial dates such as '2025-05', so insist
+        # on the full YYYY-MM-DD length before converting
+        valid_mask &= numpy.char.str_len(dates) == 10
+        dates = numpy.where(valid_mask, dates, 'NaT')
+    try:
+        days = dates.astype('datetime64[D]')
+    except ValueError:
+        # Some string is not a date at all; fall back to row-at-a-time checks
+        rows = zip(*(records[name].tolist() for name in EXPENSE_FIELDS))
+        return _validate_rows(list(rows), first_index, {}, scale)
+    date_mask = valid_mask & ~numpy.isnat(days)
+
+    amounts = records['Amount'].astype('float64')
+    amount_mask = numpy.isfinite(amounts)
+    scaled = numpy.where(amount_mask, amounts, 0) * 10 ** scale
+    # Minor units must fit the 64-bit amount column; casting larger values
+    # to int64 would silently wrap them around
+    amount_mask &= numpy.abs(scaled) < 2.0 ** 63
+    scaled = numpy.where(amount_mask, scaled, 0)
+    cents = numpy.rint(scaled).astype('int64')
+    # Same rounding as _to_cents(): values near a half are redone exactly
+    for position in numpy.flatnonzero(amount_mask & ((numpy.abs(scaled) >= 1e9)
+                                                     | (numpy.abs(scaled - cents) >= 0.499999))):
+        try:
+            cents[position] = _to_cents(float(amounts[position]), scale)
+        except OverflowError:
+            amount_mask[position] = False
+
+    ordinals = (days.astype('int64') + _EPOCH_ORDINAL).tolist()
+    cents = cents.tolist()
+    categories = records['Category'].tolist()
+    descriptions = records['Description'].tolist()
+
+    valid = []
+    rejected = []
+    for position, ok in enumerate((date_mask & amount_mask).tolist()):
+        category, description = categories[position], descriptions[position]
+        if ok and isinstance(category, str) and isinstance(description, str):
+            valid.append((ordinals[position], cents[position], category, description))
+        else:
+            if not date_mask[position]:
+                reason = "invalid date"
+            elif not amount_mask[position]:
+                reason = "invalid amount"
+            else:
+                reason = "category and description must be text"
+            rejected.append({'row': first_index + position, 'reason': reason,
+                             'values': records[position].tolist()})
+    return valid, rejected
+
+def _validated_batches(source, batch_size: int, scale: int) -> Iterator[Tuple[List[Tuple], List[Dict]]]:
+    """
+    Validate bulk input one batch at a time.
+
+    Args:
+        source: Anything accepted by ExpenseTracker.add_expenses_bulk()
+        batch_size (int): Rows validated together in one batch
+        scale (int): Currency scale for converting amounts
+
+    Yields:
+        Tuple[List[Tuple], List[Dict]]: Each batch's valid rows and
+        rejection records, as returned by _validate_rows()
+    """
+    if getattr(getattr(source, 'dtype', None), 'names', None):
+        # Structured arrays are validated a batch at a time with NumPy
+        for start in range(0, len(source), batch_size):
+            yield _validate_structured(source[start:start + batch_size], start, scale)
+        return
+
+    rows = read_expenses(source, 'csv') if isinstance(source, (str, os.PathLike)) else iter(source)
+    date_cache: Dict[str, int] = {}
+    start = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        if len(date_cache) > 100_000:
+            date_cache.clear()
+        yield _validate_rows(batch, start, date_cache, scale)
+        start += len(batch)
+
+# ===================================================================
+# STREAMING IMPORT AND EXPORT
+# ===================================================================
+
+# File formats understood by read_expenses() and write_expenses()
+FILE_FORMATS = ('csv', 'jsonl')
+
+def _detect_format(path: str) -> str:
+    """Guess the file format from its extension, ignoring compression suffixes."""
+    name = os.fspath(path).lower()
+    for suffix in ('.gz', '.zst'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+def _open_text(path: str, mode: str):
+    """
+    Open a text file for streaming, decompressing or compressing by extension.
+
+    '-' means standard input or output. Files ending in .gz use gzip and
+    files ending in .zst use the optional zstandard package.
+
+    Raises:
+        ValueError: If a .zst file is used without zstandard installed
+    """
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        if mode != 'r':
+            stream.flush()
+        # Let the with-statement close our wrapper, never the real stream
+        return open(stream.fileno(), mode, newline='', encoding='utf-8', closefd=False)
+    name = os.fspath(path).lower()
+    if name.endswith('.gz'):
+        import gzip
+        return gzip.open(path, mode + 't', newline='', encoding='utf-8')
+    if name.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Reading or writing .zst files requires the zstandard package")
+        return zstandard.open(path, mode + 't', newline='', encoding='utf-8')
+    return open(path, mode, newline='', encoding='utf-8')
+
+def _read_csv(handle) -> Iterator[Tuple]:
+    """
+    Yield (date, amount, category, description) tuples from CSV text.
+
+    A header row naming the four fields is optional; when present, the
+    columns may appear in any order.
+    """
+    import csv
+
+    reader = csv.reader(handle)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [name.strip().lower() for name in first]
+    fields = [name.lower() for name in EXPENSE_FIELDS]
+    if sorted(header) == sorted(fields):
+        positions = [header.index(name) for name in fields]
+        for row in reader:
+            if len(row) != len(positions):
+                yield tuple(row)
+            else:
+                yield tuple(row[position] for position in positions)
+    else:
+        yield tuple(first)
+        yield from (tuple(row) for row in reader)
+
+def _read_jsonl(handle) -> Iterator:
+    """
+    Yield one expense mapping per JSON Lines record.
+
+    Blank lines are skipped. A line that is not a JSON object is yielded as
+    its raw text, so bulk validation reports it as a rejected row.
+    """
+    import json
+
+    for line in handle:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else line.rstrip('\n')
+
+def read_expenses(path: str, file_format: Optional[str] = None) -> Iterator:
+    """
+    Stream expense rows from a CSV or JSON Lines file, one row at a time.
+
+    Args:
+        path (str): File to read, '-' for standard input; .gz and .zst
+            files are decompressed on the fly
+        file_format (Optional[str]): 'csv' or 'jsonl'; guessed from the
+            extension when omitted
+
+    Yields:
+        Rows accepted by ExpenseTracker.add_expenses_bulk()
+
+    Demonstrates:
+    - Generator functions for constant-memory processing
+    - Context managers inside generators
+    """
+    file_format = file_format or _detect_format(path)
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Unknown file format: {file_format}")
+    with _open_text(path, 'r') as handle:
+        if file_format == 'csv':
+            yield from _read_csv(handle)
+        else:
+            yield from _read_jsonl(handle)
+
+def write_expenses(expenses: Iterable[Mapping], path: str,
+                   file_format: Optional[str] = None,
+                   currency_scale: int = DEFAULT_CURRENCY_SCALE) -> int:
+    """
+    Stream expenses to a CSV or JSON Lines file without collecting them first.
+
+    Args:
+        expenses (Iterable[Mapping]): Expenses to write, e.g. from
+            ExpenseTracker.iter_expenses()
+        path (str): File to write, '-' for standard output; .gz and .zst
+            files are compressed on the fly
+        file_format (Optional[str]): 'csv' or 'jsonl'; guessed from the
+            extension when omitted
+        currency_scale (int): Decimal places written for CSV amounts, so
+            finer currencies survive a round trip
+
+    Returns:
+        int: Number of expenses written
+    """
+    import csv
+    import json
+
+    file_format = file_format or _detect_format(path)
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Unknown file format: {file_format}")
+    written = 0
+    with _open_text(path, 'w') as handle:
+        if file_format == 'csv':
+            writer = csv.writer(handle)
+            writer.writerow(EXPENSE_FIELDS)
+            for expense in expenses:
+                writer.writerow((expense['Date'], f"{expense['Amount']:.{currency_scale}f}",
+                                 expense['Category'], expense['Description']))
+                written += 1
+        else:
+            for expense in expenses:
+                handle.write(json.dumps(dict(expense), ensure_ascii=False))
+                handle.write('\n')
+                written += 1
+    return written
+
+# ===================================================================
+# PARALLEL SCAN KERNELS
+# ===================================================================
+
+# Day ordinal bounds used when a date filter is open-ended
+_MIN_ORDINAL = Date.min.toordinal()
+_MAX_ORDINAL = Date.max.toordinal()
+
+def _aggregate_partition(dates: array, amounts: array, codes: array,
+                         start: int, end: int, wanted_codes: Optional[frozenset]):
+    """
+    Total the cents and count the rows per category code in one partition.
+
+    Module-level so that it can run in a worker process. The serial path
+    calls it too, so both paths compute identical integer results.
+
+    Returns:
+        Tuple[Dict[int, int], Dict[int, int]]: Cents and counts by category code
+    """
+    cents_by_code: Dict[int, int] = {}
+    counts_by_code: Dict[int, int] = {}
+    for ordinal, cents, code in zip(dates, amounts, codes):
+        if start <= ordinal <= end and (wanted_codes is None or code in wanted_codes):
+            cents_by_code[code] = cents_by_code.get(code, 0) + cents
+            counts_by_code[code] = counts_by_code.get(code, 0) + 1
+    return cents_by_code, counts_by_code
+
+def _filter_partition(dates: array, codes: array, first_row: int,
+                      start: int, end: int, wanted_codes: Optional[frozenset]) -> array:
+    """
+    Return the row positions in one partition that pass the filters.
+
+    Returns:
+        array: Matching row positions in ascending order
+    """
+    return array('q', (row for row, ordinal, code in zip(count(first_row), dates, codes)
+                       if start <= ordinal <= end and (wanted_codes is None or code in wanted_codes)))
 
 # ===================================================================
 # UTILITY FUNCTIONS FOR USER INTERFACE
@@ -39,314 +566,5298 @@ def print_banner():
     print("Welcome to your personal expense tracking system!")
     print("=" * 60)
 
-def print_no_expenses_message():
-    """
-    Print a formatted message when no expenses are found.
-    Demonstrates Python's docstring conventions and Unicode box drawing characters.
-    """
-    message = """
-    ╔════════════════════════════════════════════════════════════════════════════╗
-    ║                                                                            ║
-    ║                        No Expenses Found!                                  ║
-    ║                                                                            ║
-    ║  You haven't recorded any expenses yet.                                    ║
-    ║  Use option 1 from the main menu to add your first expense.                ║
-    ║                                                                            ║
-    ╚════════════════════════════════════════════════════════════════════════════╝
-    """
-    print(message)
+def print_no_expenses_message(stream=None):
+    """
+    Print a formatted message when no expenses are found.
+    Demonstrates Python's docstring conventions and Unicode box drawing characters.
+
+    Args:
+        stream: Text file to write to (default: sys.stdout)
+    """
+    message = """
+    ╔════════════════════════════════════════════════════════════════════════════╗
+    ║                                                                            ║
+    ║                        No Expenses Found!                                  ║
+    ║                                                                            ║
+    ║  You haven't recorded any expenses yet.                                    ║
+    ║  Use option 1 from the main menu to add your first expense.                ║
+    ║                                                                            ║
+    ╚════════════════════════════════════════════════════════════════════════════╝
+    """
+    print(message, file=stream)
+
+def print_summary(summary: Dict, currency_scale: int = DEFAULT_CURRENCY_SCALE):
+    """
+    Print a formatted summary of expenses by category.
+
+    Args:
+        summary (Dict): Dictionary containing 'categories' and 'total' keys
+                       where 'categories' maps category names to amounts
+        currency_scale (int): Decimal places shown for the amounts
+
+    Demonstrates:
+    - Python's type hints
+    - Dictionary operations and comprehensions
+    - String formatting with f-strings
+    - Dynamic formatting based on content length
+    """
+    # Check if there are any expenses to display
+    if not summary['categories']:
+        print_no_expenses_message()
+        return
+
+    # Calculate dynamic column width based on longest category name
+    # Demonstrates Python's generator expressions and built-in functions
+    max_category_length = max(len(cat) for cat in summary['categories'].keys()) if summary['categories'] else 0
+    max_category_length = max(max_category_length, len("Category"))
+
+    # Print formatted header using f-string centering
+    print("\n" + "=" * (max_category_length + 20))
+    print(f"{'EXPENSE SUMMARY':^{max_category_length + 20}}")
+    print("=" * (max_category_length + 20))
+
+    # Print category breakdown section
+    print("\nCategory Breakdown:")
+    print("-" * (max_category_length + 20))
+    print(f"{'Category':<{max_category_length}} | {'Amount':>10}")
+    print("-" * (max_category_length + 20))
+
+    # Sort categories by amount in descending order
+    # Demonstrates Python's sorted() function with lambda key function
+    sorted_categories = sorted(summary['categories'].items(),
+                             key=lambda x: x[1],  # Sort by amount (second element)
+                             reverse=True)
+
+    # Print each category with proper alignment
+    # Demonstrates f-string formatting with alignment and precision
+    for category, amount in sorted_categories:
+        print(f"{category:<{max_category_length}} | ${amount:>9.{currency_scale}f}")
+
+    # Print total with visual separation
+    print("-" * (max_category_length + 20))
+    print(f"{'TOTAL':<{max_category_length}} | ${summary['total']:>9.{currency_scale}f}")
+    print("=" * (max_category_length + 20))
+
+def _select_rows(expenses: Iterable[Mapping], offset: int, limit: Optional[int],
+                 tail: Optional[int]) -> Tuple[Iterator[Mapping], Optional[int]]:
+    """
+    Apply offset, then tail, then limit to the expenses to print.
+
+    Sequences are sliced by position, so skipped rows are never touched;
+    other iterables are consumed lazily, except that tail has to read to
+    the end and keeps only the last rows.
+
+    Returns:
+        Tuple: Iterator over the selected rows, and the 1-based position of
+        the first one when it is known
+    """
+    if isinstance(expenses, Sequence):
+        start, stop = min(offset, len(expenses)), len(expenses)
+        if tail is not None:
+            start = max(start, stop - tail)
+        if limit is not None:
+            stop = min(stop, start + limit)
+        return map(expenses.__getitem__, range(start, stop)), start + 1
+    rows = islice(expenses, offset, None)
+    if tail is not None:
+        rows = iter(deque(rows, maxlen=tail))
+    if limit is not None:
+        rows = islice(rows, limit)
+    return rows, (offset + 1 if tail is None else None)
+
+def print_expenses(expenses: Iterable[Mapping], offset: int = 0, limit: Optional[int] = None,
+                   tail: Optional[int] = None, page_size: Optional[int] = None,
+                   widths: Optional[Dict[str, int]] = None, stream=None,
+                   currency_scale: int = DEFAULT_CURRENCY_SCALE):
+    """
+    Print a formatted table of expenses.
+
+    Rows are formatted as they are read and written out in large chunks, so
+    the first rows appear after a fixed amount of work however long the
+    result is, and an iterator such as ExpenseTracker.iter_expenses() is
+    never held in memory.
+
+    Args:
+        expenses (Iterable[Mapping]): Expense dictionaries or views, or an
+                              iterator over them, with keys:
+                              'Date', 'Amount', 'Category', 'Description'
+        offset (int): Number of leading expenses to skip
+        limit (Optional[int]): Print at most this many expenses ("head N")
+        tail (Optional[int]): Print only the last N expenses after the offset
+        page_size (Optional[int]): Pause after every page of this many rows
+            until Enter is pressed; entering 'q' stops the listing
+        widths (Optional[Dict[str, int]]): 'Category' and 'Description'
+            column widths, e.g. from ExpenseTracker.column_widths(); by
+            default the columns are sized from the first PRINT_SAMPLE_ROWS
+            rows, and longer values later on overflow their column
+        stream: Text file to write to (default: sys.stdout)
+        currency_scale (int): Decimal places shown for the amounts
+
+    Demonstrates:
+    - Peeking at an iterator with itertools.islice and chain
+    - Dynamic table formatting
+    - String formatting and alignment
+    - Buffered output with str.join
+    """
+    stream = stream if stream is not None else sys.stdout
+    total = len(expenses) if isinstance(expenses, Sized) else None
+    rows, first_position = _select_rows(expenses, offset, limit, tail)
+
+    # Read a sample to size the columns (or just the first row, when the
+    # widths are given) and check if there are expenses to display
+    sample = list(islice(rows, 1 if widths else PRINT_SAMPLE_ROWS))
+    if not sample:
+        print_no_expenses_message(stream)
+        return
+
+    # Calculate column widths from the given widths or the sample
+    date_width = 12  # Fixed width for YYYY-MM-DD format
+    amount_width = 10
+    if widths:
+        category_width = widths.get('Category', 0)
+        desc_width = widths.get('Description', 0)
+    else:
+        category_width = max(len(exp['Category']) for exp in sample)
+        desc_width = max(len(exp['Description']) for exp in sample)
+    category_width = max(category_width, len("Category"))
+    desc_width = max(desc_width, len("Description"))
+
+    # Calculate total table width including separators
+    total_width = date_width + amount_width + category_width + desc_width + 9  # 9 for separators and spaces
+
+    # Header with centered title and column headers
+    lines = ["", "=" * total_width, f"{'EXPENSE LIST':^{total_width}}", "=" * total_width,
+             f"{'Date':<{date_width}} | {'Amount':>{amount_width}} | "
+             f"{'Category':<{category_width}} | {'Description':<{desc_width}}",
+             "-" * total_width]
+
+    # Format each expense row, writing whole chunks of lines at a time
+    shown = 0
+    stopped = False
+    for expense in chain(sample, rows):
+        if page_size and shown and shown % page_size == 0:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            lines = []
+            if input("-- More -- (Enter to continue, q to quit) ").strip().lower() == 'q':
+                stopped = True
+                break
+        lines.append(f"{expense['Date']:<{date_width}} | ${float(expense['Amount']):>{amount_width-1}.{currency_scale}f} | "
+                     f"{expense['Category']:<{category_width}} | {expense['Description']:<{desc_width}}")
+        shown += 1
+        if len(lines) >= _PRINT_CHUNK_LINES:
+            stream.write("\n".join(lines) + "\n")
+            lines = []
+
+    # Table footer with count
+    lines.append("=" * total_width)
+    if total is not None and shown == total:
+        lines.append(f"Total Expenses: {total}")
+    elif total is not None and first_position is not None:
+        lines.append(f"Showing Expenses {first_position}-{first_position + shown - 1} of {total}")
+    elif offset or limit is not None or tail is not None or stopped:
+        lines.append(f"Expenses Shown: {shown}")
+    else:
+        lines.append(f"Total Expenses: {shown}")
+    lines.append("=" * total_width)
+    stream.write("\n".join(lines) + "\n")
+    stream.flush()
+
+# ===================================================================
+# COLUMNAR EXPENSE STORAGE
+# ===================================================================
+
+class ExpenseRow(Mapping):
+    """
+    Read-only dictionary-style view of one stored expense.
+
+    Rows are not kept as dictionaries; a view decodes its fields from the
+    store's columns on access, so callers can keep writing expense['Date'].
+
+    Demonstrates:
+    - Implementing the Mapping abstract base class
+    - __slots__ for small per-instance memory
+    """
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: 'ExpenseStore', row: int):
+        self._store = store
+        self._row = row
+
+    @property
+    def row_id(self) -> int:
+        """Position of this expense in its store."""
+        return self._row
+
+    @property
+    def expense_id(self) -> int:
+        """Stable ID of this expense, kept across updates and compaction."""
+        return self._store.expense_id(self._row)
+
+    def __getitem__(self, key: str):
+        store, row = self._store, self._row
+        if key == 'Date':
+            return _format_date(store.dates[row])
+        if key == 'Amount':
+            return store.amounts[row] / store.minor_units
+        if key == 'Category':
+            return store.categories[store.category_codes[row]]
+        if key == 'Description':
+            return store.description(row)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(EXPENSE_FIELDS)
+
+    def __len__(self) -> int:
+        return len(EXPENSE_FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class ExpenseStore(Sequence):
+    """
+    Column-oriented storage for expense records.
+
+    Each field lives in its own compact column instead of a dictionary per
+    row:
+
+    - dates: int32 day ordinals
+    - amounts: int64 minor units (cents at the default currency scale)
+    - category_codes: small integer codes into the categories list
+    - descriptions: UTF-8 bytes packed into one buffer, sliced by offsets
+
+    A row costs roughly 22 bytes plus its description text, compared with
+    several hundred bytes for a dictionary and its four values. Indexing the
+    store returns ExpenseRow views.
+
+    Rows are never changed in place. Deleting or updating an expense appends
+    a tombstone row that repeats the retired row's date, amount and
+    category (an update then appends the new version), and both rows count
+    as dead until a compaction copies the live rows to a new store. Each
+    expense keeps one expense ID through updates and compactions.
+
+    Demonstrates:
+    - The array module for typed, contiguous storage
+    - Dictionary encoding of repeated strings
+    - Implementing the Sequence abstract base class
+    """
+
+    # Whether rows survive after the process exits
+    durable = False
+    closed = False
+
+    def __init__(self, currency_scale: int = DEFAULT_CURRENCY_SCALE):
+        # Amounts are integers counting 1 / minor_units of a currency unit
+        self.currency_scale = _check_currency_scale(currency_scale)
+        self.minor_units = 10 ** currency_scale
+        self.dates = array('i')
+        self.amounts = array('q')
+        self.category_codes = array('H')
+        self.categories: List[str] = []
+        self._category_lookup: Dict[str, int] = {}
+        self._text = bytearray()
+        self._text_offsets = array('q', [0])
+
+        # Tombstone row -> row it retires; both rows are dead
+        self.tombstones: Dict[int, int] = {}
+        self.dead_rows = set()
+        # Expense IDs. The rows copied by the last compaction take theirs
+        # from a sorted array, later rows are row + _id_offset, and the new
+        # version written by an update keeps the ID of the expense it
+        # replaces (row -> ID, and the ID's current row for lookups).
+        self._compacted_ids = array('q')
+        self._id_offset = 0
+        self._replacement_ids: Dict[int, int] = {}
+        self._current_rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ExpenseRow(self, row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("expense index out of range")
+        return ExpenseRow(self, index)
+
+    def category_code(self, category: str) -> int:
+        """Return the code for a category name, assigning a new one if needed."""
+        code = self._category_lookup.get(category)
+        if code is None:
+            code = len(self.categories)
+            if code > 0xFFFF and self.category_codes.typecode == 'H':
+                # Widen the column once 16-bit codes run out
+                self.category_codes = array('I', self.category_codes)
+            self.categories.append(category)
+            self._category_lookup[category] = code
+        return code
+
+    def description(self, row: int) -> str:
+        """Decode the description stored for a row."""
+        offsets = self._text_offsets
+        return self._text[offsets[row]:offsets[row + 1]].decode('utf-8', 'surrogatepass')
+
+    def append(self, ordinal: int, cents: int, category: str, description: str) -> int:
+        """
+        Append one expense to every column.
+
+        Args:
+            ordinal (int): Day ordinal of the expense date
+            cents (int): Amount in cents
+            category (str): Category name
+            description (str): Description text
+
+        Returns:
+            int: Row position of the new expense
+        """
+        return self.extend([(ordinal, cents, category, description)])
+
+    def extend(self, rows: List[Tuple[int, int, str, str]]) -> int:
+        """
+        Append a batch of (ordinal, cents, category, description) rows.
+
+        Returns:
+            int: Row position of the first new expense
+        """
+        first_row = len(self.dates)
+        if not rows:
+            return first_row
+        # Split the batch into one list per field. The numeric fields are
+        # converted and the text fields checked before any column changes,
+        # so a bad row cannot leave the columns out of step.
+        ordinals = array(self.dates.typecode, [row[0] for row in rows])
+        amounts = array(self.amounts.typecode, [row[1] for row in rows])
+        categories = [row[2] for row in rows]
+        descriptions = [row[3] for row in rows]
+        if not all(isinstance(text, str) for text in chain(categories, descriptions)):
+            raise TypeError("category and description must be text")
+
+        codes = list(map(self._category_lookup.get, categories))
+        if None in codes:
+            codes = list(map(self.category_code, categories))
+
+        # Pure-ASCII batches are encoded in one call, with byte offsets
+        # taken straight from the string lengths
+        text = self._text
+        joined = ''.join(descriptions)
+        if joined.isascii():
+            self._text_offsets.extend(islice(accumulate(map(len, descriptions), initial=len(text)), 1, None))
+            text += joined.encode('ascii')
+        else:
+            for description in descriptions:
+                text += description.encode('utf-8', 'surrogatepass')
+                self._text_offsets.append(len(text))
+
+        self.amounts.extend(amounts)
+        self.category_codes.extend(codes)
+        # The date column is extended last so rows only become visible
+        # once all of their fields are in place
+        self.dates.extend(ordinals)
+        return first_row
+
+    def record(self, row: int) -> Tuple[int, int, str, str]:
+        """Return a row as an (ordinal, cents, category, description) tuple."""
+        return (self.dates[row], self.amounts[row], self.categories[self.category_codes[row]],
+                self.description(row))
+
+    def expense_id(self, row: int) -> int:
+        """Return the expense ID of a row."""
+        expense_id = self._replacement_ids.get(row)
+        if expense_id is not None:
+            return expense_id
+        if row < len(self._compacted_ids):
+            return self._compacted_ids[row]
+        return row + self._id_offset
+
+    def find(self, expense_id: int) -> Optional[int]:
+        """
+        Return the row holding the current version of an expense.
+
+        Returns:
+            Optional[int]: Row position, or None if no live expense has the ID
+        """
+        row = self._current_rows.get(expense_id)
+        if row is None:
+            row = expense_id - self._id_offset
+            ids = self._compacted_ids
+            if row < len(ids):
+                row = bisect_left(ids, expense_id)
+        if 0 <= row < len(self) and row not in self.dead_rows and self.expense_id(row) == expense_id:
+            return row
+        return None
+
+    def supersede(self, row: int, replacement: Optional[Tuple[int, int, str, str]] = None) -> int:
+        """
+        Retire a live row, optionally appending the new version of its expense.
+
+        Args:
+            row (int): Row to retire
+            replacement (Optional[Tuple]): New (ordinal, cents, category,
+                description) version, which keeps the expense ID; None
+                deletes the expense
+
+        Returns:
+            int: Row position of the tombstone; the new version follows it
+        """
+        tombstone = self._append_tombstone(row, _OP_DELETE if replacement is None else _OP_REPLACE)
+        if replacement is not None:
+            self.extend([replacement])
+        return tombstone
+
+    def _append_tombstone(self, target: int, op: int) -> int:
+        """Append the tombstone row retiring target and return its position."""
+        row = len(self.dates)
+        self._record_tombstone(row, target, op)
+        self.amounts.append(self.amounts[target])
+        self.category_codes.append(self.category_codes[target])
+        self._text_offsets.append(len(self._text))
+        self.dates.append(self.dates[target])
+        return row
+
+    def _record_tombstone(self, row: int, target: int, op: int):
+        """Mark both rows dead and move the expense ID to the row after a replacement."""
+        self.tombstones[row] = target
+        self.dead_rows.add(target)
+        self.dead_rows.add(row)
+        expense_id = self.expense_id(target)
+        if op == _OP_REPLACE:
+            self._replacement_ids[row + 1] = expense_id
+            self._current_rows[expense_id] = row + 1
+        else:
+            self._current_rows.pop(expense_id, None)
+
+    def truncate(self, rows: int, categories: int):
+        """
+        Drop the rows from position rows onwards and the categories they added.
+
+        Undoes a write that failed partway. Only rows and categories added
+        since the store was opened can be dropped.
+
+        Args:
+            rows (int): Number of rows to keep
+            categories (int): Number of category names to keep
+        """
+        # Bring retired expenses back, newest tombstone first
+        for row in sorted((row for row in self.tombstones if row >= rows), reverse=True):
+            target = self.tombstones.pop(row)
+            self.dead_rows.discard(row)
+            self.dead_rows.discard(target)
+            self._replacement_ids.pop(row + 1, None)
+            expense_id = self.expense_id(target)
+            if target in self._replacement_ids:
+                self._current_rows[expense_id] = target
+            else:
+                self._current_rows.pop(expense_id, None)
+        for name in self.categories[categories:]:
+            del self._category_lookup[name]
+        del self.categories[categories:]
+        del self.dates[rows:]
+        del self.amounts[rows:]
+        del self.category_codes[rows:]
+        self._truncate_text(rows)
+
+    def _truncate_text(self, rows: int):
+        """Drop the description text of the rows from position rows onwards."""
+        del self._text[self._text_offsets[rows]:]
+        del self._text_offsets[rows + 1:]
+
+    def rows_by_id(self, end: int) -> Iterator[int]:
+        """
+        Return the live rows before end, in expense ID order.
+
+        The dead rows and replacements are read when this is called, so the
+        result can be consumed while later rows are being written. Rows whose
+        ID was not moved by an update are already in ID order; only the
+        replacement rows are sorted and merged in.
+        """
+        dead = frozenset(row for row in self.dead_rows if row < end)
+        replaced = sorted((row for row in self._replacement_ids if row < end and row not in dead),
+                          key=self.expense_id)
+        skipped = dead.union(replaced)
+        return heapq.merge((row for row in range(end) if row not in skipped), replaced,
+                           key=self.expense_id)
+
+    def empty_copy(self) -> 'ExpenseStore':
+        """Return an empty store with the same currency scale and category codes."""
+        copy = ExpenseStore(self.currency_scale)
+        for category in self.categories:
+            copy.category_code(category)
+        return copy
+
+    def copy_rows(self, source: 'ExpenseStore', rows: Iterable[int], end: int,
+                  batch_size: int = 10_000):
+        """
+        Fill this empty copy with source's live rows before end.
+
+        Args:
+            source (ExpenseStore): Store being compacted
+            rows (Iterable[int]): source.rows_by_id(end)
+            end (int): Rows of source the copy covers; replay() applies
+                the rest
+            batch_size (int): Rows appended at a time
+
+        The rows keep their expense IDs, and rows that source gains after
+        end continue its ID sequence here.
+        """
+        ids = array('q')
+        batch = []
+        for row in rows:
+            ids.append(source.expense_id(row))
+            batch.append(source.record(row))
+            if len(batch) == batch_size:
+                self.extend(batch)
+                batch = []
+        self.extend(batch)
+        self._compacted_ids = ids
+        self._id_offset = end + source._id_offset - len(ids)
+
+    def replay(self, source: 'ExpenseStore', first_row: int):
+        """
+        Apply the rows source gained from first_row onwards to this copy.
+
+        Inserts, deletes and updates are repeated in order, so this copy
+        catches up with writes made while it was being filled.
+        """
+        row = first_row
+        while row < len(source):
+            target = source.tombstones.get(row)
+            if target is None:
+                self.extend([source.record(row)])
+                row += 1
+                continue
+            replaced = row + 1 in source._replacement_ids
+            self.supersede(self.find(source.expense_id(target)),
+                           source.record(row + 1) if replaced else None)
+            row += 2 if replaced else 1
+
+    def commit_compaction(self, compacted: 'ExpenseStore'):
+        """Make a compacted copy durable in place of this store; nothing to do in memory."""
+
+    def discard(self):
+        """Drop a compacted copy that will not be committed."""
+        self.close()
+
+    def detach(self):
+        """
+        Stop writing to the store after compaction replaced it.
+
+        Its rows stay readable for readers that were still using it.
+        """
+
+    def max_description_length(self) -> int:
+        """Return the encoded length of the longest description, in bytes."""
+        offsets = self._text_offsets
+        return max(map(sub, islice(offsets, 1, None), offsets), default=0)
+
+    def flush(self, sync: bool = True):
+        """Persist buffered writes; in-memory stores have nothing to do."""
+
+    def close(self):
+        """Release any resources held by the store."""
+
+    def memory_usage(self) -> int:
+        """Return the approximate number of bytes held by the columns."""
+        columns = (self.dates, self.amounts, self.category_codes, self._text_offsets)
+        return (sum(column.itemsize * len(column) for column in columns)
+                + len(self._text)
+                + sum(len(name) for name in self.categories))
+
+# ===================================================================
+# PERSISTENT STORAGE ENGINE
+# ===================================================================
+
+# On-disk layout of a tracker directory:
+#   expenses.log      header + fixed-width expense records (append-only)
+#   descriptions.dat  UTF-8 description bytes referenced by the records
+#   categories.dat    length-prefixed category names, in code order
+#   snapshot.dat      compacted summary totals and date index
+#   segments.dat      compressed per-day, per-category totals
+#   ids.dat           expense IDs of the rows copied by the last compaction
+#   compact.tmp/      a compaction in progress; holds a COMMIT marker once
+#                     its files are ready to replace the ones above
+LOG_FILE = 'expenses.log'
+DESCRIPTIONS_FILE = 'descriptions.dat'
+CATEGORIES_FILE = 'categories.dat'
+SNAPSHOT_FILE = 'snapshot.dat'
+SEGMENTS_FILE = 'segments.dat'
+IDS_FILE = 'ids.dat'
+COMPACTION_DIR = 'compact.tmp'
+COMPACTION_MARKER = 'COMMIT'
+
+# Log header: magic, format version, record size, byte order, currency
+# scale, padding. Version 1 logs predate the scale byte and use 2 places;
+# version 3 logs may hold tombstone records.
+_LOG_HEADER = struct.Struct('=8sIIBB14x')
+_LOG_MAGIC = b'EXPLOG\x00\x01'
+_LOG_VERSION = 3
+_LOG_VERSIONS = (1, 2, 3)
+
+# Log record: date ordinal, category code, cents, description offset,
+# description length, operation, padding. Every field sits at a multiple
+# of its own size, so columns can be read as strided memoryview casts.
+_LOG_RECORD = struct.Struct('=iIqqIB3x')
+_LOG_OP_OFFSET = 28
+_OP_INSERT = 1
+# Tombstones repeat the retired row's date, code and cents, and keep its
+# row position in the description offset field with a length of 0. A
+# replacement is always followed by the new version's insert record.
+_OP_DELETE = 2
+_OP_REPLACE = 3
+
+# Expense ID file header: magic, version, rows covered, ID offset of later
+# rows. The body holds the sorted int64 IDs of the rows covered.
+_IDS_HEADER = struct.Struct('=8sIxxxxqq')
+_IDS_MAGIC = b'EXPIDS\x00\x01'
+_IDS_VERSION = 1
+
+# Snapshot header: magic, version, rows covered, category count, index length
+_SNAPSHOT_HEADER = struct.Struct('=8sIxxxxqqq')
+_SNAPSHOT_MAGIC = b'EXPSNAP\x01'
+_SNAPSHOT_VERSION = 1
+
+# Segment totals header: magic, version, rows covered, entry count. The
+# zlib-compressed body holds (ordinal, category code, cents, rows) entries.
+_SEGMENTS_HEADER = struct.Struct('=8sIxxxxqq')
+_SEGMENTS_MAGIC = b'EXPSEGS\x01'
+_SEGMENTS_VERSION = 1
+
+# Length prefix for each name in the categories file
+_NAME_LENGTH = struct.Struct('=I')
+
+def _byte_positions(data: bytes, value: int) -> Iterator[int]:
+    """Yield every position of a byte value in data, searching in C."""
+    position = data.find(value)
+    while position != -1:
+        yield position
+        position = data.find(value, position + 1)
+
+class _ChainedColumn(Sequence):
+    """
+    A column made of a read-only memory-mapped part followed by an
+    in-memory array that receives new values.
+    """
+
+    __slots__ = ('base', 'tail', '_base_length')
+
+    def __init__(self, base, tail: array):
+        self.base = base
+        self.tail = tail
+        self._base_length = len(base)
+
+    @property
+    def typecode(self) -> str:
+        return self.tail.typecode
+
+    @property
+    def itemsize(self) -> int:
+        return self.tail.itemsize
+
+    def __len__(self) -> int:
+        return self._base_length + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return array(self.typecode, (self[position] for position in range(start, stop, step)))
+            # Contiguous slices are copied in bulk from each part
+            base_length = self._base_length
+            result = array(self.typecode)
+            if start < base_length and start < stop:
+                result.frombytes(self.base[start:min(stop, base_length)].tobytes())
+            if stop > base_length:
+                result.extend(self.tail[max(start - base_length, 0):stop - base_length])
+            return result
+        if index < 0:
+            index += len(self)
+        if index < self._base_length:
+            return self.base[index]
+        return self.tail[index - self._base_length]
+
+    def __iter__(self):
+        return chain(self.base, self.tail)
+
+    def append(self, value: int):
+        self.tail.append(value)
+
+    def extend(self, values):
+        self.tail.extend(values)
+
+    def __delitem__(self, index: slice):
+        # Only the in-memory tail can shrink
+        start = index.indices(len(self))[0]
+        if start < self._base_length or index.stop is not None:
+            raise ValueError("only values after the mapped part can be deleted")
+        del self.tail[start - self._base_length:]
+
+class PersistentExpenseStore(ExpenseStore):
+    """
+    Expense store backed by an append-only log in a directory.
+
+    Rows that already exist when the store is opened are read straight from
+    memory-mapped files, so opening does not parse any rows. Rows added
+    afterwards are written to the log and also kept in memory.
+
+    Writes are group-committed: the files are fsynced once every
+    sync_every rows, and on flush() or close(). A crash can lose at most
+    the rows since the last sync; a partially written record is discarded
+    the next time the store is opened.
+
+    Demonstrates:
+    - Binary file formats with the struct module
+    - Memory-mapped files and zero-copy memoryview casts
+    - Context managers for resource cleanup
+    """
+
+    durable = True
+
+    def __init__(self, path: str, sync_every: int = 1, currency_scale: Optional[int] = None):
+        """
+        Open or create the store in a directory.
+
+        Args:
+            path (str): Directory holding the store files
+            sync_every (int): Rows written between fsyncs (0 syncs only on flush)
+            currency_scale (Optional[int]): Decimal places of the amounts;
+                a new store records it, an existing one must match it.
+                None uses the stored scale, or the default for a new store.
+
+        Raises:
+            ValueError: If the files are not a compatible expense store
+        """
+        super().__init__(DEFAULT_CURRENCY_SCALE if currency_scale is None else currency_scale)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.sync_every = sync_every
+        self._unsynced = 0
+        self._views: List[memoryview] = []
+        self._maps: List[mmap.mmap] = []
+
+        self._recover_compaction()
+        self._load_categories()
+        self._load_ids()
+        self._text_base = self._open_append(DESCRIPTIONS_FILE)
+        self._text_file = open(os.path.join(path, DESCRIPTIONS_FILE), 'ab')
+        self._categories_file = open(os.path.join(path, CATEGORIES_FILE), 'ab')
+        self._map_log(currency_scale)
+        self._log_file = open(os.path.join(path, LOG_FILE), 'ab')
+
+    def _open_append(self, name: str) -> int:
+        """Create a store file if needed and return its current size."""
+        file_path = os.path.join(self.path, name)
+        with open(file_path, 'ab'):
+            pass
+        return os.path.getsize(file_path)
+
+    def _map(self, name: str) -> Optional[mmap.mmap]:
+        """Memory-map a store file read-only, or return None if it is empty."""
+        with open(os.path.join(self.path, name), 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                return None
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def _view(self, view: memoryview) -> memoryview:
+        """Track a memoryview so it can be released before unmapping."""
+        self._views.append(view)
+        return view
+
+    def _load_categories(self):
+        """Read the category names, dropping a partially written last entry."""
+        self._open_append(CATEGORIES_FILE)
+        file_path = os.path.join(self.path, CATEGORIES_FILE)
+        with open(file_path, 'rb') as handle:
+            data = handle.read()
+        position = 0
+        while position + _NAME_LENGTH.size <= len(data):
+            (length,) = _NAME_LENGTH.unpack_from(data, position)
+            end = position + _NAME_LENGTH.size + length
+            if end > len(data):
+                break
+            self.category_code(data[position + _NAME_LENGTH.size:end].decode('utf-8', 'surrogatepass'))
+            position = end
+        if position != len(data):
+            os.truncate(file_path, position)
+
+    def _recover_compaction(self):
+        """Finish a compaction that reached its commit marker, or discard one that did not."""
+        temp_path = os.path.join(self.path, COMPACTION_DIR)
+        if not os.path.isdir(temp_path):
+            return
+        if os.path.exists(os.path.join(temp_path, COMPACTION_MARKER)):
+            self._finish_compaction()
+        else:
+            import shutil
+            shutil.rmtree(temp_path)
+
+    def _finish_compaction(self):
+        """Move committed compaction files into place and remove the temporary directory."""
+        import shutil
+
+        temp_path = os.path.join(self.path, COMPACTION_DIR)
+        for name in (LOG_FILE, DESCRIPTIONS_FILE, CATEGORIES_FILE, IDS_FILE):
+            source = os.path.join(temp_path, name)
+            if os.path.exists(source):
+                os.replace(source, os.path.join(self.path, name))
+        shutil.rmtree(temp_path)
+
+    def _load_ids(self):
+        """Map the expense IDs saved by the last compaction, if there was one."""
+        ids_path = os.path.join(self.path, IDS_FILE)
+        if not os.path.exists(ids_path):
+            return
+        mapped = self._map(IDS_FILE)
+        if mapped is None or len(mapped) < _IDS_HEADER.size:
+            raise ValueError(f"Not an expense ID file: {ids_path}")
+        magic, version, rows, offset = _IDS_HEADER.unpack_from(mapped)
+        if (magic != _IDS_MAGIC or version != _IDS_VERSION
+                or len(mapped) != _IDS_HEADER.size + rows * array('q').itemsize):
+            raise ValueError(f"Unsupported expense ID file: {ids_path}")
+        self._compacted_ids = self._view(memoryview(mapped)[_IDS_HEADER.size:].cast('q'))
+        self._id_offset = offset
+
+    def _write_ids(self):
+        """Save the compacted rows' expense IDs and the ID offset of later rows."""
+        with open(os.path.join(self.path, IDS_FILE), 'wb') as handle:
+            handle.write(_IDS_HEADER.pack(_IDS_MAGIC, _IDS_VERSION, len(self._compacted_ids),
+                                          self._id_offset))
+            handle.write(self._compacted_ids.tobytes())
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _map_log(self, currency_scale: Optional[int]):
+        """
+        Validate the log header and map existing records as strided columns.
+
+        Trailing records that were only partly written, or that refer to
+        description bytes, categories or rows that never reached the disk,
+        are truncated away; so is a replacement tombstone whose new version
+        is missing. Tombstones are then found by scanning the operation
+        bytes alone.
+        """
+        log_path = os.path.join(self.path, LOG_FILE)
+        size = self._open_append(LOG_FILE)
+        if size == 0:
+            with open(log_path, 'ab') as handle:
+                handle.write(_LOG_HEADER.pack(_LOG_MAGIC, _LOG_VERSION, _LOG_RECORD.size,
+                                              sys.byteorder == 'little', self.currency_scale))
+            size = _LOG_HEADER.size
+        with open(log_path, 'rb') as handle:
+            header = handle.read(_LOG_HEADER.size)
+        if len(header) < _LOG_HEADER.size:
+            raise ValueError(f"Not an expense log: {log_path}")
+        magic, version, record_size, little_endian, stored_scale = _LOG_HEADER.unpack(header)
+        if magic != _LOG_MAGIC or version not in _LOG_VERSIONS or record_size != _LOG_RECORD.size:
+            raise ValueError(f"Unsupported expense log format: {log_path}")
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError(f"Expense log was written with a different byte order: {log_path}")
+        if version == 1:
+            stored_scale = DEFAULT_CURRENCY_SCALE
+        self._log_version = version
+        if currency_scale is not None and currency_scale != stored_scale:
+            raise ValueError(f"Expense log uses {stored_scale} decimal places, not {currency_scale}: {log_path}")
+        self.currency_scale = _check_currency_scale(stored_scale)
+        self.minor_units = 10 ** stored_scale
+
+        count = (size - _LOG_HEADER.size) // _LOG_RECORD.size
+        mapped = self._map(LOG_FILE) if count else None
+        while count:
+            offset = _LOG_HEADER.size + (count - 1) * _LOG_RECORD.size
+            _, code, _, text_offset, text_length, op = _LOG_RECORD.unpack_from(mapped, offset)
+            if code < len(self.categories):
+                if op == _OP_INSERT and text_offset + text_length <= self._text_base:
+                    break
+                if op == _OP_DELETE and text_length == 0 and text_offset < count - 1:
+                    break
+            count -= 1
+        if _LOG_HEADER.size + count * _LOG_RECORD.size != size:
+            os.truncate(log_path, _LOG_HEADER.size + count * _LOG_RECORD.size)
+
+        if count:
+            records = self._view(memoryview(mapped)[_LOG_HEADER.size:_LOG_HEADER.size + count * _LOG_RECORD.size])
+            int32 = self._view(records.cast('i'))
+            uint32 = self._view(records.cast('I'))
+            int64 = self._view(records.cast('q'))
+            base_dates = self._view(int32[0::8])
+            base_codes = self._view(uint32[1::8])
+            base_amounts = self._view(int64[1::4])
+            self._base_text_offsets = self._view(int64[2::4])
+            self._base_text_lengths = self._view(uint32[6::8])
+            self._mapped_text = self._map(DESCRIPTIONS_FILE) or b''
+            ops = bytes(records[_LOG_OP_OFFSET::_LOG_RECORD.size])
+            if ops.count(_OP_INSERT) != count:
+                for row in sorted(chain(_byte_positions(ops, _OP_DELETE),
+                                        _byte_positions(ops, _OP_REPLACE))):
+                    self._record_tombstone(row, self._base_text_offsets[row], ops[row])
+        else:
+            base_dates = base_codes = base_amounts = ()
+        self._base_rows = count
+        self.dates = _ChainedColumn(base_dates, array('i'))
+        self.amounts = _ChainedColumn(base_amounts, array('q'))
+        self.category_codes = _ChainedColumn(base_codes, array('I'))
+
+    def description(self, row: int) -> str:
+        """Decode the description stored for a row."""
+        if row >= self._base_rows:
+            return super().description(row - self._base_rows)
+        offset = self._base_text_offsets[row]
+        return self._mapped_text[offset:offset + self._base_text_lengths[row]].decode('utf-8', 'surrogatepass')
+
+    def max_description_length(self) -> int:
+        """Return the encoded length of the longest description, in bytes."""
+        base = max(self._base_text_lengths, default=0) if self._base_rows else 0
+        return max(base, super().max_description_length())
+
+    def truncate(self, rows: int, categories: int):
+        """
+        Drop the rows from position rows onwards, in memory and on disk.
+
+        The store files are reopened after being cut back, so bytes a failed
+        write left in their buffers are thrown away rather than appended
+        later.
+        """
+        super().truncate(rows, categories)
+        category_bytes = sum(_NAME_LENGTH.size + len(name.encode('utf-8', 'surrogatepass'))
+                             for name in self.categories)
+        self._log_file = self._reopen_truncated(self._log_file, LOG_FILE,
+                                                _LOG_HEADER.size + rows * _LOG_RECORD.size)
+        self._text_file = self._reopen_truncated(self._text_file, DESCRIPTIONS_FILE,
+                                                 self._text_base + len(self._text))
+        self._categories_file = self._reopen_truncated(self._categories_file, CATEGORIES_FILE,
+                                                       category_bytes)
+
+    def _truncate_text(self, rows: int):
+        """Drop the in-memory description text of rows from position rows onwards."""
+        super()._truncate_text(rows - self._base_rows)
+
+    def _reopen_truncated(self, handle, name: str, size: int):
+        """Close a store file, cut it back to size bytes and open it again for appending."""
+        try:
+            handle.close()
+        except OSError:
+            pass
+        file_path = os.path.join(self.path, name)
+        if os.path.getsize(file_path) > size:
+            os.truncate(file_path, size)
+        return open(file_path, 'ab')
+
+    def extend(self, rows: List[Tuple[int, int, str, str]]) -> int:
+        """
+        Append a batch of rows to the log and to the in-memory columns.
+
+        Returns:
+            int: Row position of the first new expense
+        """
+        known_categories = len(self.categories)
+        text_start = len(self._text)
+        first_row = super().extend(rows)
+
+        # New category names go to disk before any record that uses them
+        for name in self.categories[known_categories:]:
+            encoded_name = name.encode('utf-8', 'surrogatepass')
+            self._categories_file.write(_NAME_LENGTH.pack(len(encoded_name)) + encoded_name)
+
+        # Description bytes were already encoded into the in-memory tail
+        # buffer; write the new part and point each record into the file
+        self._text_file.write(memoryview(self._text)[text_start:])
+        offsets = self._text_offsets
+        codes = self.category_codes.tail
+        text_base = self._text_base
+        pack = _LOG_RECORD.pack
+        first_tail = first_row - self._base_rows
+        self._log_file.write(b''.join(
+            pack(ordinal, codes[tail], cents, text_base + offsets[tail],
+                 offsets[tail + 1] - offsets[tail], _OP_INSERT)
+            for tail, (ordinal, cents, _, _) in enumerate(rows, first_tail)))
+
+        self._unsynced += len(rows)
+        if self.sync_every and self._unsynced >= self.sync_every:
+            self.flush(sync=True)
+        return first_row
+
+    def _append_tombstone(self, target: int, op: int) -> int:
+        """Append a tombstone row and write its record to the log."""
+        if self._log_version != _LOG_VERSION:
+            self._upgrade_log()
+        row = super()._append_tombstone(target, op)
+        self._log_file.write(_LOG_RECORD.pack(self.dates[row], self.category_codes[row],
+                                              self.amounts[row], target, 0, op))
+        self._unsynced += 1
+        # A replacement is synced together with the insert that follows it
+        if op == _OP_DELETE and self.sync_every and self._unsynced >= self.sync_every:
+            self.flush(sync=True)
+        return row
+
+    def _upgrade_log(self):
+        """Rewrite an older log's header before its first tombstone, so older code refuses it."""
+        self._log_file.flush()
+        with open(os.path.join(self.path, LOG_FILE), 'r+b') as handle:
+            handle.write(_LOG_HEADER.pack(_LOG_MAGIC, _LOG_VERSION, _LOG_RECORD.size,
+                                          sys.byteorder == 'little', self.currency_scale))
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._log_version = _LOG_VERSION
+
+    def empty_copy(self) -> 'PersistentExpenseStore':
+        """
+        Create an empty store in the compaction directory.
+
+        The category file is copied, so the copy assigns the same codes.
+        """
+        import shutil
+
+        self.flush(sync=True)
+        temp_path = os.path.join(self.path, COMPACTION_DIR)
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+        shutil.copyfile(os.path.join(self.path, CATEGORIES_FILE), os.path.join(temp_path, CATEGORIES_FILE))
+        return PersistentExpenseStore(temp_path, sync_every=0, currency_scale=self.currency_scale)
+
+    def commit_compaction(self, compacted: 'PersistentExpenseStore'):
+        """
+        Replace this store's files with those of a compacted copy from empty_copy().
+
+        The copy's files are synced and a commit marker written before any
+        file is moved, so a crash part-way through is finished the next
+        time the store is opened, and a crash before the marker leaves the
+        old files in use. The copy keeps appending to the moved files.
+        """
+        compacted._write_ids()
+        compacted.flush(sync=True)
+        # Saved totals are still valid, but the saved date index refers
+        # to the old row positions
+        for name in (SNAPSHOT_FILE, SEGMENTS_FILE):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+        with open(os.path.join(compacted.path, COMPACTION_MARKER), 'wb') as handle:
+            os.fsync(handle.fileno())
+        self._finish_compaction()
+        compacted.path = self.path
+        compacted.sync_every = self.sync_every
+
+    def discard(self):
+        """Close a compacted copy that will not be committed and delete its files."""
+        import shutil
+
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def detach(self):
+        """
+        Close the files after compaction replaced them.
+
+        The mapped rows stay readable for readers that were still using the
+        store; they are unmapped once the store is garbage collected.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for handle in (self._text_file, self._categories_file, self._log_file):
+            handle.close()
+
+    def flush(self, sync: bool = True):
+        """
+        Write buffered rows to the operating system, and optionally fsync.
+
+        Description and category data are flushed before the log records
+        that refer to them.
+        """
+        files = (self._text_file, self._categories_file, self._log_file)
+        for handle in files:
+            handle.flush()
+            if sync:
+                os.fsync(handle.fileno())
+        if sync:
+            self._unsynced = 0
+
+    def write_snapshot(self, category_cents: List[int], category_counts: List[int],
+                       date_keys: array):
+        """
+        Save the summary totals and date index covering every current row.
+
+        The snapshot is written to a temporary file and renamed into place,
+        so a crash leaves either the old snapshot or the new one.
+        """
+        self.flush(sync=True)
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+        temp_path = snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(self),
+                                               len(category_cents), len(date_keys)))
+            handle.write(array('q', category_cents).tobytes())
+            handle.write(array('q', category_counts).tobytes())
+            date_keys.tofile(handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, snapshot_path)
+
+    def read_snapshot(self) -> Optional[Dict]:
+        """
+        Read the summary totals from the latest snapshot.
+
+        Returns:
+            Optional[Dict]: 'rows', 'category_cents' and 'category_counts', or
+            None if there is no usable snapshot for the current log
+        """
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+        if not os.path.exists(snapshot_path):
+            return None
+        with open(snapshot_path, 'rb') as handle:
+            header = handle.read(_SNAPSHOT_HEADER.size)
+            if len(header) < _SNAPSHOT_HEADER.size:
+                return None
+            magic, version, rows, categories, _ = _SNAPSHOT_HEADER.unpack(header)
+            if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION or rows > len(self):
+                return None
+            category_cents = array('q')
+            category_counts = array('q')
+            category_cents.fromfile(handle, categories)
+            category_counts.fromfile(handle, categories)
+        return {'rows': rows, 'category_cents': category_cents.tolist(),
+                'category_counts': category_counts.tolist()}
+
+    def write_segments(self, rows: int, day_totals: Dict[int, Dict[int, List[int]]]):
+        """
+        Save per-day, per-category totals covering the first rows expenses.
+
+        Together with the log, these let a reopened tracker rebuild its
+        rollup tables without reading every row. The file is written to a
+        temporary name and renamed into place.
+        """
+        import zlib
+
+        entries = array('q')
+        for ordinal in sorted(day_totals):
+            for code, (cents, count) in day_totals[ordinal].items():
+                if count:
+                    entries.extend((ordinal, code, cents, count))
+        segments_path = os.path.join(self.path, SEGMENTS_FILE)
+        temp_path = segments_path + '.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(_SEGMENTS_HEADER.pack(_SEGMENTS_MAGIC, _SEGMENTS_VERSION, rows, len(entries) // 4))
+            handle.write(zlib.compress(entries.tobytes(), 6))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, segments_path)
+
+    def read_segments(self) -> Optional[Tuple[int, array]]:
+        """
+        Load the saved per-day totals, if there are any for the current log.
+
+        Rows are only ever appended, so totals saved for an earlier prefix
+        of the log stay valid; the caller replays the rows after it.
+
+        Returns:
+            Optional[Tuple[int, array]]: Rows covered and the flat
+            (ordinal, code, cents, rows) entries, or None
+        """
+        import zlib
+
+        segments_path = os.path.join(self.path, SEGMENTS_FILE)
+        if not os.path.exists(segments_path):
+            return None
+        with open(segments_path, 'rb') as handle:
+            header = handle.read(_SEGMENTS_HEADER.size)
+            if len(header) < _SEGMENTS_HEADER.size:
+                return None
+            magic, version, rows, count = _SEGMENTS_HEADER.unpack(header)
+            if magic != _SEGMENTS_MAGIC or version != _SEGMENTS_VERSION or rows > len(self):
+                return None
+            try:
+                entries = array('q', zlib.decompress(handle.read()))
+            except (zlib.error, ValueError):
+                return None
+        if len(entries) != 4 * count:
+            return None
+        return rows, entries
+
+    def read_snapshot_index(self):
+        """
+        Load the sorted date index saved in the latest snapshot.
+
+        Returns:
+            array: Sorted date index keys
+        """
+        with open(os.path.join(self.path, SNAPSHOT_FILE), 'rb') as handle:
+            _, _, _, categories, length = _SNAPSHOT_HEADER.unpack(handle.read(_SNAPSHOT_HEADER.size))
+            handle.seek(2 * categories * array('q').itemsize, os.SEEK_CUR)
+            date_keys = array('q')
+            date_keys.fromfile(handle, length)
+        return date_keys
+
+    def close(self):
+        """Sync all pending writes and release the memory-mapped files."""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush(sync=True)
+        for handle in (self._text_file, self._categories_file, self._log_file):
+            handle.close()
+        for view in reversed(self._views):
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._views.clear()
+        self._maps.clear()
+
+# ===================================================================
+# SECONDARY INDEXES
+# ===================================================================
+
+def _category_key(category: str, normalization: Optional[str] = None) -> str:
+    """
+    Return the lookup key for a category name.
+
+    Keys are casefolded, so 'Food', 'FOOD' and 'food' share one key, and can
+    optionally be put into a Unicode normal form first (e.g. 'NFKC'), so
+    differently composed spellings of the same name also match.
+    """
+    if normalization:
+        import unicodedata
+        category = unicodedata.normalize(normalization, category)
+    return category.casefold()
+
+@lru_cache(maxsize=None)
+def _token_pattern():
+    """Runs of letters and digits; descriptions and searches are split the same way."""
+    import re
+    return re.compile(r"[^\W_]+")
+
+def _tokenize(text: str) -> List[str]:
+    """Split text into casefolded search terms."""
+    return _token_pattern().findall(text.casefold())
+
+class _TextIndex:
+    """
+    Inverted index from description terms to the rows that contain them.
+
+    Each term maps to an array of row positions in ascending order, so a
+    row can be checked against a term with one binary search. The number of
+    terms in each description is kept for length normalization when
+    ranking, and a sorted vocabulary answers prefix queries.
+    """
+
+    __slots__ = ('postings', 'lengths', 'total_terms', '_vocabulary', '_new_terms', '_lock')
+
+    def __init__(self, lock=None):
+        self.postings: Dict[str, array] = {}
+        # Terms per description, capped at 255
+        self.lengths = array('B')
+        self.total_terms = 0
+        self._vocabulary: List[str] = []
+        self._new_terms: List[str] = []
+        self._lock = lock if lock is not None else nullcontext()
+
+    def add(self, first_row: int, descriptions: Iterable[str]):
+        """Index the descriptions of consecutive rows starting at first_row."""
+        postings = self.postings
+        lengths = self.lengths
+        for row, description in enumerate(descriptions, first_row):
+            terms = _tokenize(description)
+            lengths.append(min(len(terms), 255))
+            self.total_terms += len(terms)
+            for term in dict.fromkeys(terms):
+                rows = postings.get(term)
+                if rows is None:
+                    postings[term] = array('I', [row])
+                    self._new_terms.append(term)
+                    continue
+                try:
+                    rows.append(row)
+                except OverflowError:
+                    # Widen once row positions outgrow 32 bits
+                    postings[term] = rows = array('q', rows)
+                    rows.append(row)
+
+    def expand(self, term: str, prefix: bool) -> List[str]:
+        """Return the indexed terms matching a term, or every term it prefixes."""
+        if not prefix:
+            return [term] if term in self.postings else []
+        if self._new_terms:
+            with self._lock:
+                if self._new_terms:
+                    self._vocabulary = sorted(chain(self._vocabulary, self._new_terms))
+                    self._new_terms = []
+        vocabulary = self._vocabulary
+        return vocabulary[bisect_left(vocabulary, term):bisect_left(vocabulary, term + '\U0010ffff')]
+
+class _DateKeyIndex:
+    """
+    Sorted index of (ordinal << _ROW_BITS | row) keys.
+
+    Expenses usually arrive in date order, so adding keys is normally a
+    plain append. Out-of-order keys are collected in a pending run and merged
+    in by the next query, so a burst of them costs one linear merge rather
+    than one array shift per row. Rows that share a date stay in insertion
+    order.
+
+    The sorted array only ever grows at the end or is replaced by a merged
+    copy, so one thread can search it while another appends. Merging the
+    pending keys takes the lock shared with the writer.
+    """
+
+    __slots__ = ('_keys', '_pending', '_lock')
+
+    def __init__(self, keys: Optional[array] = None, lock=None):
+        self._keys = keys if keys is not None else array('q')
+        self._pending = array('q')
+        self._lock = lock if lock is not None else nullcontext()
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._pending)
+
+    def extend(self, new_keys: List[int]):
+        """Add keys in O(1) each."""
+        keys = self._keys
+        last = keys[-1] if keys else -1
+        if new_keys and new_keys[0] > last and all(map(lt, new_keys, islice(new_keys, 1, None))):
+            keys.extend(new_keys)
+            return
+        pending = self._pending
+        for key in new_keys:
+            if key > last:
+                keys.append(key)
+                last = key
+            else:
+                pending.append(key)
+
+    def keys(self) -> array:
+        """Return every key in sorted order, merging pending keys first."""
+        if self._pending:
+            with self._lock:
+                if self._pending:
+                    # The index and the sorted pending keys form two sorted
+                    # runs, which sorted() merges in a single linear pass
+                    self._keys = array('q', sorted(chain(self._keys, self._pending)))
+                    self._pending = array('q')
+        return self._keys
+
+    def search(self, start: Optional[int], end: Optional[int]) -> Tuple[array, int, int]:
+        """
+        Return the sorted keys with the [lo, hi) positions of those dated within [start, end].
+
+        A concurrent merge may replace the sorted array, so the positions
+        are only valid in the array returned alongside them.
+        """
+        keys = self.keys()
+        lo = bisect_left(keys, start << _ROW_BITS) if start is not None else 0
+        hi = bisect_left(keys, (end + 1) << _ROW_BITS) if end is not None else len(keys)
+        return keys, lo, hi
+
+    def span(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        """Return the [lo, hi) positions of the keys dated within [start, end]."""
+        _, lo, hi = self.search(start, end)
+        return lo, hi
+
+    def rows_between(self, start: Optional[int], end: Optional[int],
+                     visible_rows: Optional[int] = None) -> List[int]:
+        """
+        Return the row positions whose date falls within [start, end].
+
+        Two binary searches locate the matching slice, so the cost is
+        O(log n + k) for k matching rows. The positions are returned in
+        insertion order. With visible_rows, rows at or after that position
+        (added after a reader's snapshot) are left out.
+        """
+        keys, lo, hi = self.search(start, end)
+        rows = [key & _ROW_MASK for key in keys[lo:hi]]
+        if visible_rows is not None:
+            rows = [row for row in rows if row < visible_rows]
+        # Already-ordered input makes this sort a single linear pass
+        return sorted(rows)
+
+def _normalized_text(text: str) -> str:
+    """Casefold a description and collapse its whitespace, for duplicate checks."""
+    return ' '.join(text.casefold().split())
+
+class _ContentIndex:
+    """
+    Hash index from expense contents to the rows that hold them.
+
+    An open-addressing table with linear probing in two typed arrays: the
+    64-bit content hash, and the row position plus one, with 0 marking an
+    empty slot. The contents themselves are not stored; rows whose hash
+    matches are compared in full by the caller, so a hash collision never
+    merges two different expenses. Row positions take 4 bytes until they
+    outgrow 32 bits.
+
+    The table is sized for the expected number of rows and doubles when
+    three quarters full, so it takes 16 to 32 bytes per row, a fraction of
+    a Python set of the same hashes. Rows that stop being live stay in the
+    table until compaction rebuilds it.
+    """
+
+    __slots__ = ('_hashes', '_rows', '_used')
+
+    def __init__(self, rows: int = 0):
+        capacity = 1 << max(10, (rows * 4 // 3).bit_length())
+        self._hashes = array('q', bytes(8 * capacity))
+        self._rows = array('I', bytes(4 * capacity))
+        self._used = 0
+
+    def __len__(self) -> int:
+        return self._used
+
+    def rows(self, hashed: int) -> Iterator[int]:
+        """Yield the rows added under a content hash."""
+        hashes = self._hashes
+        rows = self._rows
+        mask = len(rows) - 1
+        position = hashed & mask
+        while True:
+            entry = rows[position]
+            if not entry:
+                return
+            if hashes[position] == hashed:
+                yield entry - 1
+            position = (position + 1) & mask
+
+    def add(self, hashed: int, row: int):
+        """Add a row under the hash of its contents, in O(1) expected time."""
+        if (self._used + 1) * 4 > len(self._rows) * 3:
+            self._grow()
+        self._place(hashed, row + 1)
+        self._used += 1
+
+    def extend(self, first_row: int, hashes: List[int]):
+        """Add consecutive rows starting at first_row under their content hashes."""
+        while (self._used + len(hashes)) * 4 > len(self._rows) * 3:
+            self._grow()
+        place = self._place
+        for entry, hashed in enumerate(hashes, first_row + 1):
+            place(hashed, entry)
+        self._used += len(hashes)
+
+    def _place(self, hashed: int, entry: int):
+        rows = self._rows
+        mask = len(rows) - 1
+        position = hashed & mask
+        while rows[position]:
+            position = (position + 1) & mask
+        self._hashes[position] = hashed
+        try:
+            rows[position] = entry
+        except OverflowError:
+            # Widen once row positions outgrow 32 bits
+            self._rows = rows = array('q', rows)
+            rows[position] = entry
+
+    def _grow(self):
+        old_hashes, old_rows = self._hashes, self._rows
+        hashes = array('q', bytes(16 * len(old_hashes)))
+        rows = array(old_rows.typecode, bytes(2 * old_rows.itemsize * len(old_rows)))
+        mask = len(rows) - 1
+        for hashed, entry in zip(old_hashes, old_rows):
+            if entry:
+                position = hashed & mask
+                while rows[position]:
+                    position = (position + 1) & mask
+                hashes[position] = hashed
+                rows[position] = entry
+        self._hashes, self._rows = hashes, rows
+
+# ===================================================================
+# INSTRUMENTATION
+# ===================================================================
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tracker methods timed when metrics are enabled
+INSTRUMENTED_OPERATIONS = ('add_expense', 'add_expenses_bulk', 'update_expense', 'delete_expense',
+                           'get_expenses', 'get_summary', 'summarize', 'get_rollup', 'search',
+                           'import_expenses', 'export_expenses', 'checkpoint', 'compact',
+                           'find_duplicates')
+
+class _ActiveOperation(threading.local):
+    """Statistics of the instrumented call running on each thread, if any."""
+
+    # A class default keeps the lookup cheap when nothing is instrumented
+    stats = None
+
+_active_operation = _ActiveOperation()
+
+class _OperationStats:
+    """Counters and latency histogram for one tracker operation."""
+
+    __slots__ = ('calls', 'errors', 'seconds', 'max_seconds', 'rows_scanned',
+                 'rows_returned', 'date_parses', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows_scanned = 0
+        self.rows_returned = 0
+        self.date_parses = 0
+        # One count per bucket plus one for slower calls
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def as_dict(self) -> Dict:
+        """Return the counters with cumulative histogram bucket counts."""
+        cumulative = list(accumulate(self.buckets))
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'max_seconds': self.max_seconds,
+            'rows_scanned': self.rows_scanned,
+            'rows_returned': self.rows_returned,
+            'date_parses': self.date_parses,
+            'latency_buckets': dict(zip(LATENCY_BUCKETS + (math.inf,), cumulative)),
+        }
+
+class _Metrics:
+    """
+    Per-operation call counts, latencies and row counts for one tracker.
+
+    Instrumentation is installed by shadowing the tracker's public methods
+    with timing wrappers on the instance, so a tracker created without
+    metrics runs its methods unwrapped and pays nothing. Counters that are
+    only known deep inside an operation (rows scanned, strptime() calls)
+    go to the statistics of the innermost timed call on the same thread.
+    """
+
+    def __init__(self):
+        self.operations: Dict[str, _OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, name: str, method):
+        """Return a wrapper around a bound method that records each call."""
+        stats = self.operations[name] = _OperationStats()
+        lock = self._lock
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            outer = _active_operation.stats
+            # Collect into a private record, so concurrent calls on other
+            # threads never update the shared counters without the lock
+            call = _OperationStats()
+            _active_operation.stats = call
+            started = clock()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                call.errors = 1
+                raise
+            else:
+                if isinstance(result, list):
+                    call.rows_returned = len(result)
+                return result
+            finally:
+                elapsed = clock() - started
+                _active_operation.stats = outer
+                with lock:
+                    stats.calls += 1
+                    stats.errors += call.errors
+                    stats.seconds += elapsed
+                    stats.max_seconds = max(stats.max_seconds, elapsed)
+                    stats.rows_scanned += call.rows_scanned
+                    stats.rows_returned += call.rows_returned
+                    stats.date_parses += call.date_parses
+                    stats.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+        timed.__name__ = name
+        timed.__doc__ = method.__doc__
+        return timed
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Return every operation's counters, skipping operations never called."""
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self.operations.items() if stats.calls}
+
+def _count_scanned(rows: int):
+    """Add rows visited by a query to the innermost timed call, if any."""
+    operation = _active_operation.stats
+    if operation is not None:
+        operation.rows_scanned += rows
+
+def _format_prometheus(operations: Dict[str, Dict]) -> str:
+    """Render a metrics snapshot in the Prometheus text exposition format."""
+    counters = (('calls', 'calls_total', 'Calls per tracker operation.'),
+                ('errors', 'errors_total', 'Calls that raised an exception.'),
+                ('rows_scanned', 'rows_scanned_total', 'Index entries or rows visited.'),
+                ('rows_returned', 'rows_returned_total', 'Expenses returned in result lists.'),
+                ('date_parses', 'date_parses_total', 'Dates that needed the strptime() fallback.'))
+    lines = []
+    for field, metric, description in counters:
+        lines.append(f"# HELP expense_tracker_{metric} {description}")
+        lines.append(f"# TYPE expense_tracker_{metric} counter")
+        for name, stats in operations.items():
+            lines.append(f'expense_tracker_{metric}{{operation="{name}"}} {stats[field]}')
+    lines.append("# HELP expense_tracker_latency_seconds Tracker operation latency.")
+    lines.append("# TYPE expense_tracker_latency_seconds histogram")
+    for name, stats in operations.items():
+        for bound, calls in stats['latency_buckets'].items():
+            label = '+Inf' if bound == math.inf else repr(bound)
+            lines.append(f'expense_tracker_latency_seconds_bucket{{operation="{name}",le="{label}"}} {calls}')
+        lines.append(f'expense_tracker_latency_seconds_sum{{operation="{name}"}} {stats["seconds"]!r}')
+        lines.append(f'expense_tracker_latency_seconds_count{{operation="{name}"}} {stats["calls"]}')
+    return "\n".join(lines) + "\n"
+
+# ===================================================================
+# RESULT CACHE
+# ===================================================================
+
+# Estimated bytes held by a cache entry apart from its result
+_CACHE_ENTRY_OVERHEAD = 200
+
+class _ResultCache:
+    """
+    Least-recently-used cache of filtered query results.
+
+    Each entry remembers the date range and category codes its filter
+    covers, so a write only evicts the entries whose results it could
+    change: those covering a category it wrote to, within the span of
+    dates it wrote for that category. Memory is bounded by an estimate of the bytes each result
+    holds; the least recently used entries are dropped to stay within it.
+
+    Every invalidation bumps a generation counter. A result computed while
+    a write was being applied is not stored, since it may already be stale.
+    """
+
+    __slots__ = ('budget', 'size', 'generation', 'hits', 'misses', 'evictions',
+                 'invalidations', '_entries', '_lock')
+
+    def __init__(self, budget: int, thread_safe: bool = False):
+        self.budget = budget
+        self.size = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # key -> (result, size, first ordinal, last ordinal, category codes)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock() if thread_safe else nullcontext()
+
+    def get(self, key):
+        """Return the cached result for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, size: int, generation: int, start: int, end: int,
+            codes: Optional[frozenset]):
+        """
+        Store a result unless a write happened since generation was read.
+
+        Args:
+            key: Normalized filter arguments
+            result: Value to return from later get() calls
+            size (int): Estimated bytes held by the result
+            generation (int): Generation read before computing the result
+            start (int): First day ordinal the filter covers
+            end (int): Last day ordinal the filter covers
+            codes (Optional[frozenset]): Category codes the filter covers,
+                or None for every category
+        """
+        size += _CACHE_ENTRY_OVERHEAD
+        if size > self.budget:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (result, size, start, end, codes)
+            self.size += size
+            while self.size > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[1]
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, as when the rows they refer to have moved."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.size = 0
+            self.generation += 1
+
+    def invalidate(self, spans: Dict[int, Tuple[int, int]], keys: Iterable[str] = ()):
+        """
+        Drop the entries a write of new rows could change.
+
+        Args:
+            spans (Dict[int, Tuple[int, int]]): Earliest and latest day
+                ordinal written for each category code
+            keys (Iterable[str]): Normalized keys of categories created by
+                the write, which filters cached before it could not match
+        """
+        keys = set(keys)
+
+        def is_stale(key, start, end, codes):
+            if key[-1] in keys:
+                return True
+            return any(first <= end and last >= start for first, last in
+                       (spans.values() if codes is None else
+                        (spans[code] for code in codes if code in spans)))
+
+        with self._lock:
+            self.generation += 1
+            stale = [key for key, (_, _, start, end, codes) in self._entries.items()
+                     if is_stale(key, start, end, codes)]
+            for key in stale:
+                self.size -= self._entries.pop(key)[1]
+            self.invalidations += len(stale)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss, eviction and invalidation counts and memory use."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self._entries),
+                    'bytes': self.size, 'budget': self.budget}
+
+# ===================================================================
+# STREAMING SKETCHES
+# ===================================================================
+
+# Largest expenses kept per category for top_expenses()
+TOP_EXPENSES_KEPT = 100
+
+def _hash64(text: str) -> int:
+    """Return a 64-bit hash of a string that is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'big')
+
+class TopN:
+    """
+    The n largest values seen in a stream, with the row each came from.
+
+    A min-heap of n entries holds the current top values, so each new
+    value costs one comparison with the smallest of them and, only when it
+    is larger, an O(log n) heap replacement. Equal values keep the most
+    recent row.
+    """
+
+    __slots__ = ('n', 'heap')
+
+    def __init__(self, n: int = TOP_EXPENSES_KEPT):
+        self.n = n
+        self.heap: List[Tuple[int, int]] = []
+
+    def add(self, value: int, row: int):
+        """Offer one value; it is kept if it is among the n largest so far."""
+        heap = self.heap
+        if len(heap) < self.n:
+            heapq.heappush(heap, (value, row))
+        elif value >= heap[0][0]:
+            heapq.heapreplace(heap, (value, row))
+
+    def extend(self, pairs: Iterable[Tuple[int, int]]):
+        """Offer many (value, row) pairs."""
+        for value, row in heapq.nlargest(self.n, pairs):
+            if len(self.heap) == self.n and value < self.heap[0][0]:
+                # Pairs arrive largest first, so no later one can qualify
+                break
+            self.add(value, row)
+
+    def merge(self, other: 'TopN'):
+        """Combine another TopN, e.g. from a different partition, into this one."""
+        self.extend(other.heap)
+
+    def largest(self, n: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Return up to n (value, row) pairs, largest first."""
+        return heapq.nlargest(self.n if n is None else n, self.heap)
+
+class KLLSketch:
+    """
+    Quantile sketch with bounded memory (Karnin, Lang and Liberty, 2016).
+
+    Values enter level 0. When a level fills up it is sorted and every
+    other value, starting at a random offset, is promoted to the next
+    level with twice the weight; the rest are dropped. Lower levels get
+    geometrically smaller capacities, so the sketch holds O(k) values
+    however many are added, and a quantile's rank error is about 1.7 / k
+    of the count with high probability. Sketches with the same k merge by
+    concatenating levels and compacting again.
+    """
+
+    __slots__ = ('k', 'count', 'levels', '_size', '_capacity', '_level_capacities', '_random')
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.levels: List[List[int]] = []
+        self._size = 0
+        self._capacity = 0
+        self._level_capacities: List[int] = []
+        import random
+        self._random = random.Random(seed)
+        self._grow()
+
+    def _grow(self):
+        """Add a level on top and recompute the level capacities."""
+        self.levels.append([])
+        # The top level holds k values, and each level below two thirds as
+        # many, down to a minimum of 8
+        height = len(self.levels)
+        self._level_capacities = [max(int(math.ceil(self.k * (2 / 3) ** (height - level - 1))), 8)
+                                  for level in range(height)]
+        self._capacity = sum(self._level_capacities)
+
+    def add(self, value: int):
+        """Add one value in amortized O(log k) time."""
+        self.levels[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._capacity:
+            self._compress()
+
+    def extend(self, values: Iterable[int]):
+        """Add many values, appending as many at once as level 0 has room for."""
+        values = list(values)
+        position = 0
+        while position < len(values):
+            chunk = values[position:position + self._capacity - self._size]
+            self.levels[0].extend(chunk)
+            self.count += len(chunk)
+            self._size += len(chunk)
+            position += len(chunk)
+            if self._size >= self._capacity:
+                self._compress()
+
+    def _compress(self):
+        """Compact full levels, lowest first, until the sketch fits its capacity."""
+        for level in range(len(self.levels)):
+            values = self.levels[level]
+            if len(values) < self._level_capacities[level]:
+                continue
+            if level + 1 == len(self.levels):
+                self._grow()
+            values.sort()
+            # An odd value out stays behind at this level
+            kept = [values.pop()] if len(values) % 2 else []
+            promoted = values[self._random.getrandbits(1)::2]
+            self.levels[level + 1].extend(promoted)
+            self.levels[level] = kept
+            self._size -= len(values) - len(promoted)
+            if self._size < self._capacity:
+                return
+
+    def merge(self, other: 'KLLSketch'):
+        """Combine another sketch with the same k into this one."""
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, values in enumerate(other.levels):
+            self.levels[level].extend(values)
+        self.count += other.count
+        self._size = sum(map(len, self.levels))
+        while self._size >= self._capacity:
+            self._compress()
+
+    def quantiles(self, fractions: Iterable[float]) -> List[Optional[int]]:
+        """
+        Return the approximate value at each fraction (0 to 1) of the ranks.
+
+        Returns:
+            List[Optional[int]]: One value per fraction, or None for each
+            if the sketch is empty
+        """
+        weighted = sorted((value, 1 << level) for level, values in enumerate(self.levels)
+                          for value in values)
+        total = sum(weight for _, weight in weighted)
+        if not total:
+            return [None for _ in fractions]
+        cumulative = list(accumulate(weight for _, weight in weighted))
+        return [weighted[min(bisect_left(cumulative, fraction * total), len(weighted) - 1)][0]
+                for fraction in fractions]
+
+class HyperLogLog:
+    """
+    Distinct-value counter with fixed memory (Flajolet et al., 2007).
+
+    Each value's 64-bit hash picks one of 2**precision registers with its
+    leading bits, and the register keeps the longest run of leading zeros
+    seen in the remaining bits. The harmonic mean of the registers then
+    estimates the number of distinct values with a standard error of about
+    1.04 / sqrt(2**precision), 1.6% at the default precision, using one
+    byte per register. Sketches with the same precision merge by taking
+    register maxima.
+    """
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str):
+        """Add one string."""
+        self.add_hashes([_hash64(value)])
+
+    def add_hashes(self, hashes: Iterable[int]):
+        """Add values by their _hash64() hashes."""
+        registers = self.registers
+        bits = 64 - self.precision
+        mask = (1 << bits) - 1
+        for hashed in hashes:
+            register = hashed >> bits
+            rank = bits - (hashed & mask).bit_length() + 1
+            if rank > registers[register]:
+                registers[register] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        """Combine another sketch with the same precision into this one."""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Return the estimated number of distinct values added."""
+        registers = self.registers
+        size = len(registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / math.fsum(2.0 ** -rank for rank in registers)
+        empty = registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            # Small cardinalities: count the empty registers instead
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+class _Sketches:
+    """Top amounts, amount quantiles and distinct descriptions for one group of rows."""
+
+    __slots__ = ('top', 'amounts', 'descriptions')
+
+    def __init__(self):
+        self.top = TopN()
+        self.amounts = KLLSketch()
+        self.descriptions = HyperLogLog()
+
+    def merge(self, other: '_Sketches'):
+        self.top.merge(other.top)
+        self.amounts.merge(other.amounts)
+        self.descriptions.merge(other.descriptions)
+
+# ===================================================================
+# BUDGET RULES
+# ===================================================================
+
+class _BudgetRule:
+    """One spending limit on a category (or on everything) per period."""
+
+    __slots__ = ('id', 'category', 'level', 'limit', 'callback')
+
+    def __init__(self, rule_id: int, category: Optional[str], level: int, limit: int, callback):
+        self.id = rule_id
+        self.category = category
+        self.level = level
+        self.limit = limit
+        self.callback = callback
+
+class _BudgetRules:
+    """
+    Budget rules indexed for checking on every write.
+
+    Rules are grouped by (category key, rollup level), with None as the key
+    of rules on every category. Each group keeps its limits sorted, so the
+    rules a total crossed are found with two binary searches however many
+    rules share the group.
+    """
+
+    __slots__ = ('groups', 'levels', 'rules', 'ids')
+
+    def __init__(self):
+        # (category key, level) -> (sorted limits, rules in the same order)
+        self.groups: Dict[Tuple[Optional[str], int], Tuple[List[int], List[_BudgetRule]]] = {}
+        # Category key -> levels that have rules for it
+        self.levels: Dict[Optional[str], List[int]] = {}
+        self.rules: Dict[int, Tuple[Optional[str], _BudgetRule]] = {}
+        self.ids = count(1)
+
+    def add(self, key: Optional[str], rule: _BudgetRule):
+        limits, rules = self.groups.setdefault((key, rule.level), ([], []))
+        position = bisect_right(limits, rule.limit)
+        limits.insert(position, rule.limit)
+        rules.insert(position, rule)
+        levels = self.levels.setdefault(key, [])
+        if rule.level not in levels:
+            levels.append(rule.level)
+        self.rules[rule.id] = (key, rule)
+
+    def remove(self, rule_id: int) -> bool:
+        entry = self.rules.pop(rule_id, None)
+        if entry is None:
+            return False
+        key, rule = entry
+        limits, rules = self.groups[key, rule.level]
+        position = rules.index(rule, bisect_left(limits, rule.limit))
+        del limits[position], rules[position]
+        if not rules:
+            del self.groups[key, rule.level]
+            self.levels[key].remove(rule.level)
+            if not self.levels[key]:
+                del self.levels[key]
+        return True
+
+    def crossed(self, key: Optional[str], level: int, before: int, after: int) -> List[_BudgetRule]:
+        """Return the rules of a group whose limit a total rising from before to after went over."""
+        limits, rules = self.groups[key, level]
+        return rules[bisect_left(limits, before):bisect_left(limits, after)]
+
+# ===================================================================
+# MAIN EXPENSE TRACKER CLASS
+# ===================================================================
+
+# Idempotency keys remembered by add_expense(); the oldest are forgotten first
+IDEMPOTENCY_KEYS_KEPT = 100_000
+
+class ExpenseTracker:
+    """
+    Main class for managing expense data and operations.
+
+    Demonstrates:
+    - Object-oriented programming in Python
+    - Type hints for class attributes and methods
+    - Instance variable initialization
+    - Method organization and encapsulation
+
+    Attributes:
+        expenses (ExpenseStore): Columnar store holding all expense records
+    """
+
+    def __init__(self, path: Optional[str] = None, sync_every: int = 1,
+                 snapshot_every: int = 1_000_000,
+                 category_normalization: Optional[str] = None,
+                 currency_scale: Optional[int] = None,
+                 thread_safe: bool = False,
+                 text_index: bool = False,
+                 result_cache_bytes: int = 0,
+                 metrics: bool = False,
+                 deduplicate: bool = False):
+        """
+        Initialize the ExpenseTracker with an empty or saved expense store.
+
+        Args:
+            path (Optional[str]): Directory of a persistent store to open or
+                create; None keeps expenses in memory only
+            sync_every (int): Rows written between fsyncs of a persistent store
+            snapshot_every (int): Rows written between automatic snapshots
+            category_normalization (Optional[str]): Unicode normal form
+                ('NFC', 'NFKC', ...) applied before casefolding category
+                names for case-insensitive matching
+            currency_scale (Optional[int]): Decimal places kept for amounts
+                (default 2); a persistent store records its scale when created
+            thread_safe (bool): Allow threads to add and query concurrently;
+                see _optimistic_read() for how readers avoid locking
+            text_index (bool): Build the description search index now
+                instead of on the first search()
+            result_cache_bytes (int): Memory budget for caching filtered
+                get_expenses() and summarize() results; 0 disables the cache
+            metrics (bool): Record call counts, latencies and rows scanned
+                per operation; see get_metrics()
+            deduplicate (bool): Skip added expenses whose date, amount,
+                category and description match a stored expense; see
+                add_expenses_bulk()
+
+        Raises:
+            ValueError: If currency_scale is unsupported or differs from the
+                scale of an existing persistent store
+
+        Demonstrates:
+        - Constructor method in Python
+        - Default parameter values
+        - Type-hinted instance variable
+        """
+        if path is None:
+            self.expenses = ExpenseStore(DEFAULT_CURRENCY_SCALE if currency_scale is None else currency_scale)
+        else:
+            self.expenses = PersistentExpenseStore(path, sync_every=sync_every,
+                                                   currency_scale=currency_scale)
+        self.snapshot_every = snapshot_every
+
+        # Concurrency control. Writers hold the lock and bump the version
+        # before and after each change, so it is odd while a write is in
+        # progress. Rows below _visible_rows are fully written and indexed;
+        # readers work on that prefix without taking the lock.
+        self.thread_safe = thread_safe
+        self._lock = threading.RLock() if thread_safe else nullcontext()
+        self._version = 0
+        # Compaction switches self.expenses and the indexes together. It
+        # bumps this counter before and after, so readers can tell that row
+        # positions they found may belong to the other store.
+        self._store_generation = 0
+        self._compacting = False
+
+        # Sorted date index over every row. A reopened store loads it lazily
+        # on the first date-range query.
+        # Demonstrates compact typed arrays searched with the bisect module
+        self._date_keys: Optional[_DateKeyIndex] = _DateKeyIndex(lock=self._lock)
+
+        # Category index: normalized category key -> category codes, and one
+        # date index per category code, so category filters (with or without
+        # a date range) only touch matching rows. A reopened store builds the
+        # per-category indexes on first use.
+        self.category_normalization = category_normalization
+        self._codes_by_category_key: Dict[str, List[int]] = {}
+        self._category_keys: List[str] = []
+        self._register_categories(0)
+        self._category_date_keys: Optional[List[_DateKeyIndex]] = []
+
+        # Length of the longest description, for sizing printed tables.
+        # A reopened store measures it on first use.
+        self._description_width: Optional[int] = 0
+
+        # Inverted index over descriptions for search(). Built on the first
+        # search unless requested up front, then kept current on every write.
+        self._text_index: Optional[_TextIndex] = None
+
+        # Content hash index for skipping duplicate expenses. Built on the
+        # first write with deduplication on, then kept current on every write.
+        self.deduplicate = deduplicate
+        self._content_index: Optional[_ContentIndex] = None
+        # Expense IDs of the most recent add_expense() idempotency keys
+        self._idempotency_keys: OrderedDict = OrderedDict()
+
+        # Cached results of filtered queries, evicted by writes to the dates
+        # and categories they cover
+        self._result_cache = _ResultCache(result_cache_bytes, thread_safe) if result_cache_bytes > 0 else None
+
+        # Running totals indexed by category code, kept current on every write
+        # so get_summary() never has to scan the store
+        self._category_cents: List[int] = []
+        self._category_counts: List[int] = []
+        self._total_cents = 0
+
+        # Rollup tables: one {bucket key: {category code: [cents, count]}}
+        # dictionary per granularity, kept current on every write. A reopened
+        # store builds them on the first get_rollup() call.
+        self._rollups: Optional[List[Dict[int, Dict[int, List[int]]]]] = [{} for _ in ROLLUP_GRANULARITIES]
+        self._bucket_cache: Dict[int, Tuple[int, int, int, int]] = {}
+
+        # Streaming sketches (top amounts, amount quantiles, distinct
+        # descriptions) per category code plus one over every row. Built on
+        # the first analytics call, then kept current on every write.
+        self._sketches: Optional[List[_Sketches]] = None
+        self._overall_sketches: Optional[_Sketches] = None
+
+        # Budget rules checked on every write, and alerts of rules without
+        # a callback waiting for get_budget_alerts()
+        self._budgets: Optional[_BudgetRules] = None
+        self._budget_alerts: deque = deque()
+
+        # Worker processes for parallel scans, started on first use
+        self._pool = None
+        self._pool_workers = 0
+
+        # Rows covered by the latest snapshot of a persistent store
+        self._snapshot_rows = 0
+        if len(self.expenses):
+            self._restore_state()
+        self._visible_rows = len(self.expenses)
+        if text_index:
+            self._search_index()
+
+        # Timing wrappers shadow the public methods only when metrics are on
+        self._metrics: Optional[_Metrics] = None
+        if metrics:
+            self._metrics = _Metrics()
+            for name in INSTRUMENTED_OPERATIONS:
+                setattr(self, name, self._metrics.instrument(name, getattr(self, name)))
+
+    def _restore_state(self):
+        """
+        Rebuild the running totals for a reopened persistent store.
+
+        Totals come from the latest snapshot, and only rows written after it
+        are replayed. The date index is left to be loaded on first use.
+        """
+        store = self.expenses
+        snapshot = store.read_snapshot()
+        if snapshot:
+            self._category_cents = snapshot['category_cents']
+            self._category_counts = snapshot['category_counts']
+            self._total_cents = sum(self._category_cents)
+            self._snapshot_rows = snapshot['rows']
+        for entries, sign in self._signed_entries(self._snapshot_rows):
+            for _, code, cents in entries:
+                self._adjust_totals(code, sign * cents, sign)
+        self._date_keys = None
+        self._category_date_keys = None
+        self._description_width = None
+        self._rollups = None
+
+    def _signed_entries(self, first_row: int) -> List[Tuple[Iterable[Tuple[int, int, int]], int]]:
+        """
+        Return the (ordinal, category code, cents) entries of rows from first_row onwards.
+
+        Tombstone rows take back the expense they retire, so the entries
+        come in two groups: those to add (+1) and those to subtract (-1).
+        """
+        store = self.expenses
+        entries = zip(store.dates[first_row:], store.category_codes[first_row:], store.amounts[first_row:])
+        tombstones = store.tombstones
+        removed = [row for row in tombstones if row >= first_row]
+        if not removed:
+            return [(entries, 1)]
+        return [((entry for row, entry in enumerate(entries, first_row) if row not in tombstones), 1),
+                ([(store.dates[row], store.category_codes[row], store.amounts[row]) for row in removed], -1)]
+
+    def _date_index(self) -> _DateKeyIndex:
+        """Return the date index, loading or building it if needed."""
+        if self._date_keys is None:
+            with self._lock:
+                if self._date_keys is None:
+                    store = self.expenses
+                    if self._snapshot_rows:
+                        # Start from the snapshot; newer rows join as pending keys
+                        index = _DateKeyIndex(store.read_snapshot_index(), self._lock)
+                        first_row = self._snapshot_rows
+                    else:
+                        index = _DateKeyIndex(lock=self._lock)
+                        first_row = 0
+                    dates = store.dates
+                    index.extend([(dates[row] << _ROW_BITS) | row
+                                  for row in range(first_row, len(store))])
+                    self._date_keys = index
+        return self._date_keys
+
+    def _category_index(self) -> List[_DateKeyIndex]:
+        """Return the per-category date indexes, building them with one scan if needed."""
+        if self._category_date_keys is None:
+            with self._lock:
+                if self._category_date_keys is None:
+                    store = self.expenses
+                    keys_by_code = [[] for _ in store.categories]
+                    for row, ordinal, code in zip(count(), store.dates, store.category_codes):
+                        keys_by_code[code].append((ordinal << _ROW_BITS) | row)
+                    self._category_date_keys = [_DateKeyIndex(array('q', sorted(keys)), self._lock)
+                                                for keys in keys_by_code]
+        return self._category_date_keys
+
+    def _search_index(self) -> _TextIndex:
+        """Return the description index, building it with one scan if needed."""
+        if self._text_index is None:
+            with self._lock:
+                if self._text_index is None:
+                    store = self.expenses
+                    index = _TextIndex(self._lock)
+                    index.add(0, map(store.description, range(len(store))))
+                    self._text_index = index
+        return self._text_index
+
+    def _content_lookup(self) -> _ContentIndex:
+        """Return the content hash index, building it with one scan if needed."""
+        if self._content_index is None:
+            with self._lock:
+                if self._content_index is None:
+                    self._content_index = self._index_contents(self.expenses, 0)
+        return self._content_index
+
+    def _index_contents(self, store: ExpenseStore, first_row: int,
+                        index: Optional[_ContentIndex] = None) -> _ContentIndex:
+        """Add the live rows of a store from first_row onwards to a content index."""
+        if index is None:
+            index = _ContentIndex(len(store) - first_row)
+        for row, content in self._row_contents(store, first_row, len(store)):
+            index.add(hash(content), row)
+        return index
+
+    def _row_contents(self, store: ExpenseStore, first_row: int, end: int) -> Iterator[Tuple[int, Tuple]]:
+        """
+        Yield (row, contents) for the live rows in [first_row, end).
+
+        Contents are what duplicate checks compare: the day ordinal, the
+        amount in minor units, the category key and the description
+        casefolded with its whitespace collapsed.
+        """
+        category_keys = self._category_keys
+        dead = store.dead_rows
+        columns = zip(store.dates[first_row:end], store.amounts[first_row:end],
+                      store.category_codes[first_row:end])
+        for row, (ordinal, cents, code) in enumerate(columns, first_row):
+            if row not in dead:
+                yield row, (ordinal, cents, category_keys[code], _normalized_text(store.description(row)))
+
+    def _content(self, store: ExpenseStore, row: int) -> Tuple:
+        """Return the contents of one row, as compared by duplicate checks."""
+        return (store.dates[row], store.amounts[row], self._category_keys[store.category_codes[row]],
+                _normalized_text(store.description(row)))
+
+    def _stored_copy(self, index: _ContentIndex, store: ExpenseStore, content: Tuple,
+                     hashed: int) -> Optional[int]:
+        """Return a live row holding the given contents (with the given hash), or None."""
+        dead = store.dead_rows
+        for row in index.rows(hashed):
+            if row not in dead and self._content(store, row) == content:
+                return row
+        return None
+
+    def _unique_rows(self, rows: List[Tuple[int, int, str, str]], deduplicate: bool,
+                     idempotency_key: Optional[str]) -> Tuple[List[Tuple], List[int], Optional[List[int]]]:
+        """
+        Split a batch into rows to store and the rows that already hold the rest.
+
+        A known idempotency key matches its expense while that is live.
+        With deduplicate, each row is then looked up in the content index, and rows repeating an earlier row of the batch match the row
+        position it is about to be stored at.
+
+        Returns:
+            Tuple[List[Tuple], List[int], Optional[List[int]]]: Rows to
+            store, the row position matched by each row left out, and the
+            content hashes of the rows to store (None without deduplicate)
+        """
+        store = self.expenses
+        if idempotency_key is not None:
+            expense_id = self._idempotency_keys.get(idempotency_key)
+            row = None if expense_id is None else store.find(expense_id)
+            if row is not None:
+                return [], [row], None
+        if not deduplicate:
+            return rows, [], None
+        index = self._content_lookup()
+        first_row = len(store)
+        unique = []
+        hashes = []
+        matches = []
+        batch_rows: Dict[Tuple, int] = {}
+        category_keys: Dict[str, str] = {}
+        for values in rows:
+            ordinal, cents, category, description = values
+            key = category_keys.get(category)
+            if key is None:
+                key = category_keys[category] = _category_key(category, self.category_normalization)
+            content = (ordinal, cents, key, _normalized_text(description))
+            hashed = hash(content)
+            row = batch_rows.get(content)
+            if row is None:
+                row = self._stored_copy(index, store, content, hashed)
+            if row is None:
+                batch_rows[content] = first_row + len(unique)
+                unique.append(values)
+                hashes.append(hashed)
+            else:
+                matches.append(row)
+        return unique, matches, hashes
+
+    def _register_categories(self, first_code: int):
+        """Add category names from first_code onwards to the category key lookup."""
+        categories = self.expenses.categories
+        for code in range(first_code, len(categories)):
+            key = _category_key(categories[code], self.category_normalization)
+            self._codes_by_category_key.setdefault(key, []).append(code)
+            self._category_keys.append(key)
+
+    def _insert_rows(self, rows: List[Tuple[int, int, str, str]],
+                     replaced_row: Optional[int] = None,
+                     duplicates: Optional[List[int]] = None,
+                     idempotency_key: Optional[str] = None,
+                     deduplicate: bool = False) -> Optional[int]:
+        """
+        Store a batch of validated expenses and update every index.
+
+        This is the single write path; add_expense(), add_expenses_bulk(),
+        update_expense() and delete_expense() all go through it. The batch
+        becomes visible to readers only once every index and total
+        includes it.
+
+        Args:
+            rows (List[Tuple]): (ordinal, cents, category, description) tuples
+            replaced_row (Optional[int]): Live row that the single row in
+                rows replaces, or that is deleted when rows is empty
+            duplicates (Optional[List[int]]): Receives the expense ID
+                matched by each row skipped as a duplicate; needed with
+                idempotency_key or deduplicate
+            idempotency_key (Optional[str]): Key of a single-row batch;
+                the row is skipped if the key was seen before
+            deduplicate (bool): Skip rows matching a stored expense or an
+                earlier row of the batch; see _unique_rows()
+
+        Returns:
+            Optional[int]: Expense ID of the first new expense, or None if
+            no expense was added
+        """
+        with self._lock:
+            matches = ()
+            hashes = None
+            if deduplicate or idempotency_key is not None:
+                rows, matches, hashes = self._unique_rows(rows, deduplicate, idempotency_key)
+                if not rows:
+                    duplicates.extend(map(self.expenses.expense_id, matches))
+                    return None
+            self._version += 1
+            known_rows = len(self.expenses)
+            known_categories = len(self.expenses.categories)
+            try:
+                first_row = self._write_rows(rows, replaced_row, hashes)
+            except BaseException:
+                # Readers must never see rows that the totals and indexes miss
+                self._discard_write(known_rows, known_categories)
+                raise
+            finally:
+                self._visible_rows = len(self.expenses)
+                self._version += 1
+                if self._result_cache is not None:
+                    self._invalidate_results(known_rows, known_categories)
+            alerts = self._check_budgets(known_rows) if self._budgets is not None and rows else ()
+            expense_id = self.expenses.expense_id(first_row) if rows else None
+            if matches:
+                duplicates.extend(map(self.expenses.expense_id, matches))
+            if idempotency_key is not None:
+                keys = self._idempotency_keys
+                keys[idempotency_key] = expense_id
+                keys.move_to_end(idempotency_key)
+                if len(keys) > IDEMPOTENCY_KEYS_KEPT:
+                    keys.popitem(last=False)
+            if (self.expenses.durable and self.snapshot_every
+                    and len(self.expenses) - self._snapshot_rows >= self.snapshot_every):
+                self.checkpoint()
+        # Callbacks run once the write is complete and the lock released,
+        # so they may read from or write to the tracker
+        for rule, alert in alerts:
+            rule.callback(alert)
+        return expense_id
+
+    def _check_budgets(self, first_row: int) -> List[Tuple[_BudgetRule, Dict]]:
+        """
+        Find the budget rules that rows from first_row onwards pushed over their limit.
+
+        The batch is first added up per (category key, level, bucket) that
+        has rules, so each row costs a few dictionary updates whatever the
+        number of rules. Each window's new total is then read from the
+        rollup tables, and its total before the batch is that minus the
+        batch's share; the tombstone of an update counts against it. Alerts
+        of rules without a callback are queued.
+
+        Returns:
+            List[Tuple[_BudgetRule, Dict]]: Rules with a callback, each with
+            the alert to pass to it
+        """
+        budgets = self._budgets
+        rule_levels = budgets.levels
+        category_keys = self._category_keys
+        bucket_cache = self._bucket_cache
+        added: Dict[Tuple[Optional[str], int, int], int] = {}
+        for entries, sign in self._signed_entries(first_row):
+            for ordinal, code, cents in entries:
+                for key in (category_keys[code], None):
+                    levels = rule_levels.get(key)
+                    if levels:
+                        bucket_keys = bucket_cache.get(ordinal) or _bucket_keys(ordinal)
+                        for level in levels:
+                            window = (key, level, bucket_keys[level])
+                            added[window] = added.get(window, 0) + sign * cents
+
+        # A rolled-back write drops the tables, so they may need rebuilding
+        tables = self._rollup_tables()
+        callbacks = []
+        for (key, level, bucket_key), cents in added.items():
+            bucket = tables[level].get(bucket_key, {})
+            if key is None:
+                total = sum(totals[0] for totals in bucket.values())
+            else:
+                total = sum(bucket[code][0] for code in self._codes_by_category_key[key] if code in bucket)
+            for rule in budgets.crossed(key, level, total - cents, total):
+                alert = {'rule': rule.id, 'category': rule.category,
+                         'period': ROLLUP_GRANULARITIES[level],
+                         'bucket': _bucket_label(ROLLUP_GRANULARITIES[level], bucket_key),
+                         'limit': self._amount(rule.limit), 'total': self._amount(total)}
+                if rule.callback is None:
+                    self._budget_alerts.append(alert)
+                else:
+                    callbacks.append((rule, alert))
+        return callbacks
+
+    def _invalidate_results(self, first_row: int, first_code: int):
+        """Evict cached results that rows from first_row onwards could change."""
+        store = self.expenses
+        spans: Dict[int, Tuple[int, int]] = {}
+        for ordinal, code in zip(store.dates[first_row:], store.category_codes[first_row:]):
+            span = spans.get(code)
+            if span is None:
+                spans[code] = (ordinal, ordinal)
+            elif not span[0] <= ordinal <= span[1]:
+                spans[code] = (min(span[0], ordinal), max(span[1], ordinal))
+        if not spans:
+            return
+        categories = store.categories
+        self._result_cache.invalidate(
+            spans, [_category_key(categories[code], self.category_normalization)
+                    for code in range(first_code, len(categories))])
+
+    def _cached(self, kind: str, start: Optional[int], end: Optional[int],
+                category: Optional[str], compute, measure):
+        """
+        Return a filtered result from the result cache, computing it on a miss.
+
+        Args:
+            kind (str): Kind of result, part of the cache key
+            start (Optional[int]): First day ordinal of the filter
+            end (Optional[int]): Last day ordinal of the filter
+            category (Optional[str]): Category filter as given
+            compute: Callable taking no arguments that returns the result
+            measure: Callable returning the estimated bytes held by a result
+
+        Returns:
+            The cached or newly computed result
+        """
+        cache = self._result_cache
+        if cache is None:
+            return compute()
+        category_key = _category_key(category, self.category_normalization) if category else None
+        key = (kind, start, end, category_key)
+        result = cache.get(key)
+        if result is None:
+            generation = cache.generation
+            result = compute()
+            cache.put(key, result, measure(result), generation,
+                      _MIN_ORDINAL if start is None else start,
+                      _MAX_ORDINAL if end is None else end,
+                      self._category_filter_codes(category))
+        return result
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Report how the result cache is performing.
+
+        Returns:
+            Dict: 'hits', 'misses', 'evictions' (entries dropped to stay
+            within the budget), 'invalidations' (entries dropped by writes),
+            'entries', 'bytes' in use and the 'budget'; all zero when the
+            cache is disabled
+        """
+        if self._result_cache is None:
+            return dict.fromkeys(('hits', 'misses', 'evictions', 'invalidations',
+                                  'entries', 'bytes', 'budget'), 0)
+        return self._result_cache.stats()
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        """
+        Return per-operation statistics recorded since the tracker was created.
+
+        Returns:
+            Dict: Operation name mapped to 'calls', 'errors', 'seconds' (total),
+            'max_seconds', 'rows_scanned' (index entries or rows visited),
+            'rows_returned' (length of returned lists), 'date_parses'
+            (dates parsed by the strptime() fallback) and 'latency_buckets' (cumulative call
+            counts keyed by upper bound in seconds); empty when the tracker
+            was created without metrics=True
+        """
+        return self._metrics.snapshot() if self._metrics is not None else {}
+
+    def export_metrics(self, file_format: str = 'prometheus', path: Optional[str] = None) -> str:
+        """
+        Render the get_metrics() statistics for monitoring tools.
+
+        Args:
+            file_format (str): 'prometheus' for the Prometheus text format or
+                'json' for a JSON document
+            path (Optional[str]): File to write the rendered metrics to
+
+        Returns:
+            str: The rendered metrics
+
+        Raises:
+            ValueError: If the format is not supported
+        """
+        operations = self.get_metrics()
+        if file_format == 'prometheus':
+            text = _format_prometheus(operations)
+        elif file_format == 'json':
+            import json
+
+            # JSON has no infinity, so the overflow bucket is labelled '+Inf'
+            text = json.dumps({name: dict(stats, latency_buckets={
+                                   ('+Inf' if bound == math.inf else str(bound)): calls
+                                   for bound, calls in stats['latency_buckets'].items()})
+                               for name, stats in operations.items()}, indent=2)
+        else:
+            raise ValueError("Metrics format must be 'prometheus' or 'json'")
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as handle:
+                handle.write(text)
+        return text
+
+    def _optimistic_read(self, read):
+        """
+        Run a short read of the running totals or rollups without locking.
+
+        The read is retried if a write started or finished while it ran, so
+        the result always reflects a state between two writes and readers
+        never hold up writers. Trackers that are not thread-safe just run it.
+
+        Args:
+            read: Callable taking no arguments and returning the result
+
+        Returns:
+            The result of a read that did not overlap any write
+        """
+        if not self.thread_safe:
+            return read()
+        while True:
+            version = self._version
+            if version % 2 == 0:
+                try:
+                    result = read()
+                except Exception:
+                    # Structures changing underneath the read can raise;
+                    # that only matters if no write overlapped it
+                    if self._version == version:
+                        raise
+                else:
+                    if self._version == version:
+                        return result
+            time.sleep(0)
+
+    def _read_rows(self, read):
+        """
+        Run a read that finds row positions, against one consistent store.
+
+        Row positions only make sense for the store whose indexes produced
+        them. The read is retried if a compaction switched stores while it
+        ran; the store it used stays readable afterwards, so the rows can
+        still be turned into ExpenseRow views once this returns.
+
+        Args:
+            read: Callable taking no arguments and returning the result
+
+        Returns:
+            Tuple: The store the read used, and its result
+        """
+        if not self.thread_safe:
+            return self.expenses, read()
+        while True:
+            generation = self._store_generation
+            store = self.expenses
+            if generation % 2 == 0:
+                try:
+                    result = read()
+                except Exception:
+                    if self._store_generation == generation:
+                        raise
+                else:
+                    if self._store_generation == generation:
+                        return store, result
+            time.sleep(0)
+
+    def _write_rows(self, rows: List[Tuple[int, int, str, str]],
+                    replaced_row: Optional[int] = None,
+                    content_hashes: Optional[List[int]] = None) -> int:
+        """
+        Append rows to the store and update indexes, totals and rollups.
+
+        content_hashes, when _unique_rows() has already computed them, save
+        recomputing the rows' content hashes.
+        """
+        store = self.expenses
+        known_categories = len(store.categories)
+        if replaced_row is None:
+            first_row = store.extend(rows)
+        else:
+            tombstone = store.supersede(replaced_row, rows[0] if rows else None)
+            self._forget_row(tombstone)
+            first_row = tombstone + 1
+        if len(store.categories) > known_categories:
+            self._register_categories(known_categories)
+
+        date_keys = [(row[0] << _ROW_BITS) | row_id for row_id, row in enumerate(rows, first_row)]
+        if self._date_keys is not None:
+            self._date_keys.extend(date_keys)
+        if self._category_date_keys is not None:
+            self._index_categories(date_keys, store.category_codes[first_row:])
+        if self._description_width is not None and rows:
+            self._description_width = max(self._description_width, max(len(row[3]) for row in rows))
+        if self._text_index is not None:
+            self._text_index.add(first_row, [row[3] for row in rows])
+        if self._content_index is not None:
+            if content_hashes is None:
+                self._index_contents(store, first_row, self._content_index)
+            else:
+                self._content_index.extend(first_row, content_hashes)
+
+        # Batch version of _adjust_totals()
+        category_cents = self._category_cents
+        category_counts = self._category_counts
+        missing = len(store.categories) - len(category_cents)
+        if missing > 0:
+            category_cents.extend([0] * missing)
+            category_counts.extend([0] * missing)
+        added_cents = 0
+        for code, row in zip(store.category_codes[first_row:], rows):
+            category_cents[code] += row[1]
+            category_counts[code] += 1
+            added_cents += row[1]
+        self._total_cents += added_cents
+
+        if self._rollups is not None:
+            self._update_rollups(zip((row[0] for row in rows), store.category_codes[first_row:],
+                                     (row[1] for row in rows)), 1)
+        if self._sketches is not None:
+            self._update_sketches(range(first_row, first_row + len(rows)), store.category_codes[first_row:],
+                                  [row[1] for row in rows], [row[3] for row in rows])
+        return first_row
+
+    def _discard_write(self, known_rows: int, known_categories: int):
+        """
+        Take back a write that failed partway.
+
+        The store is cut back to the rows and categories it had before the
+        write. The failure may have left only some of the totals and
+        indexes updated, so the totals are recounted (from the latest
+        snapshot, for a persistent store) and the other derived structures
+        are dropped, to be rebuilt on next use.
+        """
+        store = self.expenses
+        store.truncate(known_rows, known_categories)
+        for key in self._category_keys[known_categories:]:
+            codes = self._codes_by_category_key[key]
+            del codes[bisect_left(codes, known_categories):]
+            if not codes:
+                del self._codes_by_category_key[key]
+        del self._category_keys[known_categories:]
+
+        self._category_cents = []
+        self._category_counts = []
+        self._total_cents = 0
+        if store.durable:
+            self._restore_state()
+        else:
+            for entries, sign in self._signed_entries(0):
+                for _, code, cents in entries:
+                    self._adjust_totals(code, sign * cents, sign)
+        self._date_keys = None
+        self._category_date_keys = None
+        self._description_width = None
+        self._text_index = None
+        self._rollups = None
+        self._sketches = self._overall_sketches = None
+        self._content_index = None
+        if self._result_cache is not None:
+            self._result_cache.clear()
+
+    def _forget_row(self, tombstone: int):
+        """
+        Take the expense retired by a new tombstone row out of the totals.
+
+        Totals and rollups are adjusted in O(1). The tombstone joins the
+        date, category and description indexes like any row, so they stay
+        aligned with the store; readers skip dead rows. Sketches cannot take
+        a value back out, so they are rebuilt over the live rows on next use.
+        """
+        store = self.expenses
+        ordinal = store.dates[tombstone]
+        code = store.category_codes[tombstone]
+        cents = store.amounts[tombstone]
+        self._adjust_totals(code, -cents, -1)
+        if self._rollups is not None:
+            self._update_rollups([(ordinal, code, cents)], -1)
+        key = (ordinal << _ROW_BITS) | tombstone
+        if self._date_keys is not None:
+            self._date_keys.extend([key])
+        if self._category_date_keys is not None:
+            self._index_categories([key], [code])
+        if self._text_index is not None:
+            self._text_index.add(tombstone, [''])
+        self._sketches = self._overall_sketches = None
+
+    def _update_sketches(self, rows: Sequence[int], codes: Sequence[int], amounts: Sequence[int],
+                         descriptions: Sequence[str]):
+        """
+        Add rows to the analytics sketches, given their positions and columns.
+
+        Rows are sorted by category first, so each sketch takes its rows as
+        one batch, and each distinct description is hashed once per batch.
+        """
+        sketches = self._sketches
+        while len(sketches) < len(self.expenses.categories):
+            sketches.append(_Sketches())
+        overall = self._overall_sketches
+        hashes = {description: _hash64(description) for description in set(descriptions)}
+        overall.top.extend(zip(amounts, rows))
+        overall.amounts.extend(amounts)
+        overall.descriptions.add_hashes(hashes.values())
+
+        code_of = codes.__getitem__
+        for code, positions in groupby(sorted(range(len(codes)), key=code_of), key=code_of):
+            positions = list(positions)
+            code_amounts = [amounts[position] for position in positions]
+            group = sketches[code]
+            group.top.extend(zip(code_amounts, (rows[position] for position in positions)))
+            group.amounts.extend(code_amounts)
+            group.descriptions.add_hashes({hashes[descriptions[position]] for position in positions})
+
+    def _analytics_sketches(self, category: Optional[str]) -> Optional[_Sketches]:
+        """
+        Return the sketches for a category filter, building them if needed.
+
+        The first call scans the live rows once; afterwards every write
+        updates the sketches, until a delete or update has them rebuilt. A
+        filter matching several categories (names that differ only in case)
+        gets their sketches merged.
+
+        Returns:
+            Optional[_Sketches]: Sketches for the matching rows, or None if
+            no category matches the filter
+        """
+        sketches, overall = self._sketches, self._overall_sketches
+        if sketches is None:
+            with self._lock:
+                if self._sketches is None:
+                    # Counts as a write, so optimistic readers retry
+                    self._version += 1
+                    try:
+                        store = self.expenses
+                        dead = store.dead_rows
+                        self._sketches = []
+                        self._overall_sketches = _Sketches()
+                        for first in range(0, len(store), 100_000):
+                            rows = range(first, min(first + 100_000, len(store)))
+                            if not dead:
+                                codes = store.category_codes[rows.start:rows.stop]
+                                amounts = store.amounts[rows.start:rows.stop]
+                            else:
+                                rows = [row for row in rows if row not in dead]
+                                codes = [store.category_codes[row] for row in rows]
+                                amounts = [store.amounts[row] for row in rows]
+                            self._update_sketches(rows, codes, amounts, list(map(store.description, rows)))
+                    finally:
+                        self._version += 1
+                sketches, overall = self._sketches, self._overall_sketches
+        wanted_codes = self._category_filter_codes(category)
+        if wanted_codes is None:
+            return overall
+        codes = [code for code in sorted(wanted_codes) if code < len(sketches)]
+        if not codes:
+            return None
+        if len(codes) == 1:
+            return sketches[codes[0]]
+        merged = _Sketches()
+        for code in codes:
+            merged.merge(sketches[code])
+        return merged
+
+    def _update_rollups(self, entries: Iterable[Tuple[int, int, int]], count: int):
+        """
+        Add (ordinal, category code, cents) entries to every rollup table.
+
+        Args:
+            entries (Iterable[Tuple[int, int, int]]): Expenses to apply
+            count (int): 1 to add the expenses, -1 to take them back out
+
+        Entries are first combined per (day, category), since many expenses
+        share both, and then each combined total is applied to the tables.
+        """
+        combined: Dict[Tuple[int, int], List[int]] = {}
+        for ordinal, code, cents in entries:
+            totals = combined.get((ordinal, code))
+            if totals is None:
+                combined[ordinal, code] = [cents, 1]
+            else:
+                totals[0] += cents
+                totals[1] += 1
+        self._apply_day_totals(combined.items(), count)
+
+    def _apply_day_totals(self, totals: Iterable[Tuple[Tuple[int, int], List[int]]], count: int):
+        """Apply ((ordinal, code), [cents, rows]) totals to every rollup table."""
+        cache = self._bucket_cache
+        if len(cache) > 100_000:
+            cache.clear()
+        tables = self._rollups
+        for (ordinal, code), (cents, rows) in totals:
+            keys = cache.get(ordinal)
+            if keys is None:
+                keys = cache[ordinal] = _bucket_keys(ordinal)
+            cents *= count
+            rows *= count
+            for table, key in zip(tables, keys):
+                bucket = table.get(key)
+                if bucket is None:
+                    bucket = table[key] = {}
+                totals = bucket.get(code)
+                if totals is None:
+                    bucket[code] = [cents, rows]
+                else:
+                    totals[0] += cents
+                    totals[1] += rows
+
+    def _rollup_tables(self) -> List[Dict[int, Dict[int, List[int]]]]:
+        """
+        Return the rollup tables, building them if needed.
+
+        A reopened persistent store starts from its saved per-day segment
+        totals and only replays the rows written after them; without saved
+        totals every row is scanned once.
+        """
+        if self._rollups is None:
+            with self._lock:
+                if self._rollups is None:
+                    # Counts as a write, so optimistic readers retry
+                    self._version += 1
+                    try:
+                        store = self.expenses
+                        self._rollups = [{} for _ in ROLLUP_GRANULARITIES]
+                        segments = store.read_segments() if store.durable else None
+                        first_row = 0
+                        if segments is not None:
+                            first_row, entries = segments
+                            self._apply_day_totals(
+                                (((entries[i], entries[i + 1]), [entries[i + 2], entries[i + 3]])
+                                 for i in range(0, len(entries), 4)), 1)
+                        for entries, sign in self._signed_entries(first_row):
+                            self._update_rollups(entries, sign)
+                    finally:
+                        self._version += 1
+        return self._rollups
+
+    def _adjust_totals(self, code: int, cents: int, count: int):
+        """
+        Apply one change to the running summary totals in O(1).
+
+        Args:
+            code (int): Category code of the affected expense
+            cents (int): Amount to add, negative when removing an expense
+            count (int): Change in the category's expense count (+1 or -1)
+        """
+        while len(self._category_cents) <= code:
+            self._category_cents.append(0)
+            self._category_counts.append(0)
+        self._category_cents[code] += cents
+        self._category_counts[code] += count
+        self._total_cents += cents
+
+    def _index_categories(self, date_keys: List[int], codes: Sequence[int],
+                          index: Optional[List[_DateKeyIndex]] = None):
+        """Add new rows' date keys to their categories' date indexes."""
+        if index is None:
+            index = self._category_date_keys
+        while len(index) < len(self.expenses.categories):
+            index.append(_DateKeyIndex(lock=self._lock))
+        keys_by_code: Dict[int, List[int]] = {}
+        for key, code in zip(date_keys, codes):
+            keys = keys_by_code.get(code)
+            if keys is None:
+                keys_by_code[code] = [key]
+            else:
+                keys.append(key)
+        for code, keys in keys_by_code.items():
+            index[code].extend(keys)
+
+    def _rows_in_date_range(self, start: Optional[int], end: Optional[int],
+                            codes: Optional[Iterable[int]] = None) -> List[int]:
+        """
+        Return the row positions whose date falls within [start, end].
+
+        With category codes, only those categories' date indexes are searched,
+        so the cost is O(log n + k) for k matching rows either way. The
+        positions are returned in insertion order, matching a full scan.
+        """
+        visible_rows = self._visible_rows if self.thread_safe else None
+        if codes is None:
+            rows = self._date_index().rows_between(start, end, visible_rows)
+        else:
+            index = self._category_index()
+            rows = [index[code].rows_between(start, end, visible_rows) for code in codes]
+            rows = rows[0] if len(rows) == 1 else sorted(chain.from_iterable(rows))
+        _count_scanned(len(rows))
+        dead = self.expenses.dead_rows
+        if dead:
+            rows = [row for row in rows if row not in dead]
+        return rows
+
+    def checkpoint(self):
+        """
+        Write a snapshot of the summary totals and date index to disk.
+
+        Reopening the store then only replays rows written after the
+        snapshot. The per-day segment totals behind the rollup tables are
+        saved too when they are loaded. Does nothing for an in-memory
+        tracker.
+        """
+        if not self.expenses.durable:
+            return
+        with self._lock:
+            self.expenses.write_snapshot(self._category_cents, self._category_counts,
+                                         self._date_index().keys())
+            if self._rollups is not None:
+                self.expenses.write_segments(len(self.expenses), self._rollups[0])
+            self._snapshot_rows = len(self.expenses)
+
+    def flush(self):
+        """Sync every expense written so far to disk."""
+        with self._lock:
+            self.expenses.flush(sync=True)
+
+    def close(self):
+        """
+        Snapshot and close a persistent store.
+
+        Demonstrates:
+        - Explicit resource cleanup
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        with self._lock:
+            if self.expenses.closed:
+                return
+            if self.expenses.durable and len(self.expenses) > self._snapshot_rows:
+                self.checkpoint()
+            self.expenses.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def query(self) -> 'ExpenseQuery':
+        """
+        Start a lazy query over the tracker's expenses.
+
+        Returns:
+            ExpenseQuery: Query matching every expense; narrow it with
+            where(), order_by(), offset() and limit()
+        """
+        return ExpenseQuery(self)
+
+    def add_expense(self, date: str, amount: float, category: str, description: str,
+                    idempotency_key: Optional[str] = None):
+        """
+        Add a new expense to the tracker with validation.
+
+        A client that retries a request can pass the same idempotency key
+        each time: while the expense added with that key exists, later
+        calls with the key add nothing and return its ID. The most recent
+        IDEMPOTENCY_KEYS_KEPT keys are remembered, in memory only. With
+        deduplication on, an expense matching a stored one is likewise not
+        added again.
+
+        Args:
+            date (str): Date in YYYY-MM-DD format
+            amount (float): Expense amount (must be positive)
+            category (str): Expense category
+            description (str): Expense description
+            idempotency_key (Optional[str]): Client-chosen key identifying
+                this expense across retries
+
+        Returns:
+            Optional[int]: Expense ID of the new (or already stored)
+            expense, for update_expense() and delete_expense(); None if it
+            was rejected
+
+        Demonstrates:
+        - Method parameter type hints
+        - Exception handling with try-except blocks
+        - datetime module for date validation
+        - Type conversion to fixed-point cents
+        """
+        try:
+            # Validate the date and convert it to a day ordinal
+            # Demonstrates Python's datetime module for date parsing
+            ordinal = _parse_date(date)
+        except (TypeError, ValueError):
+            # Handle invalid date format
+            # Demonstrates specific exception handling
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return
+
+        try:
+            # Convert the amount to whole cents for storage
+            cents = _to_cents(amount, self.expenses.currency_scale)
+        except (ValueError, TypeError, OverflowError):
+            print("Error: Please enter a valid amount (number).")
+            return
+
+        if not isinstance(category, str) or not isinstance(description, str):
+            # Checked before anything is stored, as bulk validation does
+            print("Error: Category and description must be text.")
+            return
+
+        try:
+            # Add to the expense store and the date index
+            duplicates = []
+            expense_id = self._insert_rows([(ordinal, cents, category, description)],
+                                           duplicates=duplicates, idempotency_key=idempotency_key,
+                                           deduplicate=self.deduplicate)
+            if duplicates:
+                print("Expense already recorded; not added again.")
+                return duplicates[0]
+            print("Expense added successfully!")
+            return expense_id
+        except Exception as e:
+            # Handle any other unexpected errors
+            # Demonstrates generic exception handling with error message
+            print(f"Error adding expense: {str(e)}")
+
+    def add_expenses_bulk(self, source, batch_size: int = 10_000,
+                          deduplicate: Optional[bool] = None) -> Dict:
+        """
+        Add many expenses at once, reporting rejected rows instead of printing.
+
+        With deduplication on, a row whose date, amount, category (matched
+        case-insensitively) and description (casefolded, whitespace
+        collapsed) equal those of a live stored expense, or of an earlier
+        row of the input, is skipped, so re-running an import adds nothing.
+        Each check is an O(1) lookup in a compact content hash index.
+
+        Args:
+            source: One of
+                - an iterable of (date, amount, category, description) tuples
+                  or of mappings with 'Date', 'Amount', 'Category' and
+                  'Description' keys
+                - a path to a CSV file with those four columns
+                - a NumPy structured array with those four fields
+            batch_size (int): Rows validated together in one batch
+            deduplicate (Optional[bool]): Skip rows already stored; None
+                uses the tracker's deduplicate setting
+
+        Returns:
+            Dict: 'added' count and a 'rejected' list of dicts with the
+            input 'row' position (from 0, excluding a CSV header), the
+            'reason' and the original 'values'; with deduplication, also a
+            'duplicates' count of skipped rows
+
+        Demonstrates:
+        - Duck typing to accept several input types
+        - Batch processing with itertools.islice
+        - Optional vectorized validation with NumPy
+        """
+        if deduplicate is None:
+            deduplicate = self.deduplicate
+        report = {'added': 0, 'rejected': []}
+        if deduplicate:
+            report['duplicates'] = 0
+        # Validate each batch, then store the rows that passed
+        for valid, rejected in _validated_batches(source, batch_size, self.expenses.currency_scale):
+            if valid and deduplicate:
+                duplicates = []
+                self._insert_rows(valid, duplicates=duplicates, deduplicate=True)
+                report['duplicates'] += len(duplicates)
+                report['added'] += len(valid) - len(duplicates)
+            elif valid:
+                self._insert_rows(valid)
+                report['added'] += len(valid)
+            report['rejected'].extend(rejected)
+        return report
+
+    def update_expense(self, expense_id: int, date: Optional[str] = None, amount=None,
+                       category: Optional[str] = None, description: Optional[str] = None) -> bool:
+        """
+        Change some fields of a stored expense, keeping its expense ID.
+
+        The old version is retired by a tombstone and the new version is
+        appended in the same write, so readers see either one or the other.
+        Totals, rollups and indexes move the expense in O(1), and budget
+        rules see the change in the period totals. Fields left as None keep
+        their current values.
+
+        Args:
+            expense_id (int): ID returned by add_expense() or read from
+                ExpenseRow.expense_id
+            date (Optional[str]): New date in YYYY-MM-DD format
+            amount: New amount
+            category (Optional[str]): New category
+            description (Optional[str]): New description
+
+        Returns:
+            bool: True if the expense existed and was updated
+
+        Raises:
+            ValueError: If a new value is invalid
+        """
+        changes = {}
+        if date is not None:
+            try:
+                changes[0] = _parse_date(date)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid date format. Please use YYYY-MM-DD format.")
+        if amount is not None:
+            try:
+                changes[1] = _to_cents(amount, self.expenses.currency_scale)
+            except (ValueError, TypeError, OverflowError):
+                raise ValueError(f"Invalid amount: {amount!r}")
+        for field, value in ((2, category), (3, description)):
+            if value is not None:
+                if not isinstance(value, str):
+                    raise ValueError("Category and description must be text")
+                changes[field] = value
+        with self._lock:
+            row = self.expenses.find(expense_id)
+            if row is None:
+                return False
+            record = list(self.expenses.record(row))
+            for field, value in changes.items():
+                record[field] = value
+            self._insert_rows([tuple(record)], replaced_row=row)
+        return True
+
+    def delete_expense(self, expense_id: int) -> bool:
+        """
+        Delete a stored expense.
+
+        A tombstone row records the deletion, and the expense leaves every
+        total, rollup and query result at once. Its storage is reclaimed by
+        the next compact().
+
+        Args:
+            expense_id (int): ID returned by add_expense() or read from
+                ExpenseRow.expense_id
+
+        Returns:
+            bool: True if the expense existed and was deleted
+        """
+        with self._lock:
+            row = self.expenses.find(expense_id)
+            if row is None:
+                return False
+            self._insert_rows([], replaced_row=row)
+        return True
+
+    def compact(self, background: bool = False):
+        """
+        Reclaim the space held by deleted and replaced expenses.
+
+        The live rows are copied, in expense ID order, to a new store, and
+        its date index (plus the category and description indexes, if they
+        were built) is built, all without holding the write lock, so readers
+        and writers carry on meanwhile. The lock is only taken at the end,
+        to replay the writes made during the copy and switch stores. A
+        persistent store swaps in its new files behind a commit marker, so
+        a crash during the switch is finished or rolled back the next time
+        the store is opened.
+
+        Expense IDs and totals do not change. Row positions do; rows read
+        before the switch keep showing the old store.
+
+        Args:
+            background (bool): Run in a new daemon thread and return it;
+                needs a thread-safe tracker
+
+        Returns:
+            int or threading.Thread: Rows reclaimed (0 when there was
+            nothing to reclaim or another compaction is running), or the
+            thread running the compaction
+
+        Raises:
+            ValueError: If background is set on a tracker that is not
+                thread-safe
+        """
+        if background:
+            if not self.thread_safe:
+                raise ValueError("Background compaction needs an ExpenseTracker created with thread_safe=True")
+            worker = threading.Thread(target=self.compact, name='expense-compaction', daemon=True)
+            worker.start()
+            return worker
+
+        with self._lock:
+            store = self.expenses
+            if self._compacting or not store.dead_rows:
+                return 0
+            self._compacting = True
+            copied_rows = len(store)
+            rows = store.rows_by_id(copied_rows)
+            build_categories = self._category_date_keys is not None
+            build_text = self._text_index is not None
+            build_contents = self._content_index is not None
+            compacted = store.empty_copy()
+        try:
+            try:
+                compacted.copy_rows(store, rows, copied_rows)
+                date_index, category_index, text_index, content_index = self._build_indexes(
+                    compacted, build_categories, build_text, build_contents)
+            except BaseException:
+                compacted.discard()
+                raise
+
+            with self._lock:
+                try:
+                    # Catch up with the writes made during the copy
+                    first_row = len(compacted)
+                    compacted.replay(store, copied_rows)
+                    keys = [(ordinal << _ROW_BITS) | row
+                            for row, ordinal in enumerate(compacted.dates[first_row:], first_row)]
+                    date_index.extend(keys)
+                    if category_index is not None:
+                        self._index_categories(keys, compacted.category_codes[first_row:], category_index)
+                    if text_index is not None:
+                        text_index.add(first_row, map(compacted.description, range(first_row, len(compacted))))
+                    if content_index is not None:
+                        self._index_contents(compacted, first_row, content_index)
+                except BaseException:
+                    compacted.discard()
+                    raise
+                store.commit_compaction(compacted)
+
+                # Switch stores; the indexes and row count go with them
+                self._store_generation += 1
+                self._date_keys = date_index
+                self._category_date_keys = category_index
+                self._text_index = text_index
+                self._content_index = content_index
+                self._sketches = self._overall_sketches = None
+                self._visible_rows = len(compacted)
+                self.expenses = compacted
+                self._store_generation += 1
+                if self._result_cache is not None:
+                    self._result_cache.clear()
+                store.detach()
+                self._snapshot_rows = 0
+                if compacted.durable:
+                    self.checkpoint()
+                return len(store) - len(compacted)
+        finally:
+            self._compacting = False
+
+    def _build_indexes(self, store: ExpenseStore, categories: bool, text: bool,
+                       contents: bool) -> Tuple:
+        """
+        Build the date index over every row of a store, and the category,
+        description and content hash indexes if asked.
+
+        Returns:
+            Tuple: Date index, per-category date indexes or None,
+            description index or None, and content hash index or None
+        """
+        keys = [(ordinal << _ROW_BITS) | row for row, ordinal in enumerate(store.dates)]
+        date_index = _DateKeyIndex(array('q', sorted(keys)), self._lock)
+        category_index = None
+        if categories:
+            keys_by_code = [[] for _ in store.categories]
+            for key, code in zip(keys, store.category_codes):
+                keys_by_code[code].append(key)
+            category_index = [_DateKeyIndex(array('q', sorted(code_keys)), self._lock)
+                              for code_keys in keys_by_code]
+        text_index = None
+        if text:
+            text_index = _TextIndex(self._lock)
+            text_index.add(0, map(store.description, range(len(store))))
+        content_index = self._index_contents(store, 0) if contents else None
+        return date_index, category_index, text_index, content_index
+
+    def _amount(self, cents: int, exact: bool = False):
+        """
+        Convert integer minor units to an amount for reporting.
+
+        Args:
+            cents (int): Amount in minor units
+            exact (bool): Return a Decimal with exactly the currency's
+                decimal places instead of a float
+
+        Returns:
+            float or Decimal: Amount in currency units
+        """
+        if exact:
+            return Decimal(cents).scaleb(-self.expenses.currency_scale)
+        return cents / self.expenses.minor_units
+
+    def _category_filter_codes(self, category: Optional[str]) -> Optional[frozenset]:
+        """
+        Return the codes of every category matching a case-insensitive filter.
+
+        The lookup goes through the normalized category key, so rows can then
+        be found or compared by integer category code. Returns None for no
+        filter.
+        """
+        if not category:
+            return None
+        key = _category_key(category, self.category_normalization)
+        return frozenset(self._codes_by_category_key.get(key, ()))
+
+    def _partitions(self, workers: int, rows: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Split the visible rows, or the first rows, into one contiguous (first, end) range per worker."""
+        total = self._visible_rows if rows is None else rows
+        size = -(-total // workers) if total else 1
+        return [(first, min(first + size, total)) for first in range(0, total, size)]
+
+    def _process_pool(self, workers: int):
+        """
+        Return a process pool with the given number of workers.
+
+        The pool is created on first use and reused by later calls, since
+        starting processes costs far more than a typical partition scan.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self._pool is None or self._pool_workers != workers:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+            self._pool_workers = workers
+        return self._pool
+
+    def _scan_in_parallel(self, kernel, workers: int, *arguments, rows: Optional[int] = None) -> List:
+        """
+        Run a scan kernel over every partition of the store in worker processes.
+
+        Each worker receives copies of its partition's columns, so the store
+        itself never has to be shared between processes.
+
+        Returns:
+            List: Kernel results in partition order
+        """
+        store = self.expenses
+        pool = self._process_pool(workers)
+        futures = []
+        for first, end in self._partitions(workers, rows):
+            dates = store.dates[first:end]
+            codes = store.category_codes[first:end]
+            if kernel is _filter_partition:
+                futures.append(pool.submit(kernel, dates, codes, first, *arguments))
+            else:
+                futures.append(pool.submit(kernel, dates, store.amounts[first:end], codes, *arguments))
+        return [future.result() for future in futures]
+
+    def _matching_rows(self, start_date: Optional[str], end_date: Optional[str],
+                       category: Optional[str], workers: Optional[int] = None,
+                       use_cache: bool = True) -> Optional[Iterable[int]]:
+        """
+        Return the row positions that pass the get_expenses() filters.
+
+        Filtered results go through the result cache, if enabled, unless
+        use_cache is False. Dead rows are left out.
+
+        Returns:
+            Optional[Iterable[int]]: Matching rows in insertion order, or None
+            if a date bound is not a valid date
+        """
+        # Parse the date bounds once rather than once per expense
+        try:
+            start = _parse_date(start_date) if start_date else None
+            end = _parse_date(end_date) if end_date else None
+        except ValueError:
+            return None
+        wanted_codes = self._category_filter_codes(category)
+
+        # Partition a full scan across worker processes when requested
+        if workers and workers > 1 and (start is not None or end is not None or wanted_codes is not None):
+            _count_scanned(self._visible_rows)
+            partials = self._scan_in_parallel(
+                _filter_partition, workers,
+                _MIN_ORDINAL if start is None else start,
+                _MAX_ORDINAL if end is None else end, wanted_codes)
+            return filterfalse(self.expenses.dead_rows.__contains__, chain.from_iterable(partials))
+
+        # Category filters use the per-category date indexes; date ranges use
+        # the date index; otherwise visit every row
+        if start is None and end is None and wanted_codes is None:
+            _count_scanned(self._visible_rows)
+            rows = range(self._visible_rows)
+            dead = self.expenses.dead_rows
+            return filterfalse(dead.__contains__, rows) if dead else rows
+        codes = sorted(wanted_codes) if wanted_codes is not None else None
+        if not use_cache or self._result_cache is None:
+            return self._rows_in_date_range(start, end, codes)
+        return self._cached('rows', start, end, category,
+                            lambda: array('q', self._rows_in_date_range(start, end, codes)),
+                            lambda rows: rows.itemsize * len(rows))
+
+    def iter_expenses(self, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None,
+                      category: Optional[str] = None,
+                      workers: Optional[int] = None) -> Iterator[ExpenseRow]:
+        """
+        Yield expenses one at a time with the same filters as get_expenses().
+
+        Unlike get_expenses(), no list of results is built, so exporting a
+        whole store uses constant memory.
+
+        Demonstrates:
+        - Generator methods with yield
+        """
+        store, rows = self._read_rows(lambda: self._matching_rows(start_date, end_date, category, workers))
+        if rows is None:
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return
+        for row in rows:
+            yield ExpenseRow(store, row)
+
+    def get_expenses(self, start_date: Optional[str] = None,
+                    end_date: Optional[str] = None,
+                    category: Optional[str] = None,
+                    workers: Optional[int] = None) -> List[ExpenseRow]:
+        """
+        Get expenses filtered by date range and/or category.
+
+        Args:
+            start_date (Optional[str]): Start date filter (YYYY-MM-DD)
+            end_date (Optional[str]): End date filter (YYYY-MM-DD)
+            category (Optional[str]): Category filter (case-insensitive)
+            workers (Optional[int]): Scan the store in this many processes
+                instead of using the date index
+
+        Returns:
+            List[ExpenseRow]: Filtered list of dictionary-style expense views
+
+        Demonstrates:
+        - Optional parameters with default None values
+        - Type hints with Optional type
+        - Binary search over a sorted date index
+        - Case-insensitive string comparison
+        """
+        return list(self.iter_expenses(start_date, end_date, category, workers))
+
+    def search(self, text: str, start_date: Optional[str] = None,
+               end_date: Optional[str] = None, category: Optional[str] = None,
+               limit: Optional[int] = 20) -> List[ExpenseRow]:
+        """
+        Find expenses whose descriptions contain every word of a search.
+
+        Words are matched case-insensitively as whole terms; a word ending
+        in '*' matches every term starting with it ("air*" finds "airport"
+        and "airline"). Results are ranked by relevance: rarer terms count
+        for more, and shorter descriptions rank above longer ones. Ties go
+        to the most recently added expense.
+
+        Candidates come from whichever is smallest: the rows containing the
+        rarest search term, or the rows selected by the date and category
+        indexes. The remaining conditions are checked per candidate with a
+        binary search or a column lookup, so no query scans the whole store.
+
+        Args:
+            text (str): Words to search for
+            start_date (Optional[str]): Start date filter (YYYY-MM-DD)
+            end_date (Optional[str]): End date filter (YYYY-MM-DD)
+            category (Optional[str]): Category filter (case-insensitive)
+            limit (Optional[int]): Maximum number of results; None for all
+
+        Returns:
+            List[ExpenseRow]: Matching expenses, best match first
+
+        Demonstrates:
+        - Inverted indexes with sorted posting lists
+        - Regular expressions for tokenizing
+        - heapq.nlargest() for top-N ranking
+        """
+        try:
+            start = _parse_date(start_date) if start_date else None
+            end = _parse_date(end_date) if end_date else None
+        except ValueError:
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return []
+
+        # A word like "e-mail*" yields several terms; only the last is a prefix
+        words = []
+        for word in text.split():
+            terms = _tokenize(word)
+            words.extend((term, False) for term in terms[:-1])
+            if terms:
+                words.append((terms[-1], word.endswith('*')))
+        wanted_codes = self._category_filter_codes(category)
+        if not words or wanted_codes == frozenset():
+            return []
+        store, ranked = self._read_rows(lambda: self._ranked_matches(words, start, end, wanted_codes, limit))
+        return [ExpenseRow(store, row) for _, row in ranked]
+
+    def _ranked_matches(self, words: List[Tuple[str, bool]], start: Optional[int], end: Optional[int],
+                        wanted_codes: Optional[frozenset], limit: Optional[int]) -> List[Tuple[float, int]]:
+        """Return the (score, row) pairs of the best search() matches, best first."""
+        # Each search word becomes a group of (posting list, idf) pairs, one
+        # per matching term, rarest first
+        index = self._search_index()
+        visible_rows = self._visible_rows
+        groups = []
+        for term, prefix in dict.fromkeys(words):
+            group = []
+            for match in index.expand(term, prefix):
+                postings = index.postings[match]
+                frequency = len(postings)
+                idf = math.log(1 + (visible_rows - frequency + 0.5) / (frequency + 0.5))
+                group.append((postings, idf))
+            if not group:
+                return []
+            group.sort(key=lambda pair: len(pair[0]))
+            groups.append(group)
+        groups.sort(key=lambda group: sum(len(postings) for postings, _ in group))
+
+        def weight(group, row):
+            """Return the idf of the first term in the group containing row, or None."""
+            for postings, idf in group:
+                position = bisect_left(postings, row)
+                if position < len(postings) and postings[position] == row:
+                    return idf
+            return None
+
+        # Choose the smaller source of candidate rows. Candidates taken from
+        # a single-term posting list all share its idf, so only the other
+        # words need checking.
+        filtered = start is not None or end is not None or wanted_codes is not None
+        rarest = sum(len(postings) for postings, _ in groups[0])
+        checks = groups
+        base_score = 0.0
+        if filtered and self._filtered_row_count(start, end, wanted_codes) < rarest:
+            candidates = self._rows_in_date_range(
+                start, end, sorted(wanted_codes) if wanted_codes is not None else None)
+        else:
+            _count_scanned(rarest)
+            if len(groups[0]) == 1:
+                candidates = groups[0][0][0]
+                base_score = groups[0][0][1]
+                checks = groups[1:]
+            else:
+                candidates = (row for row, _ in groupby(heapq.merge(*(postings for postings, _ in groups[0]))))
+            store = self.expenses
+            if start is not None or end is not None:
+                low = _MIN_ORDINAL if start is None else start
+                high = _MAX_ORDINAL if end is None else end
+                candidates = (row for row in candidates if low <= store.dates[row] <= high)
+            if wanted_codes is not None:
+                candidates = (row for row in candidates if store.category_codes[row] in wanted_codes)
+
+        # Score each candidate that contains every search word, with
+        # BM25-style length normalization for one occurrence per term
+        lengths = index.lengths
+        average_length = max(index.total_terms / len(lengths), 1.0) if len(lengths) else 1.0
+        length_weights = [1 / (0.25 + 0.75 * length / average_length) for length in range(256)]
+        dead = self.expenses.dead_rows
+        if not checks:
+            scored = [(base_score * length_weights[lengths[row]], row)
+                      for row in candidates if row < visible_rows and row not in dead]
+        else:
+            scored = []
+            for row in candidates:
+                if row >= visible_rows or row in dead:
+                    continue
+                score = base_score
+                for group in checks:
+                    idf = weight(group, row)
+                    if idf is None:
+                        break
+                    score += idf
+                else:
+                    scored.append((score * length_weights[lengths[row]], row))
+
+        return heapq.nlargest(limit, scored) if limit is not None else sorted(scored, reverse=True)
+
+    def _filtered_row_count(self, start: Optional[int], end: Optional[int],
+                            codes: Optional[frozenset]) -> int:
+        """Count the rows the date and category indexes would select."""
+        if codes is None:
+            lo, hi = self._date_index().span(start, end)
+            return hi - lo
+        index = self._category_index()
+        return sum(hi - lo for lo, hi in (index[code].span(start, end) for code in codes))
+
+    def import_expenses(self, path: str, file_format: Optional[str] = None,
+                        chunk_size: int = 10_000, deduplicate: Optional[bool] = None) -> Dict:
+        """
+        Stream expenses from a CSV or JSON Lines file into the tracker.
+
+        The file is read and validated chunk_size rows at a time, so memory
+        use does not grow with the file size.
+
+        Args:
+            path (str): File to read; see read_expenses()
+            file_format (Optional[str]): 'csv' or 'jsonl'
+            chunk_size (int): Rows validated and stored per batch
+            deduplicate (Optional[bool]): Skip rows already stored, so an
+                import can safely be run again; None uses the tracker's
+                deduplicate setting
+
+        Returns:
+            Dict: Report in the add_expenses_bulk() format
+        """
+        return self.add_expenses_bulk(read_expenses(path, file_format), batch_size=chunk_size,
+                                      deduplicate=deduplicate)
+
+    def export_expenses(self, path: str, file_format: Optional[str] = None,
+                        start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        category: Optional[str] = None) -> int:
+        """
+        Stream filtered expenses to a CSV or JSON Lines file.
+
+        Returns:
+            int: Number of expenses written
+
+        Raises:
+            ValueError: If a date bound is not a valid YYYY-MM-DD date
+        """
+        store, rows = self._read_rows(lambda: self._matching_rows(start_date, end_date, category))
+        if rows is None:
+            raise ValueError("Invalid date format. Please use YYYY-MM-DD format.")
+        return write_expenses((ExpenseRow(store, row) for row in rows), path, file_format,
+                              store.currency_scale)
+
+    def column_widths(self) -> Dict[str, int]:
+        """
+        Return column widths that fit every stored category and description.
+
+        The widths come from the category list and a running maximum kept on
+        insert, so print_expenses() can start printing without a sizing pass
+        over the results. A reopened store measures descriptions once, by
+        their encoded length, which is never less than the displayed length.
+
+        Returns:
+            Dict: 'Category' and 'Description' widths in characters
+        """
+        if self._description_width is None:
+            self._description_width = self.expenses.max_description_length()
+        return {'Category': max(map(len, self.expenses.categories), default=0),
+                'Description': self._description_width}
+
+    def get_summary(self, exact: bool = False) -> Dict:
+        """
+        Generate summary of expenses by category and calculate total.
+
+        The totals are maintained incrementally as expenses are written, so the
+        cost depends on the number of categories rather than the number of
+        expenses. They are integer sums of minor units, so they never drift
+        however many expenses are added.
+
+        Args:
+            exact (bool): Report Decimal amounts instead of floats
+
+        Returns:
+            Dict: Summary containing 'categories' dict and 'total' float
+
+        Demonstrates:
+        - Dictionary comprehensions
+        - Reading precomputed aggregates instead of rescanning data
+        """
+        categories = self.expenses.categories
+        return self._optimistic_read(lambda: {
+            'categories': {categories[code]: self._amount(cents, exact)
+                           for code, cents in enumerate(self._category_cents)
+                           if self._category_counts[code]},
+            'total': self._amount(self._total_cents, exact),
+        })
+
+    def summarize(self, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None,
+                  category: Optional[str] = None,
+                  workers: Optional[int] = None,
+                  exact: bool = False) -> Optional[Dict]:
+        """
+        Summarize the expenses that pass the get_expenses() filters.
+
+        Filtered summaries are added up from the per-period totals behind
+        get_rollup(): whole years and months inside the range take one
+        bucket each and only the days at its edges are added individually,
+        so the cost depends on the range's shape rather than on how many
+        expenses it holds.
+
+        With workers > 1 the store is split into one partition per worker
+        process; each computes integer cent totals and counts per category,
+        and the partial results are merged. Integer arithmetic makes the
+        result identical to the serial path.
+
+        Args:
+            start_date (Optional[str]): Start date filter (YYYY-MM-DD)
+            end_date (Optional[str]): End date filter (YYYY-MM-DD)
+            category (Optional[str]): Category filter (case-insensitive)
+            workers (Optional[int]): Number of worker processes
+            exact (bool): Report Decimal amounts instead of floats
+
+        Returns:
+            Optional[Dict]: 'categories' totals, per-category 'counts',
+            'total' and 'count', or None if a date bound is invalid
+
+        Demonstrates:
+        - concurrent.futures.ProcessPoolExecutor
+        - Split-apply-merge aggregation
+        """
+        try:
+            start = _parse_date(start_date) if start_date else _MIN_ORDINAL
+            end = _parse_date(end_date) if end_date else _MAX_ORDINAL
+        except ValueError:
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return None
+        wanted_codes = self._category_filter_codes(category)
+        store = self.expenses
+
+        if workers and workers > 1:
+            with self._lock:
+                visible_rows = self._visible_rows
+                dead = sorted(row for row in store.dead_rows if row < visible_rows)
+            _count_scanned(visible_rows)
+            partials = self._scan_in_parallel(_aggregate_partition, workers, start, end, wanted_codes,
+                                              rows=visible_rows)
+            if dead:
+                # The partitions included dead rows; take their totals back out
+                dead_cents, dead_counts = _aggregate_partition(
+                    [store.dates[row] for row in dead], [store.amounts[row] for row in dead],
+                    [store.category_codes[row] for row in dead], start, end, wanted_codes)
+                partials.append(({code: -cents for code, cents in dead_cents.items()},
+                                 {code: -rows for code, rows in dead_counts.items()}))
+        elif start_date or end_date or wanted_codes is not None:
+            # Add up the precomputed totals of the fewest year, month and day
+            # buckets that cover the range, so no expense is visited
+            tables = self._rollup_tables()
+
+            def total_buckets():
+                partial_cents: Dict[int, int] = {}
+                partial_counts: Dict[int, int] = {}
+                years = tables[3]
+                if not years:
+                    return [(partial_cents, partial_counts)]
+                first = max(start, Date(min(years), 1, 1).toordinal())
+                last = min(end, Date(max(years), 12, 31).toordinal())
+                for level, key in _period_cover(first, last):
+                    bucket = tables[level].get(key)
+                    if not bucket:
+                        continue
+                    for code, (cents, rows) in bucket.items():
+                        if rows and (wanted_codes is None or code in wanted_codes):
+                            partial_cents[code] = partial_cents.get(code, 0) + cents
+                            partial_counts[code] = partial_counts.get(code, 0) + rows
+                return [(partial_cents, partial_counts)]
+
+            partials = self._cached('summary', start if start_date else None, end if end_date else None,
+                                    category, lambda: self._optimistic_read(total_buckets),
+                                    lambda result: 100 * len(result[0][0]))
+        else:
+            # No filters: the running totals already hold the answer
+            partials = self._optimistic_read(lambda: [
+                ({code: cents for code, cents in enumerate(self._category_cents)
+                  if self._category_counts[code]},
+                 {code: rows for code, rows in enumerate(self._category_counts) if rows})])
+
+        # Merge the partial results in category-code order
+        cents_by_code: Dict[int, int] = {}
+        counts_by_code: Dict[int, int] = {}
+        for partial_cents, partial_counts in partials:
+            for code, cents in partial_cents.items():
+                cents_by_code[code] = cents_by_code.get(code, 0) + cents
+                counts_by_code[code] = counts_by_code.get(code, 0) + partial_counts[code]
+        categories = store.categories
+        ordered = [code for code in sorted(cents_by_code) if counts_by_code[code]]
+        return {
+            'categories': {categories[code]: self._amount(cents_by_code[code], exact) for code in ordered},
+            'counts': {categories[code]: counts_by_code[code] for code in ordered},
+            'total': self._amount(sum(cents_by_code[code] for code in ordered), exact),
+            'count': sum(counts_by_code[code] for code in ordered),
+        }
+
+    def get_rollup(self, granularity: str, start: Optional[str] = None,
+                   end: Optional[str] = None, by_category: bool = True,
+                   exact: bool = False) -> Dict:
+        """
+        Get expense totals per day, week, month or year.
+
+        Totals come from rollup tables that are updated as expenses are
+        added, so a report only visits the buckets it returns.
+
+        Args:
+            granularity (str): 'day', 'week', 'month' or 'year'
+            start (Optional[str]): Include buckets containing or after this date
+            end (Optional[str]): Include buckets containing or before this date
+            by_category (bool): Break each bucket down by category
+            exact (bool): Report Decimal amounts instead of floats
+
+        Returns:
+            Dict: Bucket labels ('2025-05-01', '2025-W18', '2025-05', '2025')
+            in time order, mapped to {category: amount} dictionaries, or to a
+            single amount when by_category is False
+
+        Raises:
+            ValueError: If the granularity is not supported
+
+        Demonstrates:
+        - Precomputed aggregate tables
+        - Nested dictionary comprehensions
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Granularity must be one of: {', '.join(ROLLUP_GRANULARITIES)}")
+        level = ROLLUP_GRANULARITIES.index(granularity)
+        try:
+            first_key = _bucket_keys(_parse_date(start))[level] if start else None
+            last_key = _bucket_keys(_parse_date(end))[level] if end else None
+        except ValueError:
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return {}
+
+        table = self._rollup_tables()[level]
+        categories = self.expenses.categories
+
+        def read_rollup():
+            rollup = {}
+            for key in sorted(table):
+                if (first_key is not None and key < first_key) or (last_key is not None and key > last_key):
+                    continue
+                bucket = {code: cents for code, (cents, rows) in sorted(table[key].items()) if rows}
+                if not bucket:
+                    continue
+                label = _bucket_label(granularity, key)
+                if by_category:
+                    rollup[label] = {categories[code]: self._amount(cents, exact)
+                                     for code, cents in bucket.items()}
+                else:
+                    rollup[label] = self._amount(sum(bucket.values()), exact)
+            return rollup
+
+        return self._optimistic_read(read_rollup)
+
+    def top_expenses(self, n: int = 10, category: Optional[str] = None) -> List[ExpenseRow]:
+        """
+        Get the largest expenses, overall or within a category.
+
+        Up to TOP_EXPENSES_KEPT expenses per category are kept in bounded
+        heaps updated on every write, so the answer does not depend on the
+        number of expenses. Larger n falls back to one scan of the
+        matching rows.
+
+        Args:
+            n (int): Number of expenses to return
+            category (Optional[str]): Category filter (case-insensitive)
+
+        Returns:
+            List[ExpenseRow]: Expenses by amount, largest first; equal
+            amounts list the most recently added first
+
+        Demonstrates:
+        - Bounded min-heaps for streaming top-N
+        """
+        def largest():
+            if n > TOP_EXPENSES_KEPT:
+                rows = self._matching_rows(None, None, category)
+                amounts = self.expenses.amounts
+                return heapq.nlargest(n, ((amounts[row], row) for row in rows))
+            sketches = self._analytics_sketches(category)
+            if sketches is None:
+                return []
+            return self._optimistic_read(lambda: sketches.top.largest(n))
+
+        store, ranked = self._read_rows(largest)
+        return [ExpenseRow(store, row) for _, row in ranked]
+
+    def amount_quantiles(self, fractions: Iterable[float] = (0.5, 0.95),
+                         category: Optional[str] = None, exact: bool = False) -> Dict[float, object]:
+        """
+        Estimate amount quantiles, such as the median and p95, from a sketch.
+
+        A KLL sketch per category keeps a few hundred amounts however many
+        expenses there are; the reported amount's rank is typically within
+        1% of the requested one.
+
+        Args:
+            fractions (Iterable[float]): Quantiles to report, from 0 to 1
+            category (Optional[str]): Category filter (case-insensitive)
+            exact (bool): Report Decimal amounts instead of floats
+
+        Returns:
+            Dict[float, object]: Each fraction mapped to an amount; empty
+            if no expenses match
+
+        Raises:
+            ValueError: If a fraction is outside 0 to 1
+        """
+        fractions = list(fractions)
+        if any(not 0 <= fraction <= 1 for fraction in fractions):
+            raise ValueError("Quantile fractions must be between 0 and 1")
+        sketches = self._analytics_sketches(category)
+        if sketches is None:
+            return {}
+        values = self._optimistic_read(lambda: sketches.amounts.quantiles(fractions))
+        return {fraction: self._amount(value, exact)
+                for fraction, value in zip(fractions, values) if value is not None}
+
+    def distinct_descriptions(self, category: Optional[str] = None) -> int:
+        """
+        Estimate how many different descriptions have been entered.
+
+        A HyperLogLog sketch per category counts distinct descriptions in
+        4 KiB with a typical error of about 1.6%; small counts are exact
+        in practice.
+
+        Args:
+            category (Optional[str]): Category filter (case-insensitive)
+
+        Returns:
+            int: Estimated number of distinct descriptions
+        """
+        sketches = self._analytics_sketches(category)
+        if sketches is None:
+            return 0
+        return self._optimistic_read(sketches.descriptions.count)
+
+    def add_budget(self, category: Optional[str], limit, period: str = 'month',
+                   callback=None) -> int:
+        """
+        Add a spending limit that raises an alert as soon as it is exceeded.
+
+        The rule covers one category (case-insensitive), or every category
+        when category is None, and each day, week, month or year on its
+        own: a 'month' rule of 2000 on 'Food' alerts the first time a
+        month's Food total goes over 2000, and again in any later month
+        that goes over. A period already over the limit when the rule is
+        added does not alert.
+
+        Rules are checked by every write against the rollup totals, and
+        indexed by category and period, so the cost per expense does not
+        depend on how many rules there are. They last as long as the
+        tracker object and are not saved with a persistent store.
+
+        Args:
+            category (Optional[str]): Category the limit applies to, or
+                None for total spending
+            limit: Amount the period's total may reach without alerting
+            period (str): 'day', 'week', 'month' or 'year'
+            callback: Called with each alert dictionary right after the
+                write that caused it; without one, alerts are queued for
+                get_budget_alerts(). Exceptions it raises reach the caller
+                that added the expenses, which are stored already.
+
+        Returns:
+            int: Rule ID for remove_budget()
+
+        Raises:
+            ValueError: If the period is not supported or the limit is not
+                a non-negative amount
+        """
+        if period not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Period must be one of: {', '.join(ROLLUP_GRANULARITIES)}")
+        try:
+            cents = _to_cents(limit, self.expenses.currency_scale)
+        except (ValueError, TypeError, OverflowError):
+            raise ValueError(f"Invalid budget limit: {limit!r}")
+        if cents < 0:
+            raise ValueError("Budget limit must not be negative")
+        key = _category_key(category, self.category_normalization) if category is not None else None
+        # Window totals are read from the rollup tables
+        self._rollup_tables()
+        with self._lock:
+            if self._budgets is None:
+                self._budgets = _BudgetRules()
+            rule_id = next(self._budgets.ids)
+            self._budgets.add(key, _BudgetRule(rule_id, category, ROLLUP_GRANULARITIES.index(period),
+                                               cents, callback))
+        return rule_id
+
+    def remove_budget(self, rule_id: int) -> bool:
+        """
+        Remove a rule added by add_budget().
+
+        Args:
+            rule_id (int): ID returned by add_budget()
+
+        Returns:
+            bool: True if the rule existed
+        """
+        with self._lock:
+            return self._budgets is not None and self._budgets.remove(rule_id)
+
+    def get_budget_alerts(self) -> List[Dict]:
+        """
+        Return and clear the queued alerts of rules added without a callback.
+
+        Returns:
+            List[Dict]: Alerts in the order they were raised, each with the
+            'rule' ID, its 'category' and 'period', the 'bucket' label of
+            the period that went over ('2025-05', '2025-W18', ...), the
+            'limit' and the period's new 'total'
+        """
+        alerts = []
+        while self._budget_alerts:
+            alerts.append(self._budget_alerts.popleft())
+        return alerts
+
+    def find_duplicates(self) -> Dict:
+        """
+        Report groups of live expenses with the same contents.
+
+        Contents are compared as by add_expenses_bulk() deduplication. One
+        pass over the columns feeds a fresh content hash index, so the
+        report takes O(n) time and a compact table instead of comparing
+        pairs or sorting the expenses.
+
+        Returns:
+            Dict: 'checked' count of live expenses, 'duplicates' count of
+            expenses repeating an earlier one, and 'groups', a sorted list
+            of the sorted expense IDs of each set of copies
+        """
+        def scan():
+            store = self.expenses
+            end = self._visible_rows
+            index = _ContentIndex(end - len(store.dead_rows))
+            copies: Dict[int, List[int]] = {}
+            checked = 0
+            for row, content in self._row_contents(store, 0, end):
+                checked += 1
+                hashed = hash(content)
+                original = self._stored_copy(index, store, content, hashed)
+                if original is None:
+                    index.add(hashed, row)
+                else:
+                    copies.setdefault(original, [original]).append(row)
+            _count_scanned(checked)
+            return checked, list(copies.values())
+
+        store, (checked, groups) = self._read_rows(scan)
+        return {'checked': checked,
+                'duplicates': sum(len(rows) - 1 for rows in groups),
+                'groups': sorted(sorted(map(store.expense_id, rows)) for rows in groups)}
+
+    def verify_summary(self) -> bool:
+        """
+        Check the incremental summary totals against a full recompute.
+
+        Walks every stored expense, so this is meant for tests and periodic
+        consistency checks rather than regular reporting.
+
+        Returns:
+            bool: True if the running totals match the stored expenses
+
+        Demonstrates:
+        - Accumulator pattern over integer columns
+        - zip() for walking parallel columns together
+        """
+        store = self.expenses
+        with self._lock:
+            category_cents = [0] * len(store.categories)
+            category_counts = [0] * len(store.categories)
+            for entries, sign in self._signed_entries(0):
+                for _, code, cents in entries:
+                    category_cents[code] += sign * cents
+                    category_counts[code] += sign
+
+            # Categories that were never written have no running total yet
+            padding = len(category_cents) - len(self._category_cents)
+            consistent = (self._category_cents + [0] * padding == category_cents
+                          and self._category_counts + [0] * padding == category_counts
+                          and self._total_cents == sum(category_cents))
+        if not consistent:
+            print("Warning: Summary totals do not match the stored expenses")
+        return consistent
+
+# ===================================================================
+# LAZY QUERY BUILDER
+# ===================================================================
+
+class ExpenseQuery:
+    """
+    Composable, lazily evaluated query over an ExpenseTracker.
+
+    Each builder method returns a new query, and nothing is read until the
+    query is iterated or counted. Filters are given as field lookups in
+    the style 'field' or 'field__operator':
+
+    - date: exact, lt, lte, gt, gte, between (YYYY-MM-DD strings)
+    - amount: exact, lt, lte, gt, gte, between
+    - category: exact, in (case-insensitive)
+    - description: contains (case-insensitive)
+
+    Plain callables taking an expense are also accepted and applied last.
+
+    When the query runs, the planner picks the cheapest access path: the
+    per-category date indexes for category filters, the date index for date
+    ranges (or date ordering), or a scan of every row. Filters the index
+    cannot answer are checked against the columns of each candidate row.
+    Date ordering follows the index, so a limit stops the read early;
+    ordering on other fields with a limit keeps only a top-N heap.
+
+    Example:
+        tracker.query().where(date__between=("2025-01-01", "2025-03-31"),
+                              category__in={"Food", "Travel"},
+                              amount__gt=20).order_by("-amount").limit(10)
+
+    Demonstrates:
+    - Method chaining with immutable builder objects
+    - The iterator protocol with lazy generators
+    - heapq for merging sorted runs and selecting the top N
+    """
+
+    _LOOKUPS = {
+        'date': ('exact', 'lt', 'lte', 'gt', 'gte', 'between'),
+        'amount': ('exact', 'lt', 'lte', 'gt', 'gte', 'between'),
+        'category': ('exact', 'in'),
+        'description': ('contains',),
+    }
+    ORDER_FIELDS = ('date', 'amount', 'category', 'description')
+
+    def __init__(self, tracker: 'ExpenseTracker'):
+        self._tracker = tracker
+        # Inclusive bounds: day ordinals and cents
+        self._start = _MIN_ORDINAL
+        self._end = _MAX_ORDINAL
+        self._min_cents: Optional[int] = None
+        self._max_cents: Optional[int] = None
+        # Wanted category codes, or None for every category
+        self._codes: Optional[frozenset] = None
+        # Casefolded description substrings and extra predicates
+        self._contains: List[str] = []
+        self._predicates: List = []
+        self._order: Optional[Tuple[str, bool]] = None
+        self._offset = 0
+        self._limit: Optional[int] = None
+
+    def _copy(self) -> 'ExpenseQuery':
+        query = ExpenseQuery.__new__(ExpenseQuery)
+        query.__dict__.update(self.__dict__)
+        query._contains = list(self._contains)
+        query._predicates = list(self._predicates)
+        return query
+
+    # --- builder methods -------------------------------------------------
+
+    def where(self, *predicates, **lookups) -> 'ExpenseQuery':
+        """
+        Return a query that also matches the given conditions.
+
+        Args:
+            *predicates: Callables taking an expense and returning a bool
+            **lookups: Field lookups such as date__gte="2025-01-01",
+                category__in={"Food", "Rent"} or amount__lt=100
+
+        Returns:
+            ExpenseQuery: Narrowed query; conditions are combined with AND
+
+        Raises:
+            ValueError: For an unknown field or operator, or an invalid
+                date or amount
+        """
+        query = self._copy()
+        for predicate in predicates:
+            if not callable(predicate):
+                raise ValueError(f"where() predicates must be callable, not {predicate!r}")
+            query._predicates.append(predicate)
+        for lookup, value in lookups.items():
+            field, _, operator = lookup.partition('__')
+            operator = operator or 'exact'
+            if operator not in self._LOOKUPS.get(field, ()):
+                raise ValueError(f"Unsupported lookup: {lookup}")
+            if field == 'date':
+                query._narrow('_start', '_end', operator, value, self._date_bound)
+            elif field == 'amount':
+                query._narrow('_min_cents', '_max_cents', operator, value, query._amount_bound)
+            elif field == 'category':
+                names = [value] if operator == 'exact' else list(value)
+                codes = frozenset().union(*(self._tracker._category_filter_codes(name) or ()
+                                            for name in names))
+                query._codes = codes if query._codes is None else query._codes & codes
+            else:
+                query._contains.append(str(value).casefold())
+        return query
+
+    @staticmethod
+    def _date_bound(value) -> int:
+        try:
+            return _parse_date(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid date {value!r}. Please use YYYY-MM-DD format.") from None
+
+    def _amount_bound(self, value) -> Decimal:
+        # Not rounded to minor units: _narrow() rounds each bound inwards
+        scale = self._tracker.expenses.currency_scale
+        try:
+            _to_cents(value, scale)
+            exact = Decimal(float.__repr__(value) if isinstance(value, float) else str(value).strip())
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Invalid amount {value!r}") from None
+        return exact.scaleb(scale)
+
+    def _narrow(self, low_name: str, high_name: str, operator: str, value, convert):
+        """
+        Intersect an inclusive [low, high] range with a comparison.
+
+        Bounds between two stored values are rounded towards the inside of
+        the range, so an exact match on one leaves the range empty.
+        """
+        low, high = None, None
+        if operator == 'between':
+            low, high = (convert(bound) for bound in value)
+            low, high = math.ceil(low), math.floor(high)
+        else:
+            bound = convert(value)
+            if operator in ('exact', 'gte'):
+                low = math.ceil(bound)
+            if operator in ('exact', 'lte'):
+                high = math.floor(bound)
+            if operator == 'gt':
+                low = math.floor(bound) + 1
+            if operator == 'lt':
+                high = math.ceil(bound) - 1
+        current_low, current_high = getattr(self, low_name), getattr(self, high_name)
+        if low is not None:
+            setattr(self, low_name, low if current_low is None else max(current_low, low))
+        if high is not None:
+            setattr(self, high_name, high if current_high is None else min(current_high, high))
+
+    def order_by(self, field: str) -> 'ExpenseQuery':
+        """
+        Return a query sorted on one field; prefix it with '-' for descending.
+
+        Equal values keep insertion order, except that '-date' is the exact
+        reverse of 'date' (latest-added first among expenses on one day).
+        """
+        descending = field.startswith('-')
+        name = field.lstrip('-').lower()
+        if name not in self.ORDER_FIELDS:
+            raise ValueError(f"Cannot order by {field!r}; choose from {', '.join(self.ORDER_FIELDS)}")
+        query = self._copy()
+        query._order = (name, descending)
+        return query
+
+    def offset(self, rows: int) -> 'ExpenseQuery':
+        """Return a query that skips its first rows."""
+        if rows < 0:
+            raise ValueError("offset must not be negative")
+        query = self._copy()
+        query._offset = rows
+        return query
+
+    def limit(self, rows: Optional[int]) -> 'ExpenseQuery':
+        """Return a query that yields at most this many rows."""
+        if rows is not None and rows < 0:
+            raise ValueError("limit must not be negative")
+        query = self._copy()
+        query._limit = rows
+        return query
+
+    # --- planning --------------------------------------------------------
+
+    def _date_bounded(self) -> bool:
+        return self._start > _MIN_ORDINAL or self._end < _MAX_ORDINAL
+
+    def _residual(self) -> List[str]:
+        """Describe the conditions checked row by row."""
+        residual = []
+        amount = self._tracker._amount
+        if self._min_cents is not None:
+            residual.append(f"amount >= {amount(self._min_cents, exact=True)}")
+        if self._max_cents is not None:
+            residual.append(f"amount <= {amount(self._max_cents, exact=True)}")
+        residual.extend(f"description contains {text!r}" for text in self._contains)
+        residual.extend(getattr(predicate, '__name__', repr(predicate)) for predicate in self._predicates)
+        return residual
+
+    def _plan(self) -> Tuple[str, int, List]:
+        """
+        Choose an access path.
+
+        Returns:
+            Tuple: Access path name, number of candidate rows it yields, and
+            the index key slices to read (empty for a scan)
+        """
+        tracker = self._tracker
+        if (self._start > self._end or self._codes == frozenset()
+                or (self._min_cents is not None and self._max_cents is not None
+                    and self._min_cents > self._max_cents)):
+            return 'empty', 0, []
+        if self._codes is not None:
+            index = tracker._category_index()
+            slices = []
+            for code in sorted(self._codes):
+                keys, lo, hi = index[code].search(self._start, self._end)
+                if hi > lo:
+                    slices.append((keys, lo, hi))
+            return 'category_index', sum(hi - lo for _, lo, hi in slices), slices
+        if self._date_bounded() or (self._order and self._order[0] == 'date'):
+            index = tracker._date_index()
+            keys, lo, hi = index.search(self._start, self._end)
+            return 'date_index', hi - lo, [(keys, lo, hi)]
+        return 'full_scan', tracker._visible_rows, []
+
+    def explain(self) -> Dict:
+        """
+        Describe how the query would run, without running it.
+
+        Returns:
+            Dict: 'access' path ('category_index', 'date_index', 'full_scan'
+            or 'empty'), 'candidate_rows' read from it, 'residual' filters
+            checked per row, 'order' strategy, 'offset', 'limit' and
+            'stops_early' (whether the limit ends the read early)
+        """
+        access, candidates, _ = self._plan()
+        order = None
+        stops_early = self._limit is not None
+        if self._order:
+            name, descending = self._order
+            direction = 'desc' if descending else 'asc'
+            if name == 'date':
+                order = f"date {direction} (index order)"
+            elif self._limit is not None:
+                order = f"{name} {direction} (top-{self._offset + self._limit} heap)"
+                stops_early = False
+            else:
+                order = f"{name} {direction} (sort)"
+        return {'access': access, 'candidate_rows': candidates, 'residual': self._residual(),
+                'order': order, 'offset': self._offset, 'limit': self._limit,
+                'stops_early': stops_early}
+
+    # --- execution -------------------------------------------------------
 
-def print_summary(summary: Dict):
-    """
-    Print a formatted summary of expenses by category.
+    def _candidate_rows(self, access: str, slices: List) -> Iterable[int]:
+        """Yield candidate row positions, in date order when ordering by date."""
+        by_date = self._order is not None and self._order[0] == 'date'
+        descending = by_date and self._order[1]
+        if access == 'empty':
+            return ()
+        visible_rows = self._tracker._visible_rows
+        if access == 'full_scan':
+            return range(visible_rows)
+        if by_date:
+            # map() binds each slice's key array now; a generator
+            # expression would look the name up only when first run
+            runs = [map(keys.__getitem__, range(hi - 1, lo - 1, -1) if descending else range(lo, hi))
+                    for keys, lo, hi in slices]
+            merged = runs[0] if len(runs) == 1 else heapq.merge(*runs, reverse=descending)
+            rows = (key & _ROW_MASK for key in merged)
+        else:
+            # Insertion order, as get_expenses() returns it
+            rows = sorted(key & _ROW_MASK for keys, lo, hi in slices for key in keys[lo:hi])
+        if self._tracker.thread_safe:
+            # Leave out rows added after the query started
+            rows = (row for row in rows if row < visible_rows)
+        return rows
 
-    Args:
-        summary (Dict): Dictionary containing 'categories' and 'total' keys
-                       where 'categories' maps category names to amounts
+    def _rows(self) -> Tuple[ExpenseStore, Iterator[int]]:
+        """Return the store read and its matching row positions, in the requested order."""
+        store, rows = self._tracker._read_rows(self._planned_rows)
+        dead = store.dead_rows
+        if dead:
+            rows = filterfalse(dead.__contains__, rows)
 
-    Demonstrates:
-    - Python's type hints
-    - Dictionary operations and comprehensions
-    - String formatting with f-strings
-    - Dynamic formatting based on content length
-    """
-    # Check if there are any expenses to display
-    if not summary['categories']:
-        print_no_expenses_message()
-        return
+        # Residual conditions the access path did not already apply; date
+        # and category conditions always select an index
+        amounts = store.amounts
+        if self._min_cents is not None:
+            rows = filter(lambda row, low=self._min_cents: amounts[row] >= low, rows)
+        if self._max_cents is not None:
+            rows = filter(lambda row, high=self._max_cents: amounts[row] <= high, rows)
+        for text in self._contains:
+            rows = filter(lambda row, text=text: text in store.description(row).casefold(), rows)
+        for predicate in self._predicates:
+            rows = filter(lambda row, predicate=predicate: predicate(ExpenseRow(store, row)), rows)
 
-    # Calculate dynamic column width based on longest category name
-    # Demonstrates Python's generator expressions and built-in functions
-    max_category_length = max(len(cat) for cat in summary['categories'].keys()) if summary['categories'] else 0
-    max_category_length = max(max_category_length, len("Category"))
+        stop = None if self._limit is None else self._offset + self._limit
+        if self._order and self._order[0] != 'date':
+            name, descending = self._order
+            if name == 'amount':
+                key = store.amounts.__getitem__
+            elif name == 'category':
+                names = [category.casefold() for category in store.categories]
+                codes = store.category_codes
+                key = lambda row: names[codes[row]]
+            else:
+                key = lambda row: store.description(row).casefold()
+            if stop is None:
+                rows = sorted(rows, key=key, reverse=descending)
+            else:
+                rows = (heapq.nlargest if descending else heapq.nsmallest)(stop, rows, key=key)
+        return store, islice(rows, self._offset, stop)
 
-    # Print formatted header using f-string centering
-    print("\n" + "=" * (max_category_length + 20))
-    print(f"{'EXPENSE SUMMARY':^{max_category_length + 20}}")
-    print("=" * (max_category_length + 20))
+    def _planned_rows(self) -> Iterable[int]:
+        """Plan the query and return the candidate rows of the chosen access path."""
+        access, _, slices = self._plan()
+        return self._candidate_rows(access, slices)
 
-    # Print category breakdown section
-    print("\nCategory Breakdown:")
-    print("-" * (max_category_length + 20))
-    print(f"{'Category':<{max_category_length}} | {'Amount':>10}")
-    print("-" * (max_category_length + 20))
+    def __iter__(self) -> Iterator[ExpenseRow]:
+        store, rows = self._rows()
+        for row in rows:
+            yield ExpenseRow(store, row)
 
-    # Sort categories by amount in descending order
-    # Demonstrates Python's sorted() function with lambda key function
-    sorted_categories = sorted(summary['categories'].items(),
-                             key=lambda x: x[1],  # Sort by amount (second element)
-                             reverse=True)
+    def _index_only(self) -> bool:
+        """Whether the access path alone answers the query."""
+        return not (self._residual() or self._offset or self._limit is not None
+                    or self._tracker.thread_safe or self._tracker.expenses.dead_rows)
 
-    # Print each category with proper alignment
-    # Demonstrates f-string formatting with alignment and precision
-    for category, amount in sorted_categories:
-        print(f"{category:<{max_category_length}} | ${amount:>9.2f}")
+    def count(self) -> int:
+        """Return the number of matching expenses, from the index alone when possible."""
+        if self._index_only():
+            return self._plan()[1]
+        return sum(1 for _ in self._rows()[1])
 
-    # Print total with visual separation
-    print("-" * (max_category_length + 20))
-    print(f"{'TOTAL':<{max_category_length}} | ${summary['total']:>9.2f}")
-    print("=" * (max_category_length + 20))
+    def total(self, exact: bool = False):
+        """Return the sum of the matching expenses' amounts, as a Decimal if exact."""
+        tracker = self._tracker
+        if self._index_only() and self._plan()[0] == 'full_scan':
+            return tracker._amount(tracker._total_cents, exact)
+        store, rows = self._rows()
+        amounts = store.amounts
+        return tracker._amount(sum(amounts[row] for row in rows), exact)
+
+    def __repr__(self) -> str:
+        return f"<ExpenseQuery {self.explain()}>"
+
+# ===================================================================
+# ASYNCIO FACADE
+# ===================================================================
 
-def print_expenses(expenses: List[Dict]):
+class AsyncExpenseTracker:
     """
-    Print a formatted table of expenses.
+    asyncio interface to a thread-safe ExpenseTracker.
 
-    Args:
-        expenses (List[Dict]): List of expense dictionaries with keys:
-                              'Date', 'Amount', 'Category', 'Description'
+    Writes and scans run in an executor thread, so a large query never
+    stalls the event loop. Reads of the running totals take microseconds
+    and are answered directly.
+
+    Example:
+        async with AsyncExpenseTracker() as tracker:
+            await tracker.add_expense("2025-05-01", 12.50, "Food", "Lunch")
+            lunches = await tracker.get_expenses(category="food")
 
     Demonstrates:
-    - List comprehensions for calculating column widths
-    - Dynamic table formatting
-    - String formatting and alignment
-    - Error handling for missing data
+    - async/await coroutines
+    - loop.run_in_executor() for blocking work
+    - Asynchronous context managers
     """
-    # Check if there are expenses to display
-    if not expenses:
-        print_no_expenses_message()
-        return
 
-    # Calculate optimal column widths based on content
-    # Demonstrates Python's list comprehensions and max() function
-    date_width = 12  # Fixed width for YYYY-MM-DD format
-    amount_width = 10
+    def __init__(self, tracker: Optional['ExpenseTracker'] = None, executor=None):
+        """
+        Wrap a tracker for use from asyncio code.
 
-    # Dynamic width calculation for category column
-    category_width = max(len(exp['Category']) for exp in expenses)
-    category_width = max(category_width, len("Category"))
+        Args:
+            tracker (Optional[ExpenseTracker]): Tracker created with
+                thread_safe=True; None creates a new in-memory one
+            executor: concurrent.futures executor for blocking calls
+                (default: the event loop's default thread pool)
 
-    # Dynamic width calculation for description column
-    desc_width = max(len(exp['Description']) for exp in expenses)
-    desc_width = max(desc_width, len("Description"))
+        Raises:
+            ValueError: If the tracker is not thread-safe
+        """
+        if tracker is None:
+            tracker = ExpenseTracker(thread_safe=True)
+        if not tracker.thread_safe:
+            raise ValueError("AsyncExpenseTracker needs an ExpenseTracker created with thread_safe=True")
+        self.tracker = tracker
+        self._executor = executor
 
-    # Calculate total table width including separators
-    total_width = date_width + amount_width + category_width + desc_width + 9  # 9 for separators and spaces
+    async def _run(self, function, *args, **kwargs):
+        """Run a blocking tracker call in the executor and await its result."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(function, *args, **kwargs))
 
-    # Print table header with centered title
-    print("\n" + "=" * total_width)
-    print(f"{'EXPENSE LIST':^{total_width}}")
-    print("=" * total_width)
+    async def add_expense(self, date: str, amount: float, category: str, description: str,
+                          idempotency_key: Optional[str] = None):
+        """Add one expense; see ExpenseTracker.add_expense()."""
+        return await self._run(self.tracker.add_expense, date, amount, category, description,
+                               idempotency_key)
 
-    # Print column headers with proper alignment
-    print(f"{'Date':<{date_width}} | {'Amount':>{amount_width}} | {'Category':<{category_width}} | {'Description':<{desc_width}}")
-    print("-" * total_width)
+    async def add_expenses_bulk(self, source, batch_size: int = 10_000,
+                                deduplicate: Optional[bool] = None) -> Dict:
+        """Add many expenses; see ExpenseTracker.add_expenses_bulk()."""
+        return await self._run(self.tracker.add_expenses_bulk, source, batch_size, deduplicate)
 
-    # Print each expense row
-    # Demonstrates string formatting, type conversion, and error handling
-    for expense in expenses:
-        print(f"{expense['Date']:<{date_width}} | ${float(expense['Amount']):>{amount_width-1}.2f} | "
-              f"{expense['Category']:<{category_width}} | {expense['Description']:<{desc_width}}")
+    async def update_expense(self, expense_id: int, date: Optional[str] = None, amount=None,
+                             category: Optional[str] = None, description: Optional[str] = None) -> bool:
+        """Change a stored expense; see ExpenseTracker.update_expense()."""
+        return await self._run(self.tracker.update_expense, expense_id, date, amount, category, description)
 
-    # Print table footer with count
-    print("=" * total_width)
-    print(f"Total Expenses: {len(expenses)}")
-    print("=" * total_width)
+    async def delete_expense(self, expense_id: int) -> bool:
+        """Delete a stored expense; see ExpenseTracker.delete_expense()."""
+        return await self._run(self.tracker.delete_expense, expense_id)
+
+    async def compact(self) -> int:
+        """Reclaim the space of deleted expenses; see ExpenseTracker.compact()."""
+        return await self._run(self.tracker.compact)
+
+    async def get_expenses(self, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None,
+                           category: Optional[str] = None) -> List[ExpenseRow]:
+        """Get filtered expenses; see ExpenseTracker.get_expenses()."""
+        return await self._run(self.tracker.get_expenses, start_date, end_date, category)
+
+    async def fetch(self, query: ExpenseQuery) -> List[ExpenseRow]:
+        """Run a query from query() and return its expenses as a list."""
+        return await self._run(list, query)
+
+    def query(self) -> ExpenseQuery:
+        """Start a lazy query; run it with fetch()."""
+        return self.tracker.query()
+
+    async def get_summary(self, exact: bool = False) -> Dict:
+        """Get the running totals; see ExpenseTracker.get_summary()."""
+        return self.tracker.get_summary(exact)
+
+    async def search(self, text: str, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None, category: Optional[str] = None,
+                     limit: Optional[int] = 20) -> List[ExpenseRow]:
+        """Search descriptions; see ExpenseTracker.search()."""
+        return await self._run(self.tracker.search, text, start_date, end_date, category, limit)
+
+    async def summarize(self, start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        category: Optional[str] = None,
+                        exact: bool = False) -> Optional[Dict]:
+        """Summarize filtered expenses; see ExpenseTracker.summarize()."""
+        return await self._run(self.tracker.summarize, start_date, end_date, category, exact=exact)
+
+    async def get_rollup(self, granularity: str, start: Optional[str] = None,
+                         end: Optional[str] = None, by_category: bool = True,
+                         exact: bool = False) -> Dict:
+        """Get period totals; see ExpenseTracker.get_rollup()."""
+        return await self._run(self.tracker.get_rollup, granularity, start, end, by_category, exact)
+
+    async def import_expenses(self, path: str, file_format: Optional[str] = None,
+                              chunk_size: int = 10_000, deduplicate: Optional[bool] = None) -> Dict:
+        """Stream expenses in from a file; see ExpenseTracker.import_expenses()."""
+        return await self._run(self.tracker.import_expenses, path, file_format, chunk_size, deduplicate)
+
+    async def find_duplicates(self) -> Dict:
+        """Report repeated expenses; see ExpenseTracker.find_duplicates()."""
+        return await self._run(self.tracker.find_duplicates)
+
+    async def export_expenses(self, path: str, file_format: Optional[str] = None,
+                              start_date: Optional[str] = None, end_date: Optional[str] = None,
+                              category: Optional[str] = None) -> int:
+        """Stream expenses out to a file; see ExpenseTracker.export_expenses()."""
+        return await self._run(self.tracker.export_expenses, path, file_format,
+                               start_date, end_date, category)
+
+    async def close(self):
+        """Snapshot and close the underlying tracker."""
+        await self._run(self.tracker.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
 
 # ===================================================================
-# MAIN EXPENSE TRACKER CLASS
+# SQLITE STORAGE BACKEND
 # ===================================================================
 
-class ExpenseTracker:
+# Schema of an SQLite expense database. Dates are day ordinals and amounts
+# integer minor units, as in the columnar store; category_key holds the
+# casefolded name so category filters can use an index. category_totals
+# keeps the running totals for get_summary(), in first-seen order.
+_SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value)",
+    "CREATE TABLE IF NOT EXISTS expenses (id INTEGER PRIMARY KEY, date INTEGER NOT NULL,"
+    " amount INTEGER NOT NULL, category TEXT NOT NULL, category_key TEXT NOT NULL,"
+    " description TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS expenses_by_date ON expenses (date)",
+    "CREATE INDEX IF NOT EXISTS expenses_by_category ON expenses (category_key, date)",
+    "CREATE TABLE IF NOT EXISTS category_totals (category TEXT PRIMARY KEY,"
+    " amount INTEGER NOT NULL, rows INTEGER NOT NULL)",
+)
+
+_SQLITE_INSERT = ("INSERT INTO expenses (date, amount, category, category_key, description)"
+                  " VALUES (?, ?, ?, ?, ?)")
+
+_SQLITE_ADD_TOTALS = ("INSERT INTO category_totals (category, amount, rows) VALUES (?, ?, ?)"
+                      " ON CONFLICT (category) DO UPDATE SET amount = amount + excluded.amount,"
+                      " rows = rows + excluded.rows")
+
+class SQLiteExpenseTracker:
     """
-    Main class for managing expense data and operations.
+    ExpenseTracker interface backed by an SQLite database file.
 
-    Demonstrates:
-    - Object-oriented programming in Python
-    - Type hints for class attributes and methods
-    - Instance variable initialization
-    - Method organization and encapsulation
+    Expenses live on disk rather than in memory, so the data set can be
+    larger than RAM, and several processes can use the same file: the
+    database runs in write-ahead-log mode, where readers never block the
+    single writer. Filters are answered from indexes on the date and on
+    (casefolded category, date); summaries come from a running totals table
+    updated in the same transaction as each insert.
 
-    Attributes:
-        expenses (List[Dict]): List storing all expense records as dictionaries
+    Results are plain dictionaries with the EXPENSE_FIELDS keys. Category
+    matching is case-insensitive and date bounds are inclusive, as in
+    ExpenseTracker. A tracker object is meant for use by one thread.
+
+    Demonstrates:
+    - The sqlite3 module with parameterized statements
+    - Batched inserts with executemany() inside one transaction
+    - Pushing filters and aggregation down to SQL
     """
 
-    def __init__(self):
+    def __init__(self, path: str, currency_scale: Optional[int] = None,
+                 category_normalization: Optional[str] = None, timeout: float = 30.0):
         """
-        Initialize the ExpenseTracker with an empty list of expenses.
+        Open or create an SQLite expense database.
 
-        Demonstrates:
-        - Constructor method in Python
-        - Type-hinted instance variable
-        - Python's dynamic list initialization
+        Args:
+            path (str): Database file to open or create
+            currency_scale (Optional[int]): Decimal places kept for amounts;
+                a new database records its scale (default 2)
+            category_normalization (Optional[str]): Unicode normal form
+                applied before casefolding categories; a new database
+                records it
+            timeout (float): Seconds to wait for another process's write
+
+        Raises:
+            ValueError: If currency_scale or category_normalization differs
+                from the settings of an existing database
+        """
+        import sqlite3
+
+        self.path = path
+        # Autocommit mode; every write opens its own transaction
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        connection = self._connection
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in _SQLITE_SCHEMA:
+                connection.execute(statement)
+            settings = dict(connection.execute("SELECT name, value FROM settings"))
+            if not settings:
+                settings = {
+                    'currency_scale': _check_currency_scale(
+                        DEFAULT_CURRENCY_SCALE if currency_scale is None else currency_scale),
+                    'category_normalization': category_normalization,
+                }
+                connection.executemany("INSERT INTO settings VALUES (?, ?)", settings.items())
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            connection.close()
+            raise
+
+        if currency_scale is not None and currency_scale != settings['currency_scale']:
+            connection.close()
+            raise ValueError(f"Expense database uses {settings['currency_scale']} decimal places, "
+                             f"not {currency_scale}: {path}")
+        if category_normalization is not None and category_normalization != settings['category_normalization']:
+            connection.close()
+            raise ValueError(f"Expense database matches categories with "
+                             f"{settings['category_normalization'] or 'no'} normalization: {path}")
+        self.currency_scale = settings['currency_scale']
+        self.minor_units = 10 ** self.currency_scale
+        self.category_normalization = settings['category_normalization']
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _amount(self, cents: int, exact: bool = False):
+        """Convert integer minor units to a float or Decimal amount."""
+        if exact:
+            return Decimal(cents).scaleb(-self.currency_scale)
+        return cents / self.minor_units
+
+    def _insert_rows(self, rows: List[Tuple[int, int, str, str]]):
+        """
+        Store validated (ordinal, cents, category, description) rows in one transaction.
+
+        The totals for the batch are combined per category first, so the
+        totals table gets one update per category rather than one per row.
         """
-        self.expenses: List[Dict] = []
+        keys: Dict[str, str] = {}
+        totals: Dict[str, List[int]] = {}
+        for _, cents, category, _ in rows:
+            category_totals = totals.get(category)
+            if category_totals is None:
+                totals[category] = [cents, 1]
+                keys[category] = _category_key(category, self.category_normalization)
+            else:
+                category_totals[0] += cents
+                category_totals[1] += 1
+
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(_SQLITE_INSERT, ((ordinal, cents, category, keys[category], description)
+                                                    for ordinal, cents, category, description in rows))
+            connection.executemany(_SQLITE_ADD_TOTALS, ((category, cents, count)
+                                                        for category, (cents, count) in totals.items()))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
 
     def add_expense(self, date: str, amount: float, category: str, description: str):
         """
-        Add a new expense to the tracker with validation.
+        Add a new expense with the same validation and messages as ExpenseTracker.
 
         Args:
             date (str): Date in YYYY-MM-DD format
-            amount (float): Expense amount (must be positive)
+            amount (float): Expense amount
             category (str): Expense category
             description (str): Expense description
-
-        Demonstrates:
-        - Method parameter type hints
-        - Exception handling with try-except blocks
-        - datetime module for date validation
-        - Dictionary creation and list manipulation
-        - Python's automatic memory management
         """
         try:
-            # Validate date format using datetime.strptime()
-            # Demonstrates Python's datetime module for date parsing
-            datetime.strptime(date, '%Y-%m-%d')
-
-            # Create expense dictionary
-            # Demonstrates Python's dictionary literals and dynamic typing
-            expense = {
-                'Date': date,
-                'Amount': amount,
-                'Category': category,
-                'Description': description
-            }
-
-            # Add to expenses list
-            # Demonstrates Python's list append() method
-            self.expenses.append(expense)
-            print("Expense added successfully!")
-
-        except ValueError:
-            # Handle invalid date format
-            # Demonstrates specific exception handling
+            ordinal = _parse_date(date)
+        except (TypeError, ValueError):
             print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return
+        try:
+            cents = _to_cents(amount, self.currency_scale)
+        except (ValueError, TypeError, OverflowError):
+            print("Error: Please enter a valid amount (number).")
+            return
+        try:
+            self._insert_rows([(ordinal, cents, category, description)])
+            print("Expense added successfully!")
         except Exception as e:
-            # Handle any other unexpected errors
-            # Demonstrates generic exception handling with error message
             print(f"Error adding expense: {str(e)}")
 
-    def get_expenses(self, start_date: Optional[str] = None,
-                    end_date: Optional[str] = None,
-                    category: Optional[str] = None) -> List[Dict]:
+    def add_expenses_bulk(self, source, batch_size: int = 10_000) -> Dict:
         """
-        Get expenses filtered by date range and/or category.
+        Add many expenses, one transaction per batch.
+
+        Args:
+            source: Anything accepted by ExpenseTracker.add_expenses_bulk()
+            batch_size (int): Rows validated and inserted per transaction
+
+        Returns:
+            Dict: Report in the ExpenseTracker.add_expenses_bulk() format
+        """
+        report = {'added': 0, 'rejected': []}
+        for valid, rejected in _validated_batches(source, batch_size, self.currency_scale):
+            if valid:
+                self._insert_rows(valid)
+            report['added'] += len(valid)
+            report['rejected'].extend(rejected)
+        return report
+
+    def import_expenses(self, path: str, file_format: Optional[str] = None,
+                        chunk_size: int = 10_000) -> Dict:
+        """Stream expenses from a CSV or JSON Lines file; see ExpenseTracker.import_expenses()."""
+        return self.add_expenses_bulk(read_expenses(path, file_format), batch_size=chunk_size)
+
+    def _where(self, start_date: Optional[str], end_date: Optional[str],
+               category: Optional[str]) -> Tuple[str, List]:
+        """
+        Build the WHERE clause and parameters for the get_expenses() filters.
+
+        Raises:
+            ValueError: If a date bound is not a valid YYYY-MM-DD date
+        """
+        conditions = []
+        parameters = []
+        if category:
+            conditions.append("category_key = ?")
+            parameters.append(_category_key(category, self.category_normalization))
+        if start_date:
+            conditions.append("date >= ?")
+            parameters.append(_parse_date(start_date))
+        if end_date:
+            conditions.append("date <= ?")
+            parameters.append(_parse_date(end_date))
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def _select(self, start_date: Optional[str], end_date: Optional[str],
+                category: Optional[str]) -> Iterator[Dict]:
+        """
+        Return matching expenses in insertion order as dictionaries.
+
+        The filters are checked when this is called; the rows are then read
+        from the database as the result is iterated.
+
+        Raises:
+            ValueError: If a date bound is not a valid YYYY-MM-DD date
+        """
+        where, parameters = self._where(start_date, end_date, category)
+        cursor = self._connection.execute(
+            "SELECT date, amount, category, description FROM expenses" + where + " ORDER BY id",
+            parameters)
+        minor_units = self.minor_units
+        return ({'Date': _format_date(ordinal), 'Amount': cents / minor_units,
+                 'Category': category_name, 'Description': description}
+                for ordinal, cents, category_name, description in cursor)
+
+    def iter_expenses(self, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None,
+                      category: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Yield filtered expenses one at a time, streaming from the database.
 
         Args:
             start_date (Optional[str]): Start date filter (YYYY-MM-DD)
             end_date (Optional[str]): End date filter (YYYY-MM-DD)
             category (Optional[str]): Category filter (case-insensitive)
+        """
+        try:
+            rows = self._select(start_date, end_date, category)
+        except ValueError:
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return
+        yield from rows
+
+    def get_expenses(self, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None,
+                     category: Optional[str] = None) -> List[Dict]:
+        """
+        Get expenses filtered by date range and/or category.
 
         Returns:
-            List[Dict]: Filtered list of expense dictionaries
+            List[Dict]: Matching expenses in insertion order
+        """
+        return list(self.iter_expenses(start_date, end_date, category))
 
-        Demonstrates:
-        - Optional parameters with default None values
-        - Type hints with Optional type
-        - List filtering with conditional logic
-        - Date comparison using datetime objects
-        - Case-insensitive string comparison
-        - Exception handling within loops
+    def export_expenses(self, path: str, file_format: Optional[str] = None,
+                        start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        category: Optional[str] = None) -> int:
         """
-        filtered_expenses = []
+        Stream filtered expenses to a CSV or JSON Lines file.
 
-        # Iterate through all expenses
-        # Demonstrates Python's for loop and list iteration
-        for expense in self.expenses:
-            try:
-                # Parse expense date for comparison
-                # Demonstrates datetime object creation and comparison
-                expense_date = datetime.strptime(expense['Date'], '%Y-%m-%d')
-
-                # Apply start date filter if provided
-                if start_date:
-                    start = datetime.strptime(start_date, '%Y-%m-%d')
-                    if expense_date < start:
-                        continue  # Skip this expense
-
-                # Apply end date filter if provided
-                if end_date:
-                    end = datetime.strptime(end_date, '%Y-%m-%d')
-                    if expense_date > end:
-                        continue  # Skip this expense
-
-                # Apply category filter if provided (case-insensitive)
-                # Demonstrates string method chaining and comparison
-                if category and expense['Category'].lower() != category.lower():
-                    continue  # Skip this expense
-
-                # If all filters pass, add to results
-                filtered_expenses.append(expense)
-
-            except ValueError:
-                # Handle invalid date in stored expense
-                # Demonstrates error handling with .get() method for safe dictionary access
-                print(f"Warning: Skipping expense with invalid date: {expense.get('Date', 'Unknown')}")
-                continue
+        Raises:
+            ValueError: If a date bound is not a valid YYYY-MM-DD date
+        """
+        return write_expenses(self._select(start_date, end_date, category), path, file_format,
+                              self.currency_scale)
+
+    def get_summary(self, exact: bool = False) -> Dict:
+        """
+        Generate the summary of expenses by category from the running totals.
 
-        return filtered_expenses
+        Args:
+            exact (bool): Report Decimal amounts instead of floats
 
-    def get_summary(self) -> Dict:
+        Returns:
+            Dict: Summary containing 'categories' dict and 'total'
         """
-        Generate summary of expenses by category and calculate total.
+        totals = self._connection.execute(
+            "SELECT category, amount FROM category_totals WHERE rows > 0 ORDER BY rowid").fetchall()
+        return {
+            'categories': {category: self._amount(cents, exact) for category, cents in totals},
+            'total': self._amount(sum(cents for _, cents in totals), exact),
+        }
+
+    def summarize(self, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None,
+                  category: Optional[str] = None,
+                  exact: bool = False) -> Optional[Dict]:
+        """
+        Summarize the expenses that pass the get_expenses() filters.
 
         Returns:
-            Dict: Summary containing 'categories' dict and 'total' float
+            Optional[Dict]: 'categories' totals, per-category 'counts',
+            'total' and 'count', or None if a date bound is invalid
+        """
+        try:
+            where, parameters = self._where(start_date, end_date, category)
+        except ValueError:
+            print("Error: Invalid date format. Please use YYYY-MM-DD format.")
+            return None
+        totals = self._connection.execute(
+            "SELECT category, SUM(amount), COUNT(*) FROM expenses" + where
+            + " GROUP BY category ORDER BY MIN(id)", parameters).fetchall()
+        return {
+            'categories': {name: self._amount(cents, exact) for name, cents, _ in totals},
+            'counts': {name: rows for name, _, rows in totals},
+            'total': self._amount(sum(cents for _, cents, _ in totals), exact),
+            'count': sum(rows for _, _, rows in totals),
+        }
 
-        Demonstrates:
-        - Dictionary initialization and manipulation
-        - Nested dictionary operations
-        - Type conversion and validation
-        - Accumulator pattern for calculations
-        - Exception handling for data integrity
-        """
-        # Initialize summary structure
-        # Demonstrates nested dictionary initialization
-        summary = {'categories': {}, 'total': 0}
-
-        # Process each expense
-        for expense in self.expenses:
-            try:
-                # Extract and validate amount
-                # Demonstrates type conversion and error handling
-                amount = float(expense['Amount'])
-                category = expense['Category']
-
-                # Update category total
-                # Demonstrates dictionary key checking and accumulation
-                if category not in summary['categories']:
-                    summary['categories'][category] = 0
-                summary['categories'][category] += amount
-
-                # Update overall total
-                summary['total'] += amount
-
-            except (ValueError, KeyError):
-                # Handle invalid expense data
-                # Demonstrates multiple exception types in one except block
-                print(f"Warning: Skipping invalid expense entry")
+# ===================================================================
+# NON-INTERACTIVE COMMAND-LINE INTERFACE
+# ===================================================================
+
+# Output formats of the list, summary and rollup commands
+OUTPUT_FORMATS = ('table', 'csv', 'json')
+
+def _date_argument(text: str) -> str:
+    """Check a YYYY-MM-DD command-line argument, leaving it as text."""
+    try:
+        _parse_date(text)
+    except ValueError:
+        import argparse
+        raise argparse.ArgumentTypeError(f"invalid date '{text}', expected YYYY-MM-DD")
+    return text
+
+def _build_parser(only: Optional[str] = None):
+    """
+    Create the argument parser for the non-interactive commands.
+
+    Args:
+        only (Optional[str]): Build a parser for just this command, when it
+            is one; defining every command costs more than a quick
+            command's own work
+    """
+    import argparse
+
+    def add_filters(command, category=True):
+        command.add_argument('--start', type=_date_argument, help="start date (YYYY-MM-DD)")
+        command.add_argument('--end', type=_date_argument, help="end date (YYYY-MM-DD)")
+        if category:
+            command.add_argument('--category', help="category filter (case-insensitive)")
+
+    def add_output(command):
+        command.add_argument('--output', choices=OUTPUT_FORMATS, default='table', help="output format")
+
+    def define_add(command):
+        command.add_argument('date', type=_date_argument, help="date (YYYY-MM-DD)")
+        command.add_argument('amount', help="amount")
+        command.add_argument('category', help="category")
+        command.add_argument('description', help="description")
+
+    def define_import(command):
+        command.add_argument('file', help="file to read, '-' for standard input")
+        command.add_argument('--format', choices=FILE_FORMATS, help="input format (default: from extension)")
+        command.add_argument('--chunk-size', type=int, default=10_000, help="rows per batch")
+        command.add_argument('--skip-duplicates', action='store_true',
+                             help="skip rows matching an expense already in the store")
+        command.add_argument('--currency-scale', type=int,
+                             help="decimal places kept for amounts in a new store (default: 2)")
+
+    def define_export(command):
+        command.add_argument('file', help="file to write, '-' for standard output")
+        command.add_argument('--format', choices=FILE_FORMATS, help="output format (default: from extension)")
+        add_filters(command)
+
+    def define_list(command):
+        add_filters(command)
+        command.add_argument('--limit', type=int, help="print at most this many expenses")
+        add_output(command)
+
+    def define_summary(command):
+        add_filters(command)
+        add_output(command)
+
+    def define_rollup(command):
+        command.add_argument('granularity', choices=ROLLUP_GRANULARITIES)
+        add_filters(command, category=False)
+        command.add_argument('--by-category', action='store_true', help="break each period down by category")
+        add_output(command)
+
+    def define_batch(command):
+        command.add_argument('script', nargs='?', default='-', help="script to read, '-' for standard input")
+
+    definitions = (
+        ('add', "add one expense", define_add),
+        ('import', "stream a CSV or JSON Lines file into a store", define_import),
+        ('export', "stream expenses to a CSV or JSON Lines file", define_export),
+        ('list', "print the expenses that pass the filters", define_list),
+        ('summary', "print totals by category", define_summary),
+        ('rollup', "print totals per day, week, month or year", define_rollup),
+        ('batch', "run one command per line from a script", define_batch),
+    )
+
+    def define_command(command, name, define):
+        if name == 'batch':
+            command.add_argument('--db', help="store for commands without their own --db "
+                                              "(default: an in-memory tracker)")
+        else:
+            command.add_argument('--db', help="expense store directory (required outside batch scripts)")
+        define(command)
+
+    for name, help, define in definitions:
+        if name == only:
+            # A parser for just this command; usage and errors read the same
+            command = argparse.ArgumentParser(prog=f"expense_tracker {name}", description=help)
+            command.set_defaults(command=name)
+            define_command(command, name, define)
+            return command
+
+    parser = argparse.ArgumentParser(
+        prog='expense_tracker',
+        description="Expense tracker. Run without arguments for the interactive menu.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help, define in definitions:
+        define_command(commands.add_parser(name, help=help), name, define)
+    return parser
+
+def _print_listing(expenses: Iterable[Mapping], output: str, limit: Optional[int],
+                   currency_scale: int = DEFAULT_CURRENCY_SCALE):
+    """Print expenses as a table, CSV or a JSON array."""
+    if limit is not None:
+        expenses = islice(expenses, limit)
+    if output == 'table':
+        print_expenses(expenses, currency_scale=currency_scale)
+    elif output == 'csv':
+        import csv
+
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(EXPENSE_FIELDS)
+        writer.writerows((expense['Date'], f"{expense['Amount']:.{currency_scale}f}",
+                          expense['Category'], expense['Description']) for expense in expenses)
+    else:
+        import json
+
+        # Streamed element by element, so long listings are never collected
+        separator = '\n'
+        sys.stdout.write('[')
+        for expense in expenses:
+            sys.stdout.write(separator + json.dumps(dict(expense), ensure_ascii=False))
+            separator = ',\n'
+        sys.stdout.write('\n]\n')
+
+def _print_report(report: Dict, output: str, columns: Tuple[str, ...], rows: Iterable[Tuple]):
+    """Print a summary or rollup as CSV or JSON; tables are left to the caller."""
+    if output == 'json':
+        import json
+
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    import csv
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(columns)
+    writer.writerows(rows)
+
+def _run_summary(tracker: 'ExpenseTracker', args) -> int:
+    """Print the summary command's report."""
+    if args.start or args.end or args.category:
+        summary = tracker.summarize(args.start, args.end, args.category)
+    else:
+        # Unfiltered totals are kept up to date, so nothing is added up
+        summary = tracker.get_summary()
+    scale = tracker.expenses.currency_scale
+    if args.output == 'table':
+        print_summary(summary, scale)
+        return 0
+    # Filtered summaries also count the expenses in each category
+    counted = 'counts' in summary
+    rows = [(category, f"{amount:.{scale}f}") + ((summary['counts'][category],) if counted else ())
+            for category, amount in summary['categories'].items()]
+    rows.append(('TOTAL', f"{summary['total']:.{scale}f}") + ((summary['count'],) if counted else ()))
+    _print_report(summary, args.output, ('Category', 'Amount') + (('Count',) if counted else ()), rows)
+    return 0
+
+def _run_rollup(tracker: 'ExpenseTracker', args) -> int:
+    """Print the rollup command's report."""
+    rollup = tracker.get_rollup(args.granularity, args.start, args.end, by_category=args.by_category)
+    scale = tracker.expenses.currency_scale
+    if args.by_category:
+        rows = [(period, category, f"{amount:.{scale}f}")
+                for period, bucket in rollup.items() for category, amount in bucket.items()]
+        columns = ('Period', 'Category', 'Amount')
+    else:
+        rows = [(period, f"{amount:.{scale}f}") for period, amount in rollup.items()]
+        columns = ('Period', 'Amount')
+    if args.output != 'table':
+        _print_report(rollup, args.output, columns, rows)
+        return 0
+    if not rows:
+        print_no_expenses_message()
+        return 0
+    widths = [max(len(column), *(len(str(row[i])) for row in rows)) for i, column in enumerate(columns)]
+    lines = [" | ".join(f"{column:<{width}}" for column, width in zip(columns, widths)),
+             "-+-".join("-" * width for width in widths)]
+    lines.extend(" | ".join(f"{value:>{width}}" if i == len(row) - 1 else f"{value:<{width}}"
+                            for i, (value, width) in enumerate(zip(row, widths)))
+                 for row in rows)
+    print("\n".join(lines))
+    return 0
+
+def _run_batch(parser, args, trackers: Dict) -> int:
+    """
+    Run the commands in a batch script against trackers kept open throughout.
+
+    Each line holds one command in shell syntax, without the program name;
+    blank lines and '#' comments are skipped. Commands without --db use the
+    batch's --db, or a shared in-memory tracker. The batch stops at the
+    first command that fails.
+    """
+    import shlex
+
+    with _open_text(args.script, 'r') as handle:
+        for line_number, line in enumerate(handle, 1):
+            argv = shlex.split(line, comments=True)
+            if not argv:
                 continue
+            try:
+                command = parser.parse_args(argv)
+            except SystemExit as e:
+                print(f"Error: line {line_number}: invalid command", file=sys.stderr)
+                return e.code or 2
+            if command.command == 'batch':
+                print(f"Error: line {line_number}: batch scripts cannot run 'batch'", file=sys.stderr)
+                return 2
+            if command.db is None:
+                command.db = args.db
+            status = _run_single(command, trackers)
+            if status:
+                print(f"Error: line {line_number}: '{line.strip()}' failed", file=sys.stderr)
+                return status
+    return 0
+
+def _run_single(args, trackers: Dict) -> int:
+    """
+    Run one parsed command other than 'batch'.
+
+    Trackers are opened on first use and cached in trackers by store
+    directory (None for the in-memory tracker), so later commands in the
+    same process reuse them.
+    """
+    try:
+        tracker = trackers.get(args.db)
+        if tracker is None:
+            tracker = trackers[args.db] = ExpenseTracker(
+                args.db, sync_every=0, currency_scale=getattr(args, 'currency_scale', None))
+
+        if args.command == 'add':
+            report = tracker.add_expenses_bulk([(args.date, args.amount, args.category, args.description)])
+            for rejected in report['rejected']:
+                print(f"Error: {rejected['reason']}", file=sys.stderr)
+            return 1 if report['rejected'] else 0
+
+        if args.command == 'import':
+            report = tracker.import_expenses(args.file, args.format, args.chunk_size,
+                                             deduplicate=args.skip_duplicates)
+            skipped = f", skipped {report['duplicates']} duplicates" if args.skip_duplicates else ""
+            print(f"Imported {report['added']} expenses{skipped}, rejected {len(report['rejected'])}.",
+                  file=sys.stderr)
+            for rejected in report['rejected'][:10]:
+                print(f"  row {rejected['row']}: {rejected['reason']}", file=sys.stderr)
+            return 1 if report['rejected'] else 0
 
-        return summary
+        if args.command == 'export':
+            written = tracker.export_expenses(args.file, args.format,
+                                              args.start, args.end, args.category)
+            print(f"Exported {written} expenses.", file=sys.stderr)
+            return 0
+
+        if args.command == 'list':
+            _print_listing(tracker.iter_expenses(args.start, args.end, args.category),
+                           args.output, args.limit, tracker.expenses.currency_scale)
+            return 0
+
+        if args.command == 'summary':
+            return _run_summary(tracker, args)
+
+        return _run_rollup(tracker, args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+def run_command(argv: List[str]) -> int:
+    """
+    Run one non-interactive command such as 'summary' or 'import'.
+
+    A 'batch' command runs a whole script of commands in this one process,
+    so start-up and opening the store are paid once rather than per command.
+
+    Args:
+        argv (List[str]): Command-line arguments after the program name
+
+    Returns:
+        int: Process exit status
+    """
+    parser = _build_parser(argv[0])
+    # A single-command parser only sees that command's arguments
+    args = parser.parse_args(argv[1:] if parser.get_default('command') else argv)
+    if args.command != 'batch' and args.db is None:
+        parser.error("the following arguments are required: --db")
+    trackers: Dict[Optional[str], ExpenseTracker] = {}
+    try:
+        if args.command == 'batch':
+            # Script lines may use any command
+            return _run_batch(_build_parser(), args, trackers)
+        return _run_single(args, trackers)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        for tracker in trackers.values():
+            tracker.close()
 
 # ===================================================================
 # MAIN PROGRAM EXECUTION
 # ===================================================================
 
-def main():
+def main(argv: Optional[List[str]] = None) -> int:
     """
     Main program function that handles the user interface and program flow.
 
+    With command-line arguments, runs a single non-interactive command
+    through run_command(); otherwise starts the interactive menu.
+
+    Args:
+        argv (Optional[List[str]]): Arguments to use instead of sys.argv[1:]
+
+    Returns:
+        int: Process exit status
+
     Demonstrates:
     - Function-based program organization
     - Infinite loop with break condition
@@ -355,6 +5866,11 @@ def main():
     - Exception handling for user interruption
     - Input parsing and type conversion
     """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv:
+        return run_command(argv)
+
     # Display welcome banner
     print_banner()
 
@@ -413,22 +5929,28 @@ def main():
                     # Process filter choice
                     if filter_choice == '1':
                         # Get all expenses (no filters)
-                        expenses = tracker.get_expenses()
+                        expenses = tracker.iter_expenses()
                     elif filter_choice == '2':
                         # Get expenses by date range
                         start_date = input("Enter start date (YYYY-MM-DD): ")
                         end_date = input("Enter end date (YYYY-MM-DD): ")
-                        expenses = tracker.get_expenses(start_date, end_date)
+                        expenses = tracker.iter_expenses(start_date, end_date)
                     elif filter_choice == '3':
                         # Get expenses by category
                         category = input("Enter category: ")
-                        expenses = tracker.get_expenses(category=category)
+                        expenses = tracker.iter_expenses(category=category)
                     else:
                         print("Invalid choice!")
                         continue
 
-                    # Display filtered expenses
-                    print_expenses(expenses)
+                    # Stream the filtered expenses, a screenful at a time
+                    # when running in a terminal
+                    page_size = None
+                    if sys.stdin.isatty() and sys.stdout.isatty():
+                        import shutil
+                        page_size = max(shutil.get_terminal_size().lines - 2, 1)
+                    print_expenses(expenses, page_size=page_size, widths=tracker.column_widths(),
+                                   currency_scale=tracker.expenses.currency_scale)
 
                 except ValueError:
                     # Handle invalid date format
@@ -443,7 +5965,7 @@ def main():
                 # Generate and display summary
                 # Demonstrates method chaining and function calls
                 summary = tracker.get_summary()
-                print_summary(summary)
+                print_summary(summary, tracker.expenses.currency_scale)
 
             # Handle Exit option
             elif choice == '4':
@@ -466,6 +5988,8 @@ def main():
             print(f"An unexpected error occurred: {str(e)}")
             print("Please try again.")
 
+    return 0
+
 # ===================================================================
 # PROGRAM ENTRY POINT
 # ===================================================================
@@ -479,4 +6003,4 @@ if __name__ == "__main__":
     - Module vs script execution distinction
     - Program entry point best practices
     """
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,361 @@
+# ===================================================================
+# MSCS 632 Advanced Programming Languages
+# Group Project - Expense Tracker Benchmark Suite
+# Python Implementation Benchmarks
+# ===================================================================
+# Times the tracker's operations on reproducible synthetic data and
+# reports throughput, latency percentiles and peak memory as JSON.
+#
+# Usage:
+#     python expense_tracker_bench.py                      # 10K, 1M, 10M rows
+#     python expense_tracker_bench.py --sizes 10000 -o run.json
+#     python expense_tracker_bench.py --sizes 1000000 --budget 2
+#     python expense_tracker_bench.py --sizes 5000000 --backend sqlite
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date as Date, datetime, timedelta
+from itertools import accumulate, islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from expense_tracker import ExpenseTracker, SQLiteExpenseTracker, print_expenses, print_summary
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Row counts benchmarked when no sizes are given
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+
+# Last day of the generated data; fixed so runs are comparable
+END_DATE = Date(2025, 12, 31)
+
+# Common categories first, so the Zipfian weights make them the most frequent
+CATEGORIES = ('Food', 'Transport', 'Rent', 'Utilities', 'Shopping', 'Entertainment',
+              'Health', 'Travel', 'Education', 'Insurance', 'Gifts', 'Subscriptions',
+              'Pets', 'Childcare', 'Taxes', 'Charity') + tuple(f"Misc {n:02d}" for n in range(1, 25))
+
+# Storage backends that can be benchmarked
+BACKENDS = ('memory', 'sqlite')
+
+# Words combined into descriptions
+DESCRIPTION_WORDS = ('lunch', 'dinner', 'coffee', 'groceries', 'bus', 'train', 'taxi', 'fuel',
+                     'monthly', 'weekly', 'annual', 'online', 'store', 'market', 'ticket',
+                     'pharmacy', 'doctor', 'gym', 'movie', 'concert', 'book', 'course',
+                     'hotel', 'flight', 'rent', 'electricity', 'water', 'internet', 'phone',
+                     'gift', 'donation', 'repair', 'parking', 'snacks', 'bakery', 'deposit')
+
+# ===================================================================
+# SYNTHETIC DATA GENERATION
+# ===================================================================
+
+def generate_expenses(rows: int, seed: int = 632, days: int = 3 * 365,
+                      zipf_exponent: float = 1.1, backdated: float = 0.02) -> Iterator[Tuple]:
+    """
+    Yield reproducible synthetic expenses as (date, amount, category, description).
+
+    Args:
+        rows (int): Number of expenses to generate
+        seed (int): Random seed; the same seed always yields the same data
+        days (int): Number of days covered, ending on END_DATE
+        zipf_exponent (float): Skew of the category distribution
+        backdated (float): Fraction of expenses entered out of date order
+
+    Returns:
+        Iterator[Tuple]: Expense tuples in entry order
+
+    Demonstrates:
+    - Generators for data too large to hold as a list
+    - Seeded random.Random for reproducible runs
+    - Weighted sampling with random.choices
+    """
+    rng = random.Random(seed)
+    category_weights = list(accumulate(1 / rank ** zipf_exponent
+                                       for rank in range(1, len(CATEGORIES) + 1)))
+    first_day = END_DATE - timedelta(days=days - 1)
+
+    # Spending grows over time: day i gets weight proportional to (i + days),
+    # so recent days hold about twice as many expenses as the oldest ones
+    day_weights = list(accumulate(i + days for i in range(days)))
+    rows_per_day = [0] * days
+    for day in rng.choices(range(days), cum_weights=day_weights, k=rows):
+        rows_per_day[day] += 1
+
+    labels = [(first_day + timedelta(days=i)).isoformat() for i in range(days)]
+    for day, day_rows in enumerate(rows_per_day):
+        for _ in range(day_rows):
+            if rng.random() < backdated:
+                # Entered late: dated up to a month before the current day
+                label = labels[max(0, day - rng.randint(1, 30))]
+            else:
+                label = labels[day]
+            amount = round(min(rng.lognormvariate(3.0, 1.0), 99_999.0), 2)
+            category = rng.choices(CATEGORIES, cum_weights=category_weights)[0]
+            if rng.random() < 0.05:
+                description = ""
+            else:
+                words = rng.choices(DESCRIPTION_WORDS, k=rng.randint(1, 5))
+                if rng.random() < 0.2:
+                    words.append(f"#{rng.randint(1, 9999)}")
+                description = " ".join(words).capitalize()
+            yield label, amount, category, description
+
+# ===================================================================
+# MEASUREMENT HELPERS
+# ===================================================================
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+def peak_rss_kb() -> Optional[int]:
+    """Return this process's peak resident set size in KiB, if it can be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def summarize_timings(latencies: List[float], items: int = 0) -> Dict:
+    """
+    Turn per-call latencies into a result record.
+
+    Args:
+        latencies (List[float]): Seconds taken by each call
+        items (int): Rows added or returned over all calls
+
+    Returns:
+        Dict: calls, total_s, ops_per_s, p50_ms, p99_ms, max_ms and,
+        when items were counted, rows and rows_per_s
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    result = {
+        'calls': len(ordered),
+        'total_s': round(total, 6),
+        'ops_per_s': round(len(ordered) / total, 2) if total else None,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 4),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+    if items:
+        result['rows'] = items
+        result['rows_per_s'] = round(items / total, 2) if total else None
+    return result
+
+def time_calls(operation: Callable[[], int], max_calls: int, budget: float) -> Dict:
+    """
+    Call an operation repeatedly and record each call's latency.
+
+    Calls stop after max_calls or once budget seconds have been spent, but
+    the operation always runs at least once, so slow operations on large
+    tables still get measured without stalling the run.
+
+    Args:
+        operation (Callable[[], int]): Runs one call and returns the number
+            of rows it produced
+        max_calls (int): Upper bound on the number of calls
+        budget (float): Seconds after which no further calls are started
+
+    Returns:
+        Dict: Result record from summarize_timings()
+    """
+    latencies = []
+    items = 0
+    spent = 0.0
+    while len(latencies) < max_calls and (not latencies or spent < budget):
+        started = time.perf_counter()
+        items += operation() or 0
+        elapsed = time.perf_counter() - started
+        latencies.append(elapsed)
+        spent += elapsed
+    return summarize_timings(latencies, items)
+
+# ===================================================================
+# BENCHMARK RUN
+# ===================================================================
+
+def run_benchmark(rows: int, seed: int = 632, queries: int = 50, samples: int = 1_000,
+                  budget: float = 5.0, batch_size: int = 100_000, backend: str = 'memory') -> Dict:
+    """
+    Load a tracker with synthetic expenses and time each operation.
+
+    Args:
+        rows (int): Number of expenses to load
+        seed (int): Seed for the data and the query parameters
+        queries (int): Maximum calls per query operation
+        samples (int): Number of single add_expense() calls timed
+        budget (float): Seconds allowed per query operation
+        batch_size (int): Rows per add_expenses_bulk() call while loading
+        backend (str): 'memory' for ExpenseTracker or 'sqlite' for
+            SQLiteExpenseTracker on a temporary database file
+
+    Returns:
+        Dict: 'rows', 'backend', per-operation results under 'operations'
+        and 'peak_rss_kb'
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend must be one of: {', '.join(BACKENDS)}")
+    with tempfile.TemporaryDirectory() as directory:
+        if backend == 'sqlite':
+            tracker = SQLiteExpenseTracker(os.path.join(directory, "bench.db"))
+        else:
+            tracker = ExpenseTracker()
+        with contextlib.closing(tracker):
+            operations = _time_operations(tracker, rows, seed, queries, samples, budget, batch_size)
+    return {'rows': rows, 'backend': backend, 'operations': operations, 'peak_rss_kb': peak_rss_kb()}
+
+def _time_operations(tracker, rows: int, seed: int, queries: int, samples: int,
+                     budget: float, batch_size: int) -> Dict[str, Dict]:
+    """Load an empty tracker and time each operation; see run_benchmark()."""
+    operations: Dict[str, Dict] = {}
+
+    # Bulk load; only the tracker call is timed, not the data generation
+    source = generate_expenses(rows, seed)
+    latencies = []
+    while True:
+        batch = list(islice(source, batch_size))
+        if not batch:
+            break
+        started = time.perf_counter()
+        tracker.add_expenses_bulk(batch)
+        latencies.append(time.perf_counter() - started)
+    operations['add_expenses_bulk'] = summarize_timings(latencies, rows)
+
+    rng = random.Random(seed + 1)
+    first_day = END_DATE - timedelta(days=3 * 365 - 1)
+    samples_source = generate_expenses(samples, seed + 2)
+
+    def random_window(days: int = 30) -> Tuple[str, str]:
+        start = first_day + timedelta(days=rng.randrange(3 * 365 - days))
+        return start.isoformat(), (start + timedelta(days=days - 1)).isoformat()
+
+    def random_category() -> str:
+        # Mostly frequent categories, sometimes a rare one, in mixed case
+        category = CATEGORIES[min(int(rng.expovariate(0.3)), len(CATEGORIES) - 1)]
+        return category.upper() if rng.random() < 0.5 else category
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Single interactive-style inserts into the loaded table
+        sample_rows = list(samples_source)
+        operations['add_expense'] = time_calls(
+            lambda: tracker.add_expense(*sample_rows.pop()) or 1,
+            len(sample_rows), float('inf'))
+
+        operations['get_expenses[all]'] = time_calls(
+            lambda: len(tracker.get_expenses()), queries, budget)
+        operations['get_expenses[date]'] = time_calls(
+            lambda: len(tracker.get_expenses(*random_window())), queries, budget)
+        operations['get_expenses[category]'] = time_calls(
+            lambda: len(tracker.get_expenses(category=random_category())), queries, budget)
+        operations['get_expenses[date+category]'] = time_calls(
+            lambda: len(tracker.get_expenses(*random_window(), random_category())), queries, budget)
+        if hasattr(tracker, 'query'):
+            operations['query[date+category,newest 20]'] = time_calls(
+                lambda: sum(1 for _ in tracker.query().where(date__between=random_window(365),
+                                                             category=random_category())
+                            .order_by('-date').limit(20)), queries, budget)
+        operations['summarize[date]'] = time_calls(
+            lambda: tracker.summarize(*random_window())['count'], queries, budget)
+        operations['get_summary'] = time_calls(
+            lambda: len(tracker.get_summary()['categories']), queries, budget)
+
+        # Printing is timed on its own; the rows are fetched beforehand
+        month = tracker.get_expenses(*random_window())
+        operations['print_expenses[month]'] = time_calls(
+            lambda: print_expenses(month) or len(month), queries, budget)
+        # Streaming the first screenful of the whole table should not
+        # depend on its size
+        widths = tracker.column_widths() if hasattr(tracker, 'column_widths') else None
+        operations['print_expenses[all,head]'] = time_calls(
+            lambda: print_expenses(tracker.iter_expenses(), limit=50, widths=widths) or 50,
+            queries, budget)
+        summary = tracker.get_summary()
+        operations['print_summary'] = time_calls(
+            lambda: print_summary(summary) or len(summary['categories']), queries, budget)
+
+    return operations
+
+def run_suite(sizes: List[int], isolate: bool = True, **options) -> Dict:
+    """
+    Benchmark each table size and collect the results with run metadata.
+
+    Args:
+        sizes (List[int]): Row counts to benchmark
+        isolate (bool): Run each size in a fresh worker process, so peak RSS
+            and allocator state are not carried over between sizes
+        **options: Keyword arguments passed on to run_benchmark()
+
+    Returns:
+        Dict: Machine-readable report
+    """
+    results = []
+    for rows in sizes:
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results.append(pool.submit(run_benchmark, rows, **options).result())
+        else:
+            results.append(run_benchmark(rows, **options))
+    return {
+        'benchmark': 'expense_tracker',
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': options,
+        'results': results,
+    }
+
+def print_report(report: Dict, stream=sys.stderr):
+    """Print a human-readable table of a benchmark report."""
+    for result in report['results']:
+        print(f"\n{result['rows']:,} rows, {result.get('backend', 'memory')} backend "
+              f"(peak RSS {result['peak_rss_kb'] or 0:,} KiB)", file=stream)
+        print(f"{'Operation':<34} {'Calls':>7} {'Ops/s':>12} {'p50 ms':>10} {'p99 ms':>10}", file=stream)
+        for name, timing in result['operations'].items():
+            print(f"{name:<34} {timing['calls']:>7} {timing['ops_per_s'] or 0:>12,.1f} "
+                  f"{timing['p50_ms']:>10.3f} {timing['p99_ms']:>10.3f}", file=stream)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Parse arguments, run the benchmarks and write the JSON report."""
+    parser = argparse.ArgumentParser(description="Benchmark the expense tracker on synthetic data.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="row counts to benchmark (default: 10000 1000000 10000000)")
+    parser.add_argument('--seed', type=int, default=632, help="random seed for data and queries")
+    parser.add_argument('--queries', type=int, default=50, help="maximum calls per query operation")
+    parser.add_argument('--samples', type=int, default=1_000, help="single add_expense() calls to time")
+    parser.add_argument('--budget', type=float, default=5.0, help="seconds allowed per query operation")
+    parser.add_argument('--backend', choices=BACKENDS, default='memory',
+                        help="storage backend to benchmark (default: memory)")
+    parser.add_argument('--no-isolate', action='store_true',
+                        help="run every size in this process instead of a fresh one")
+    parser.add_argument('-o', '--output', default='-', help="JSON report file, '-' for standard output")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.sizes, isolate=not args.no_isolate, seed=args.seed,
+                       queries=args.queries, samples=args.samples, budget=args.budget,
+                       backend=args.backend)
+    print_report(report)
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
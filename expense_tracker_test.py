@@ -6,8 +6,27 @@
 
 import unittest
 from datetime import datetime
+from decimal import Decimal
+import contextlib
+import io
+import json
+import os
 import sys
-from expense_tracker import ExpenseTracker
+import tempfile
+import threading
+import asyncio
+from collections import Counter
+from itertools import count
+from unittest import mock
+from expense_tracker import (AsyncExpenseTracker, ExpenseTracker, ExpenseStore, HyperLogLog,
+                             KLLSketch, SQLiteExpenseTracker, main, print_expenses, print_summary,
+                             read_expenses, _parse_date)
+from expense_tracker_bench import generate_expenses, run_suite
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TestExpenseTracker(unittest.TestCase):
@@ -19,7 +38,7 @@ class TestExpenseTracker(unittest.TestCase):
 
     def test_initialization(self):
         """Test that ExpenseTracker initializes correctly."""
-        self.assertIsInstance(self.tracker.expenses, list)
+        self.assertIsInstance(self.tracker.expenses, ExpenseStore)
         self.assertEqual(len(self.tracker.expenses), 0)
         print("✓ Initialization test passed")
 
@@ -46,6 +65,26 @@ class TestExpenseTracker(unittest.TestCase):
         self.assertEqual(len(self.tracker.expenses), initial_count)
         print("✓ Invalid date handling test passed")
 
+    def test_date_parsing_matches_strptime(self):
+        """Test that the fast date parser accepts exactly what strptime() accepts."""
+        samples = ["2025-05-01", "2024-02-29", "2025-02-29", "2025-13-01", "2025-00-10",
+                   "2025-04-31", "0000-01-01", "0001-01-01", "9999-12-31", "2025-5-1",
+                   "2025-05- 1", "2025-+5-01", "2025_05_01", "2025-05-01 ", " 2025-05-01",
+                   "20250501", "2025-W18-1", "２０２５-05-01", "2025-0--01", "", "invalid-date"]
+        for text in samples:
+            try:
+                expected = datetime.strptime(text, "%Y-%m-%d").toordinal()
+            except ValueError:
+                expected = ValueError
+            try:
+                parsed = _parse_date(text)
+            except ValueError:
+                parsed = ValueError
+            self.assertEqual(parsed, expected, text)
+        with self.assertRaises(TypeError):
+            _parse_date(None)
+        print("✓ Date parsing test passed")
+
     def test_get_all_expenses(self):
         """Test retrieving all expenses."""
         # Add sample expenses
@@ -114,6 +153,1182 @@ class TestExpenseTracker(unittest.TestCase):
         self.assertEqual(summary['total'], 0)
         print("✓ Empty tracker test passed")
 
+    def test_date_range_out_of_order_inserts(self):
+        """Test date range filtering when expenses arrive out of date order."""
+        self.tracker.add_expense("2025-05-10", 10.00, "Food", "Late")
+        self.tracker.add_expense("2025-05-01", 20.00, "Food", "Early")
+        self.tracker.add_expense("2025-05-05", 30.00, "Transport", "Middle")
+        self.tracker.add_expense("2025-04-30", 40.00, "Food", "Before")
+
+        filtered = self.tracker.get_expenses("2025-05-01", "2025-05-05")
+        # Results keep insertion order, like a full scan would
+        self.assertEqual([e['Description'] for e in filtered], ["Early", "Middle"])
+
+        # Bounds are inclusive and may be used on their own
+        self.assertEqual(len(self.tracker.get_expenses(start_date="2025-05-05")), 2)
+        self.assertEqual(len(self.tracker.get_expenses(end_date="2025-05-01")), 2)
+        self.assertEqual(len(self.tracker.get_expenses("2025-05-01", "2025-05-10", "food")), 2)
+        print("✓ Out-of-order date range test passed")
+
+    def test_filter_with_invalid_date_bound(self):
+        """Test that an invalid date bound returns no expenses."""
+        self.tracker.add_expense("2025-05-01", 15.99, "Food", "Lunch")
+
+        self.assertEqual(self.tracker.get_expenses("05/01/2025"), [])
+        print("✓ Invalid date bound test passed")
+
+    def test_row_view_behaves_like_dict(self):
+        """Test that stored expenses read like the original dictionaries."""
+        self.tracker.add_expense("2025-05-01", 15.99, "Food", "Café lunch")
+
+        expense = self.tracker.expenses[0]
+        self.assertEqual(expense, {'Date': "2025-05-01", 'Amount': 15.99,
+                                   'Category': "Food", 'Description': "Café lunch"})
+        self.assertEqual(expense.get('Missing', 'Unknown'), 'Unknown')
+        self.assertEqual(list(expense.keys()), ['Date', 'Amount', 'Category', 'Description'])
+        with self.assertRaises(KeyError):
+            expense['Missing']
+        print("✓ Row view test passed")
+
+    def test_invalid_amount_rejected(self):
+        """Test that non-numeric amounts are not stored."""
+        self.tracker.add_expense("2025-05-01", "abc", "Food", "Lunch")
+
+        self.assertEqual(len(self.tracker.expenses), 0)
+        print("✓ Invalid amount handling test passed")
+
+    def test_columnar_store_encoding(self):
+        """Test that categories are dictionary-encoded in the store."""
+        for day in range(1, 21):
+            self.tracker.add_expense(f"2025-05-{day:02d}", day, "Food" if day % 2 else "Rent", "x")
+
+        store = self.tracker.expenses
+        self.assertEqual(store.categories, ["Food", "Rent"])
+        self.assertEqual(len(store.category_codes), 20)
+        self.assertEqual(store.amounts[0], 100)
+        self.assertLess(store.memory_usage(), 20 * 40)
+        print("✓ Columnar store encoding test passed")
+
+    def test_incremental_summary_consistency(self):
+        """Test that running summary totals match a full recompute."""
+        for i in range(50):
+            self.tracker.add_expense(f"2025-05-{i % 28 + 1:02d}", 0.1 * i, ["Food", "Rent", "Fun"][i % 3], "x")
+
+        self.assertTrue(self.tracker.verify_summary())
+        summary = self.tracker.get_summary()
+        self.assertEqual(list(summary['categories']), ["Food", "Rent", "Fun"])
+        self.assertAlmostEqual(summary['total'], 122.5, places=2)
+
+        # Corrupted totals are detected
+        self.tracker._total_cents += 1
+        self.assertFalse(self.tracker.verify_summary())
+        print("✓ Incremental summary consistency test passed")
+
+    def test_bulk_add_reports_rejected_rows(self):
+        """Test bulk ingest of tuples and mappings with a rejection report."""
+        rows = [
+            ("2025-05-02", 50.00, "Transport", "Gas"),
+            {'Date': "2025-05-01", 'Amount': "15.99", 'Category': "Food", 'Description': "Lunch"},
+            ("2025-13-01", 10.00, "Food", "Bad month"),
+            ("2025-05-03", "ten", "Food", "Bad amount"),
+            ("2025-05-03", 1.00, "Food"),
+        ]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            report = self.tracker.add_expenses_bulk(rows, batch_size=2)
+
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(report['added'], 2)
+        self.assertEqual([(r['row'], r['reason']) for r in report['rejected']],
+                         [(2, "invalid date"), (3, "invalid amount"),
+                          (4, "expected Date, Amount, Category and Description")])
+        self.assertEqual(len(self.tracker.get_expenses("2025-05-01", "2025-05-01")), 1)
+        self.assertTrue(self.tracker.verify_summary())
+        print("✓ Bulk ingest report test passed")
+
+    def test_bulk_add_rejects_out_of_range_amounts(self):
+        """Test that amounts too large to store are reported, not raised."""
+        report = self.tracker.add_expenses_bulk([("2025-05-01", 1e300, "Food", "huge"),
+                                                 ("2025-05-01", 10 ** 17, "Food", "huge"),
+                                                 ("2025-05-02", 3, "Food", "Snack")])
+        self.assertEqual(report['added'], 1)
+        self.assertEqual([(r['row'], r['reason']) for r in report['rejected']],
+                         [(0, "invalid amount"), (1, "invalid amount")])
+
+        with tempfile.TemporaryDirectory() as directory, \
+                contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(main(["add", "2025-12-01", "1e300", "X", "y",
+                                   "--db", os.path.join(directory, "db")]), 1)
+        self.assertEqual(errors.getvalue(), "Error: invalid amount\n")
+        print("✓ Out-of-range bulk amount test passed")
+
+    @unittest.skipUnless(numpy, "NumPy is not installed")
+    def test_bulk_add_structured_array(self):
+        """Test vectorized validation of a NumPy structured array."""
+        records = numpy.array([("2025-05-01", 1.005, "Food", "Lunch"),
+                               ("2025-05", 2.0, "Food", "Partial date"),
+                               ("2025-05-02", 1e300, "Food", "Huge"),
+                               ("2025-05-02", numpy.nan, "Food", "Missing"),
+                               ("2025-05-03", -4.5, "Refund", "Return")],
+                              dtype=[('Date', 'U10'), ('Amount', 'f8'),
+                                     ('Category', 'U10'), ('Description', 'U20')])
+        report = self.tracker.add_expenses_bulk(records, batch_size=2)
+        self.assertEqual(report['added'], 2)
+        self.assertEqual([(r['row'], r['reason']) for r in report['rejected']],
+                         [(1, "invalid date"), (2, "invalid amount"), (3, "invalid amount")])
+        self.assertEqual([(e['Date'], e['Amount']) for e in self.tracker.get_expenses()],
+                         [("2025-05-01", 1.01), ("2025-05-03", -4.5)])
+        print("✓ Structured array ingest test passed")
+
+    def test_bulk_add_from_csv(self):
+        """Test bulk ingest from a CSV file with a reordered header."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "expenses.csv")
+            with open(path, "w", newline="", encoding="utf-8") as handle:
+                handle.write("Category,Date,Description,Amount\n")
+                handle.write("Food,2025-05-01,Lunch,15.99\n")
+                handle.write("Transport,2025-05-02,\"Gas, premium\",50\n")
+            report = self.tracker.add_expenses_bulk(path)
+
+        self.assertEqual(report, {'added': 2, 'rejected': []})
+        self.assertEqual(self.tracker.expenses[1]['Description'], "Gas, premium")
+        self.assertAlmostEqual(self.tracker.get_summary()['total'], 65.99, places=2)
+        print("✓ Bulk CSV ingest test passed")
+
+    def test_parallel_scan_matches_serial(self):
+        """Test that partitioned worker scans give the serial results."""
+        self.tracker.add_expenses_bulk(
+            (f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", i / 3, ["Food", "Rent", "food"][i % 3], "x")
+            for i in range(300))
+        try:
+            for filters in ({}, {'category': "FOOD"}, {'start_date': "2025-03-01", 'end_date': "2025-05-31"}):
+                self.assertEqual(self.tracker.summarize(**filters),
+                                 self.tracker.summarize(**filters, workers=2))
+                self.assertEqual([e.row_id for e in self.tracker.get_expenses(**filters)],
+                                 [e.row_id for e in self.tracker.get_expenses(**filters, workers=2)])
+        finally:
+            self.tracker.close()
+
+        summary = self.tracker.summarize(category="food")
+        self.assertEqual(summary['counts'], {"Food": 100, "food": 100})
+        self.assertEqual(summary['count'], 200)
+        print("✓ Parallel scan test passed")
+
+    def test_rollups_by_period(self):
+        """Test day, week, month and year rollups with date bounds."""
+        self.tracker.add_expenses_bulk([
+            ("2025-04-30", 10.00, "Food", "a"),
+            ("2025-05-01", 15.99, "Food", "b"),
+            ("2025-05-04", 50.00, "Transport", "c"),
+            ("2025-05-05", 25.50, "Food", "d"),
+            ("2025-06-01", 0.00, "Gift", "e"),
+        ])
+
+        self.assertEqual(self.tracker.get_rollup('month', by_category=False),
+                         {"2025-04": 10.00, "2025-05": 91.49, "2025-06": 0.00})
+        self.assertEqual(self.tracker.get_rollup('month', "2025-05-15", "2025-05-20"),
+                         {"2025-05": {"Food": 41.49, "Transport": 50.00}})
+        self.assertEqual(list(self.tracker.get_rollup('week')), ["2025-W18", "2025-W19", "2025-W22"])
+        self.assertEqual(self.tracker.get_rollup('day', end="2025-05-01"),
+                         {"2025-04-30": {"Food": 10.00}, "2025-05-01": {"Food": 15.99}})
+        self.assertEqual(self.tracker.get_rollup('year', by_category=False), {"2025": 101.49})
+        with self.assertRaises(ValueError):
+            self.tracker.get_rollup('quarter')
+        print("✓ Rollup test passed")
+
+    def test_category_index_lookup(self):
+        """Test case-insensitive category filters combined with date ranges."""
+        self.tracker.add_expenses_bulk([
+            ("2025-05-03", 25.50, "Food", "Dinner"),
+            ("2025-05-01", 15.99, "FOOD", "Lunch"),
+            ("2025-05-02", 50.00, "Transport", "Bus"),
+            ("2025-04-30", 8.00, "food", "Snack"),
+            ("2025-05-02", 4.00, "Straße", "Toll"),
+        ])
+
+        food = self.tracker.get_expenses(category="fOOd")
+        self.assertEqual([e['Description'] for e in food], ["Dinner", "Lunch", "Snack"])
+        in_may = self.tracker.get_expenses("2025-05-01", "2025-05-02", "Food")
+        self.assertEqual([e['Description'] for e in in_may], ["Lunch"])
+        self.assertEqual(self.tracker.get_expenses(category="Rent"), [])
+        # Casefolding also matches spellings that lower() would not
+        self.assertEqual(len(self.tracker.get_expenses(category="STRASSE")), 1)
+        self.assertAlmostEqual(self.tracker.summarize(category="food")['total'], 49.49, places=2)
+
+        # Optional Unicode normalization matches composed and decomposed names
+        tracker = ExpenseTracker(category_normalization='NFC')
+        tracker.add_expenses_bulk([("2025-05-01", 3.00, "Cafe\u0301", "Coffee")])
+        self.assertEqual(len(tracker.get_expenses(category="CAF\u00c9")), 1)
+        print("✓ Category index test passed")
+
+    def test_exact_money_arithmetic(self):
+        """Test that amounts round like decimals and totals never drift."""
+        self.tracker.add_expenses_bulk([("2025-05-01", 0.10, "Food", "")] * 1000
+                                       + [("2025-05-02", 1.005, "Food", ""), ("2025-05-02", "2.675", "Rent", "")])
+        summary = self.tracker.get_summary(exact=True)
+        self.assertEqual(summary['total'], Decimal("103.69"))
+        self.assertEqual(summary['categories']['Rent'], Decimal("2.68"))
+        self.assertEqual(self.tracker.get_summary()['total'], 103.69)
+        self.assertEqual(self.tracker.summarize(category="food", exact=True)['total'], Decimal("101.01"))
+
+        # Other currency scales keep their own number of decimal places
+        yen = ExpenseTracker(currency_scale=0)
+        yen.add_expenses_bulk([("2025-05-01", 1234.5, "Food", ""), ("2025-05-01", 99, "Food", "")])
+        self.assertEqual(yen.get_summary(exact=True)['total'], Decimal("1334"))
+        self.assertEqual(yen.expenses[0]['Amount'], 1235)
+        with self.assertRaises(ValueError):
+            ExpenseTracker(currency_scale=12)
+        print("✓ Exact money arithmetic test passed")
+
+    def test_out_of_range_amount_leaves_store_intact(self):
+        """Test that amounts beyond 64-bit minor units are refused without touching any column."""
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertIsNone(self.tracker.add_expense("2025-05-01", 1e300, "Food", "huge"))
+            self.assertIsNone(self.tracker.add_expense("2025-05-01", 10 ** 17, "Food", "huge"))
+        self.assertEqual(output.getvalue().count("Error"), 2)
+
+        store = self.tracker.expenses
+        with self.assertRaises(OverflowError):
+            store.extend([(_parse_date("2025-05-01"), 1000, "Food", "a"),
+                          (_parse_date("2025-05-02"), 2 ** 63, "Food", "b")])
+        self.assertEqual((len(store), len(store.amounts), len(store.categories)), (0, 0, 0))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tracker.add_expense("2025-05-03", 1, "X", "after")
+        self.assertEqual(dict(self.tracker.get_expenses()[0]),
+                         {'Date': "2025-05-03", 'Amount': 1.0, 'Category': "X", 'Description': "after"})
+        self.assertTrue(self.tracker.verify_summary())
+        print("✓ Out-of-range amount test passed")
+
+    def test_print_expenses_streaming(self):
+        """Test offset, limit, tail and paging when printing expenses."""
+        self.tracker.add_expenses_bulk(
+            [(f"2025-05-{day:02d}", day, "Food", f"Item {day}") for day in range(1, 11)])
+
+        def render(expenses, **options):
+            output = io.StringIO()
+            print_expenses(expenses, stream=output, **options)
+            return [line.split(" | ")[-1].strip() for line in output.getvalue().splitlines()
+                    if line.startswith("2025-")], output.getvalue()
+
+        rows, text = render(self.tracker.get_expenses(), offset=2, limit=3)
+        self.assertEqual(rows, ["Item 3", "Item 4", "Item 5"])
+        self.assertIn("Showing Expenses 3-5 of 10", text)
+        rows, text = render(self.tracker.iter_expenses(), tail=2)
+        self.assertEqual(rows, ["Item 9", "Item 10"])
+        rows, text = render(self.tracker.get_expenses(), widths=self.tracker.column_widths())
+        self.assertEqual(len(rows), 10)
+        self.assertIn("Total Expenses: 10", text)
+
+        # An endless iterator still prints its first rows
+        endless = ({'Date': "2025-05-01", 'Amount': n, 'Category': "Food", 'Description': str(n)}
+                   for n in count())
+        rows, text = render(endless, limit=2)
+        self.assertEqual(rows, ["0", "1"])
+        self.assertIn("Expenses Shown: 2", text)
+
+        # Paging stops when the user enters 'q'
+        with mock.patch('builtins.input', return_value='q') as prompt:
+            rows, _ = render(self.tracker.iter_expenses(), page_size=4)
+        self.assertEqual(len(rows), 4)
+        prompt.assert_called_once()
+
+        # An empty listing also goes to the given stream, not standard output
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            rows, text = render(self.tracker.iter_expenses(category="Rent"))
+        self.assertEqual(rows, [])
+        self.assertIn("No Expenses Found!", text)
+        self.assertEqual(stdout.getvalue(), "")
+        print("✓ Streaming print test passed")
+
+    def test_lazy_query_builder(self):
+        """Test query filters, ordering, limits and plan selection."""
+        self.tracker.add_expenses_bulk([
+            ("2025-05-03", 25.50, "Food", "Dinner"),
+            ("2025-05-01", 15.99, "food", "Lunch"),
+            ("2025-05-02", 50.00, "Transport", "Bus"),
+            ("2025-04-30", 8.00, "Rent", "Deposit"),
+            ("2025-05-02", 4.00, "Food", "Snack"),
+        ])
+        query = self.tracker.query()
+
+        food = query.where(date__between=("2025-05-01", "2025-05-31"), category__in={"FOOD", "Rent"})
+        self.assertEqual(food.explain()['access'], 'category_index')
+        self.assertEqual(food.count(), 3)
+        top = food.where(amount__gt=5).order_by("-amount").limit(1)
+        self.assertEqual([e['Description'] for e in top], ["Dinner"])
+        self.assertEqual([e['Description'] for e in query.order_by("date").offset(1).limit(2)],
+                         ["Lunch", "Bus"])
+        self.assertEqual(query.where(date__lt="2025-05-02").explain()['access'], 'date_index')
+        self.assertEqual(query.where(amount__lte=8).explain()['access'], 'full_scan')
+        self.assertAlmostEqual(query.where(description__contains="N").total(), 45.49, places=2)
+        self.assertEqual(query.where(category="Gifts").explain()['access'], 'empty')
+
+        # Nothing runs until iteration, and a limit stops the read early
+        seen = []
+        lazy = query.where(lambda expense: seen.append(expense['Description']) or True).limit(2)
+        self.assertEqual(seen, [])
+        self.assertEqual(len(list(lazy)), 2)
+        self.assertEqual(len(seen), 2)
+
+        with self.assertRaises(ValueError):
+            query.where(amount__contains=5)
+        with self.assertRaises(ValueError):
+            query.where(date__gte="05/01/2025")
+        with self.assertRaises(ValueError):
+            query.order_by("size")
+        print("✓ Query builder test passed")
+
+    def test_query_fractional_amount_bounds(self):
+        """Test that amount bounds between two cents are compared exactly, not rounded."""
+        self.tracker.add_expenses_bulk([("2025-05-01", amount, "Food", str(amount))
+                                        for amount in ("20.00", "20.01", "20.02")])
+        query = self.tracker.query()
+
+        def matched(**lookup):
+            return [e['Description'] for e in query.where(**lookup)]
+
+        self.assertEqual(matched(amount__gt=20.005), ["20.01", "20.02"])
+        self.assertEqual(matched(amount__gte="20.005"), ["20.01", "20.02"])
+        self.assertEqual(matched(amount__lt=20.005), ["20.00"])
+        self.assertEqual(matched(amount__lte=20.005), ["20.00"])
+        self.assertEqual(matched(amount__between=(20.001, 20.019)), ["20.01"])
+        self.assertEqual(matched(amount__gt=20.01, amount__lt=20.02), [])
+        self.assertEqual(matched(amount__exact=20.01), ["20.01"])
+        self.assertEqual(matched(amount__exact=20.004), [])
+        self.assertEqual(query.where(amount__exact=20.004).explain()['access'], 'empty')
+        for bound in (float("inf"), float("-inf"), float("nan"), 1e300, "abc"):
+            with self.assertRaises(ValueError):
+                query.where(amount__gt=bound)
+        print("✓ Fractional amount bound test passed")
+
+    def test_query_date_order_across_categories(self):
+        """Test that date ordering merges the rows of every matching category."""
+        self.tracker.add_expenses_bulk([
+            ("2025-05-01", 1, "Food", "f1"),
+            ("2025-05-02", 2, "Rent", "r1"),
+            ("2025-05-03", 3, "Rent", "r2"),
+            ("2025-05-04", 4, "Food", "f2"),
+            ("2025-05-05", 5, "Straße", "s1"),
+            ("2025-05-06", 6, "STRASSE", "s2"),
+        ])
+        query = self.tracker.query()
+
+        def descriptions(results):
+            return [e['Description'] for e in results]
+
+        both = query.where(category__in={"Food", "Rent"})
+        self.assertEqual(descriptions(both.order_by("date")), ["f1", "r1", "r2", "f2"])
+        self.assertEqual(descriptions(both.order_by("-date")), ["f2", "r2", "r1", "f1"])
+        self.assertEqual(descriptions(both.order_by("date").limit(3)), ["f1", "r1", "r2"])
+        self.assertEqual(descriptions(both.order_by("-date").offset(1).limit(2)), ["r2", "r1"])
+        self.assertEqual(descriptions(query.where(category="strasse").order_by("date")), ["s1", "s2"])
+        print("✓ Multi-category date order test passed")
+
+    def test_search_descriptions(self):
+        """Test ranked full-text search combined with date and category filters."""
+        self.tracker.add_expenses_bulk([
+            ("2025-05-01", 30.00, "Transport", "Uber to the airport"),
+            ("2025-05-02", 12.00, "Transport", "Uber home"),
+            ("2025-05-03", 45.00, "Travel", "Airport parking"),
+            ("2025-06-01", 8.00, "Food", "Airline snacks"),
+            ("2025-06-02", 25.00, "Transport", "uber airport"),
+        ])
+
+        def descriptions(*args, **kwargs):
+            return [e['Description'] for e in self.tracker.search(*args, **kwargs)]
+
+        # Every word must match; shorter descriptions rank first
+        self.assertEqual(descriptions("UBER airport"), ["uber airport", "Uber to the airport"])
+        self.assertEqual(sorted(descriptions("air*")),
+                         ["Airline snacks", "Airport parking", "Uber to the airport", "uber airport"])
+        self.assertEqual(descriptions("uber", start_date="2025-05-02", end_date="2025-05-31"),
+                         ["Uber home"])
+        self.assertEqual(descriptions("airport", category="travel"), ["Airport parking"])
+        self.assertEqual(len(descriptions("uber", limit=1)), 1)
+        self.assertEqual(descriptions("taxi"), [])
+
+        # The index follows later inserts
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tracker.add_expense("2025-06-03", 40.00, "Transport", "Taxi to airport")
+        self.assertEqual(descriptions("taxi"), ["Taxi to airport"])
+        print("✓ Description search test passed")
+
+    def test_result_cache_invalidation(self):
+        """Test that cached query results are reused and evicted by overlapping writes."""
+        tracker = ExpenseTracker(result_cache_bytes=4096)
+        tracker.add_expenses_bulk([
+            ("2025-05-01", 10.00, "Food", "Lunch"),
+            ("2025-05-15", 20.00, "Transport", "Bus"),
+            ("2025-06-01", 30.00, "Food", "Dinner"),
+        ])
+        for _ in range(2):
+            self.assertEqual(len(tracker.get_expenses("2025-05-01", "2025-05-31", "FOOD")), 1)
+            self.assertEqual(tracker.summarize("2025-05-01", "2025-05-31")['total'], 30.00)
+        stats = tracker.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 2, 2))
+
+        # Writes outside the cached range or categories keep the entries
+        tracker.add_expenses_bulk([("2025-07-01", 5.00, "Food", "Snack"),
+                                   ("2025-05-20", 5.00, "Rent", "Fee")])
+        self.assertEqual(tracker.cache_stats()['invalidations'], 1)
+        self.assertEqual(len(tracker.get_expenses("2025-05-01", "2025-05-31", "food")), 1)
+        self.assertEqual(tracker.summarize("2025-05-01", "2025-05-31")['total'], 35.00)
+
+        # An overlapping write, or a new category a filter now matches, evicts
+        self.assertEqual(tracker.get_expenses(category="Travel"), [])
+        tracker.add_expenses_bulk([("2025-05-02", 7.00, "Food", "Snack"),
+                                   ("2025-08-01", 9.00, "travel", "Train")])
+        self.assertEqual(len(tracker.get_expenses("2025-05-01", "2025-05-31", "food")), 2)
+        self.assertEqual(len(tracker.get_expenses(category="Travel")), 1)
+
+        # The byte budget bounds the cache
+        for day in range(1, 29):
+            tracker.get_expenses(f"2025-05-{day:02d}", "2025-06-30")
+        stats = tracker.cache_stats()
+        self.assertGreater(stats['evictions'], 0)
+        self.assertLessEqual(stats['bytes'], 4096)
+        self.assertEqual(ExpenseTracker().cache_stats()['entries'], 0)
+        print("✓ Result cache test passed")
+
+    def test_operation_metrics(self):
+        """Test per-operation call counts, row counts and metric exports."""
+        tracker = ExpenseTracker(metrics=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracker.add_expense("2025-05-01", 15.99, "Food", "Lunch")
+            tracker.add_expense("2025-05-02", 50.00, "Transport", "Bus")
+            tracker.add_expense("05/03/2025", 10.00, "Food", "Dinner")
+        tracker.get_expenses("2025-05-02", "2025-05-31")
+        tracker.get_expenses(category="food")
+        tracker.get_summary()
+
+        metrics = tracker.get_metrics()
+        self.assertEqual(set(metrics), {"add_expense", "get_expenses", "get_summary"})
+        self.assertEqual(metrics['add_expense']['calls'], 3)
+        # Only the date that is not zero-padded ISO needs strptime()
+        self.assertEqual(metrics['add_expense']['date_parses'], 1)
+        lookups = metrics['get_expenses']
+        self.assertEqual((lookups['calls'], lookups['rows_returned'], lookups['date_parses']), (2, 2, 0))
+        self.assertEqual(lookups['rows_scanned'], 2)
+        self.assertEqual(lookups['latency_buckets'][float('inf')], 2)
+
+        text = tracker.export_metrics()
+        self.assertIn('expense_tracker_calls_total{operation="add_expense"} 3', text)
+        self.assertIn('expense_tracker_latency_seconds_bucket{operation="get_summary",le="+Inf"} 1', text)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            tracker.export_metrics('json', path)
+            with open(path, encoding='utf-8') as handle:
+                self.assertIn('"+Inf": 1', handle.read())
+
+        # Without metrics the methods are not wrapped at all
+        self.assertEqual(self.tracker.get_metrics(), {})
+        self.assertNotIn('get_expenses', vars(self.tracker))
+        print("✓ Operation metrics test passed")
+
+    def test_streaming_analytics(self):
+        """Test top-N, quantile and distinct-count analytics as expenses arrive."""
+        self.tracker.add_expenses_bulk([
+            ("2025-05-01", 15.99, "Food", "Lunch"),
+            ("2025-05-02", 50.00, "Transport", "Gas"),
+            ("2025-05-03", 25.50, "Food", "Groceries"),
+            ("2025-05-04", 4.00, "Food", "Lunch"),
+        ])
+        top = self.tracker.top_expenses(2)
+        self.assertEqual([e['Amount'] for e in top], [50.00, 25.50])
+        self.assertEqual([e['Description'] for e in self.tracker.top_expenses(5, "FOOD")],
+                         ["Groceries", "Lunch", "Lunch"])
+        self.assertEqual(self.tracker.amount_quantiles((0, 0.5, 1), category="food"),
+                         {0: 4.00, 0.5: 15.99, 1: 25.50})
+        self.assertEqual(self.tracker.distinct_descriptions("food"), 2)
+        self.assertEqual(self.tracker.top_expenses(category="Travel"), [])
+
+        # Sketches follow later writes, including new categories
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tracker.add_expense("2025-05-05", 99.00, "food", "Dinner")
+            self.tracker.add_expense("2025-05-06", 80.00, "Travel", "Train")
+        self.assertEqual(self.tracker.top_expenses(1)[0]['Description'], "Dinner")
+        self.assertEqual(self.tracker.distinct_descriptions(), 5)
+        self.assertEqual(self.tracker.distinct_descriptions("FOOD"), 3)
+        self.assertEqual(len(self.tracker.top_expenses(200)), 6)
+        with self.assertRaises(ValueError):
+            self.tracker.amount_quantiles([1.5])
+        print("✓ Streaming analytics test passed")
+
+    def test_non_text_fields_rejected(self):
+        """Test that add_expense() refuses non-text categories and descriptions before storing anything."""
+        self.tracker.add_budget(None, 100, "month")
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertIsNone(self.tracker.add_expense("2025-05-01", 5, "NewCat", 123))
+            self.assertIsNone(self.tracker.add_expense("2025-05-01", 5, None, "a"))
+            self.tracker.add_expense("2025-05-02", 150, "Other", "Big")
+            self.tracker.add_expense("2025-05-03", 5, "NewCat", "Valid")
+        self.assertEqual(output.getvalue().count("Error: Category and description must be text."), 2)
+        self.assertEqual(self.tracker.expenses.categories, ["Other", "NewCat"])
+        self.assertEqual(len(self.tracker.get_budget_alerts()), 1)
+        self.assertEqual(len(self.tracker.get_expenses(category="newcat")), 1)
+        self.assertEqual(self.tracker.find_duplicates()['checked'], 2)
+        self.assertTrue(self.tracker.verify_summary())
+        print("✓ Non-text field test passed")
+
+    def test_non_text_date_rejected(self):
+        """Test that non-string dates are reported as invalid instead of raising."""
+        with tempfile.TemporaryDirectory() as directory, \
+                SQLiteExpenseTracker(os.path.join(directory, "expenses.db")) as database:
+            for tracker in (self.tracker, database):
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    self.assertIsNone(tracker.add_expense(None, 5, "Food", "Lunch"))
+                    self.assertIsNone(tracker.add_expense(20250501, 5, "Food", "Lunch"))
+                self.assertEqual(output.getvalue().count("Error: Invalid date format"), 2)
+                self.assertEqual(tracker.get_expenses(), [])
+        with contextlib.redirect_stdout(io.StringIO()):
+            lunch = self.tracker.add_expense("2025-05-01", 5, "Food", "Lunch")
+        with self.assertRaises(ValueError):
+            self.tracker.update_expense(lunch, date=20250502)
+        self.assertEqual(self.tracker.get_expenses()[0]['Date'], "2025-05-01")
+        print("✓ Non-text date test passed")
+
+    def test_budget_alerts(self):
+        """Test that budget rules alert once per period when a write exceeds them."""
+        self.tracker.add_expense("2025-04-30", 500.00, "Food", "Before the rule")
+        called = []
+        food = self.tracker.add_budget("food", 100, "month", callback=called.append)
+        weekly = self.tracker.add_budget(None, 150, "week")
+        self.tracker.add_budget("Rent", 1000, "year")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tracker.add_expense("2025-05-01", 60.00, "Food", "Lunch")
+            self.tracker.add_expense("2025-05-02", 40.00, "FOOD", "Dinner")
+            self.assertEqual(called, [])
+            self.tracker.add_expense("2025-05-03", 0.01, "Food", "Gum")
+            self.tracker.add_expense("2025-05-04", 30.00, "Food", "Snack")
+        self.assertEqual(called, [{'rule': food, 'category': "food", 'period': "month",
+                                   'bucket': "2025-05", 'limit': 100.0, 'total': 100.01}])
+
+        # A batch crossing a limit alerts once, with the batch's final total
+        self.tracker.add_expenses_bulk([("2025-06-02", 90, "Food", ""), ("2025-06-03", 90, "Food", "")])
+        self.assertEqual([alert['bucket'] for alert in called], ["2025-05", "2025-06"])
+        alerts = self.tracker.get_budget_alerts()
+        # The week of 2025-04-30 was over its limit before the rule existed
+        self.assertEqual([(alert['rule'], alert['bucket'], alert['total']) for alert in alerts],
+                         [(weekly, "2025-W23", 180.0)])
+        self.assertEqual(self.tracker.get_budget_alerts(), [])
+
+        self.assertTrue(self.tracker.remove_budget(food))
+        self.assertFalse(self.tracker.remove_budget(food))
+        self.tracker.add_expenses_bulk([("2025-07-01", 500, "Food", "")])
+        self.assertEqual(len(called), 2)
+        with self.assertRaises(ValueError):
+            self.tracker.add_budget("Food", 100, "fortnight")
+        with self.assertRaises(ValueError):
+            self.tracker.add_budget("Food", -5)
+        print("✓ Budget alert test passed")
+
+    def test_update_delete_and_compact(self):
+        """Test that updates and deletes reach every read path and survive compaction."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            lunch = self.tracker.add_expense("2025-05-01", 15.99, "Food", "Lunch")
+            bus = self.tracker.add_expense("2025-05-02", 50.00, "Transport", "Bus")
+            dinner = self.tracker.add_expense("2025-05-03", 25.50, "Food", "Dinner")
+        self.tracker.get_expenses(category="food")
+        self.tracker.get_rollup('month')
+
+        self.assertTrue(self.tracker.update_expense(lunch, amount=20, description="Team lunch"))
+        self.assertTrue(self.tracker.delete_expense(bus))
+        self.assertFalse(self.tracker.delete_expense(bus))
+        self.assertFalse(self.tracker.update_expense(999, amount=1))
+        with self.assertRaises(ValueError):
+            self.tracker.update_expense(dinner, date="2025-13-01")
+
+        def state():
+            return ([(e.expense_id, e['Amount'], e['Description']) for e in self.tracker.get_expenses()],
+                    self.tracker.summarize("2025-05-01", "2025-05-31")['total'],
+                    self.tracker.get_rollup('month', by_category=False),
+                    self.tracker.query().where(category="food").order_by("-amount").count(),
+                    [e.expense_id for e in self.tracker.search("lunch")])
+
+        expected = ([(dinner, 25.5, "Dinner"), (lunch, 20.0, "Team lunch")], 45.5,
+                    {"2025-05": 45.5}, 2, [lunch])
+        self.assertEqual(state(), expected)
+        self.assertEqual(self.tracker.get_summary()['categories'], {"Food": 45.5})
+        self.assertTrue(self.tracker.verify_summary())
+
+        # Compaction drops the dead rows but keeps IDs, totals and results
+        self.assertEqual(len(self.tracker.expenses), 6)
+        self.assertEqual(self.tracker.compact(), 4)
+        self.assertEqual(self.tracker.compact(), 0)
+        self.assertEqual(len(self.tracker.expenses), 2)
+        self.assertEqual(sorted(state()[0]), sorted(expected[0]))
+        self.assertEqual(state()[1:], expected[1:])
+        with contextlib.redirect_stdout(io.StringIO()):
+            taxi = self.tracker.add_expense("2025-05-04", 9.00, "Transport", "Taxi")
+        self.assertNotIn(taxi, (lunch, bus, dinner))
+        self.assertTrue(self.tracker.delete_expense(dinner))
+        self.assertEqual(self.tracker.get_summary()['total'], 29.0)
+
+        # Background compaction runs on its own thread
+        with self.assertRaises(ValueError):
+            self.tracker.compact(background=True)
+        tracker = ExpenseTracker(thread_safe=True)
+        tracker.add_expenses_bulk([("2025-05-01", day, "Food", "") for day in range(1, 101)])
+        for expense_id in range(0, 100, 2):
+            tracker.delete_expense(expense_id)
+        tracker.compact(background=True).join()
+        self.assertEqual((len(tracker.expenses), tracker.get_summary()['total']), (50, 2550.0))
+        print("✓ Update, delete and compaction test passed")
+
+    def test_deduplicate_and_idempotency_keys(self):
+        """Test that repeated expenses and retried keys are stored once."""
+        tracker = ExpenseTracker(deduplicate=True)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            lunch = tracker.add_expense("2025-05-01", 15.99, "Food", "Lunch  out")
+            again = tracker.add_expense("2025-05-01", "15.990", "FOOD", " lunch OUT")
+            taxi = tracker.add_expense("2025-05-02", 9, "Transport", "Taxi", idempotency_key="req-1")
+            retry = tracker.add_expense("2025-05-02", 9.5, "Transport", "Taxi", idempotency_key="req-1")
+        self.assertEqual((again, retry), (lunch, taxi))
+        self.assertEqual(output.getvalue().count("Expense already recorded"), 2)
+        self.assertEqual(len(tracker.expenses), 2)
+
+        report = tracker.add_expenses_bulk([("2025-05-01", 15.99, "food", "lunch out"),
+                                            ("2025-05-03", 4, "Food", "Snack"),
+                                            ("2025-05-03", 4, "food", "snack")])
+        self.assertEqual(report, {'added': 1, 'rejected': [], 'duplicates': 2})
+        self.assertEqual(tracker.add_expenses_bulk([("2025-05-03", 4, "Food", "Snack")],
+                                                   deduplicate=False)['added'], 1)
+
+        # Deleted and updated expenses no longer count as stored
+        tracker.delete_expense(lunch)
+        self.assertEqual(tracker.add_expenses_bulk([("2025-05-01", 15.99, "Food", "Lunch out")])['added'], 1)
+        tracker.update_expense(taxi, amount=12)
+        self.assertEqual(tracker.add_expenses_bulk([("2025-05-02", 9, "Transport", "Taxi"),
+                                                    ("2025-05-02", 12, "transport", "taxi")])['added'], 1)
+        tracker.compact()
+        self.assertEqual(tracker.add_expenses_bulk([("2025-05-02", 12, "Transport", "Taxi")])['duplicates'], 1)
+
+        report = tracker.find_duplicates()
+        snacks = sorted(e.expense_id for e in tracker.get_expenses(category="food")
+                        if e['Description'] == "Snack")
+        self.assertEqual(report, {'checked': 5, 'duplicates': 1, 'groups': [snacks]})
+        self.assertEqual(ExpenseTracker().find_duplicates(), {'checked': 0, 'duplicates': 0, 'groups': []})
+        print("✓ Deduplication test passed")
+
+    def test_sketch_accuracy_and_merge(self):
+        """Test that merged sketches stay within their error bounds."""
+        values = [(n * 7919) % 100_003 for n in range(60_000)]
+        first, second = KLLSketch(seed=1), KLLSketch(seed=2)
+        first.extend(values[:30_000])
+        second.extend(values[30_000:])
+        first.merge(second)
+        self.assertEqual(first.count, 60_000)
+        self.assertLess(sum(map(len, first.levels)), 2_000)
+        ordered = sorted(values)
+        for fraction, value in zip((0.5, 0.95), first.quantiles((0.5, 0.95))):
+            rank = ordered.index(value) / len(ordered)
+            self.assertLess(abs(rank - fraction), 0.02)
+
+        left, right = HyperLogLog(), HyperLogLog()
+        for n in range(20_000):
+            (left if n % 2 else right).add(f"description {n % 15_000}")
+        left.merge(right)
+        self.assertLess(abs(left.count() - 15_000), 15_000 * 0.05)
+        print("✓ Sketch accuracy test passed")
+
+    def test_failed_write_is_rolled_back(self):
+        """Test that a write failing partway leaves no half-written rows visible."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            lunch = self.tracker.add_expense("2025-05-01", 15.99, "Food", "Lunch")
+        self.tracker.search("lunch")
+        failure = mock.patch.object(ExpenseTracker, '_update_rollups', side_effect=RuntimeError("failed"))
+        with failure, self.assertRaises(RuntimeError):
+            self.tracker.add_expenses_bulk([("2025-05-02", 5, "Books", "Novel"), ("2025-05-03", 7, "Food", "Snack")])
+        with mock.patch.object(ExpenseTracker, '_forget_row', side_effect=RuntimeError("failed")), \
+                self.assertRaises(RuntimeError):
+            self.tracker.update_expense(lunch, amount=99)
+
+        self.assertEqual(len(self.tracker.expenses), 1)
+        self.assertEqual(self.tracker.expenses.categories, ["Food"])
+        self.assertEqual(self.tracker.get_summary()['total'], 15.99)
+        self.assertEqual(self.tracker.get_expenses()[0]['Amount'], 15.99)
+        self.assertEqual(len(self.tracker.search("lunch")), 1)
+        self.assertTrue(self.tracker.delete_expense(lunch))
+        self.tracker.add_expenses_bulk([("2025-05-04", 3, "Books", "Comic")])
+        self.assertEqual(self.tracker.get_rollup('month'), {"2025-05": {"Books": 3.0}})
+        self.assertEqual(len(self.tracker.get_expenses(category="books")), 1)
+        self.assertTrue(self.tracker.verify_summary())
+
+        # Budgets still alert on the first write after a rollback
+        budgeted = ExpenseTracker()
+        rule = budgeted.add_budget("Food", 10, "month")
+        budgeted.add_expenses_bulk([("2025-05-01", 6, "Food", "Lunch")])
+        with failure, self.assertRaises(RuntimeError):
+            budgeted.add_expenses_bulk([("2025-05-02", 9, "Food", "Lost")])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNotNone(budgeted.add_expense("2025-05-03", 5, "Food", "Dinner"))
+        self.assertEqual(len(budgeted.expenses), 2)
+        self.assertEqual([(alert['rule'], alert['total']) for alert in budgeted.get_budget_alerts()],
+                         [(rule, 11.0)])
+
+        # A persistent store also drops the records it had written
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "db")
+            with ExpenseTracker(path) as tracker:
+                tracker.add_expenses_bulk([("2025-05-01", 1, "Food", "Kept")])
+                with failure, self.assertRaises(RuntimeError):
+                    tracker.add_expenses_bulk([("2025-05-02", 2, "Books", "Lost")])
+                tracker.add_expenses_bulk([("2025-05-03", 3, "Rent", "After")])
+            with ExpenseTracker(path) as tracker:
+                self.assertEqual([(e['Category'], e['Description']) for e in tracker.get_expenses()],
+                                 [("Food", "Kept"), ("Rent", "After")])
+                self.assertEqual(tracker.expenses.categories, ["Food", "Rent"])
+                self.assertTrue(tracker.verify_summary())
+        print("✓ Failed write rollback test passed")
+
+    def test_thread_safe_snapshot_reads(self):
+        """Test that readers never see half of a batch while writers run."""
+        tracker = ExpenseTracker(thread_safe=True)
+        torn = []
+        writing = True
+
+        def write(writer):
+            for day in range(1, 29):
+                for n in range(20):
+                    tracker.add_expenses_bulk([(f"2025-05-{day:02d}", 3, "Food", ""),
+                                               (f"2025-05-{day:02d}", 7, "Rent", "")])
+                    # New categories, with dates running backwards so their
+                    # indexes collect pending keys for readers to merge
+                    tracker.add_expenses_bulk([(f"2025-05-{29 - day:02d}", 1, f"Extra {writer}-{n % 4}", "")])
+
+        def read():
+            while writing:
+                summary = tracker.get_summary()
+                if summary['categories'].get('Food', 0) * 7 != summary['categories'].get('Rent', 0) * 3:
+                    torn.append(summary)
+                categories = Counter(e['Category'] for e in tracker.get_expenses("2025-05-01", "2025-05-31"))
+                if categories['Food'] != categories['Rent']:
+                    torn.append("rows")
+                for writer in range(3):
+                    tracker.get_expenses("2025-05-05", "2025-05-25", f"Extra {writer}-{writer}")
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            writers = [threading.Thread(target=write, args=(writer,)) for writer in range(3)]
+            readers = [threading.Thread(target=read) for _ in range(3)]
+            for thread in readers + writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            writing = False
+            for thread in readers:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(torn, [])
+        self.assertEqual(tracker.get_summary()['total'], 3 * 28 * 20 * 11)
+        self.assertTrue(tracker.verify_summary())
+
+        # Every category's index holds exactly the rows a full scan finds
+        expenses = tracker.get_expenses()
+        for category in tracker.get_summary()['categories']:
+            expected = [dict(e) for e in expenses if e['Category'] == category]
+            self.assertEqual([dict(e) for e in tracker.get_expenses(category=category)], expected)
+            dated = [e for e in expected if "2025-05-05" <= e['Date'] <= "2025-05-25"]
+            self.assertEqual([dict(e) for e in tracker.get_expenses("2025-05-05", "2025-05-25", category)],
+                             dated)
+        print("✓ Thread-safe snapshot read test passed")
+
+    def test_async_facade(self):
+        """Test the asyncio facade over a thread-safe tracker."""
+        async def scenario():
+            async with AsyncExpenseTracker() as tracker:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await tracker.add_expense("2025-05-01", 15.99, "Food", "Lunch")
+                await tracker.add_expenses_bulk([("2025-05-02", 50.00, "Transport", "Bus")])
+                food = await tracker.get_expenses(category="FOOD")
+                newest = await tracker.fetch(tracker.query().order_by("-date").limit(1))
+                found = await tracker.search("bus")
+                summary = await tracker.get_summary()
+                return ([e['Description'] for e in food], newest[0]['Description'],
+                        found[0]['Description'], summary['total'])
+
+        self.assertEqual(asyncio.run(scenario()), (["Lunch"], "Bus", "Bus", 65.99))
+        with self.assertRaises(ValueError):
+            AsyncExpenseTracker(ExpenseTracker())
+        print("✓ Async facade test passed")
+
+class TestPersistentExpenseTracker(unittest.TestCase):
+    """Test suite for the on-disk expense store."""
+
+    def setUp(self):
+        """Create a temporary directory for each store."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "expenses")
+
+    def tearDown(self):
+        """Remove the temporary store files."""
+        self.directory.cleanup()
+
+    def add_quietly(self, tracker, *expense):
+        """Add an expense without printing the confirmation message."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracker.add_expense(*expense)
+
+    def test_reopen_restores_expenses(self):
+        """Test that expenses, filters and totals survive a reopen."""
+        with ExpenseTracker(self.path) as tracker:
+            self.add_quietly(tracker, "2025-05-03", 25.50, "Food", "Dinner")
+            self.add_quietly(tracker, "2025-05-01", 15.99, "Food", "Lunch")
+            self.add_quietly(tracker, "2025-05-02", 50.00, "Transport", "")
+
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(len(tracker.expenses), 3)
+            self.assertEqual(tracker.expenses[1]['Description'], "Lunch")
+            self.assertEqual(tracker.expenses[2]['Description'], "")
+            self.assertEqual(len(tracker.get_expenses("2025-05-01", "2025-05-02", "food")), 1)
+            self.assertAlmostEqual(tracker.get_summary()['total'], 91.49, places=2)
+            self.assertEqual(tracker.get_rollup('month', by_category=False), {"2025-05": 91.49})
+            self.assertTrue(tracker.verify_summary())
+
+            # New rows are appended after the mapped ones
+            self.add_quietly(tracker, "2025-04-30", 1.00, "Rent", "Deposit")
+            self.assertEqual(len(tracker.get_expenses(end_date="2025-05-01")), 2)
+            self.assertEqual(len(tracker.get_expenses(category="RENT")), 1)
+
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(len(tracker.expenses), 4)
+            self.assertEqual(tracker.expenses[3]['Category'], "Rent")
+            self.assertEqual([e['Date'] for e in tracker.search("deposit")], ["2025-04-30"])
+        print("✓ Persistent reopen test passed")
+
+    def test_reopen_without_snapshot(self):
+        """Test that totals and the date index are rebuilt from the log alone."""
+        tracker = ExpenseTracker(self.path, snapshot_every=0)
+        self.add_quietly(tracker, "2025-05-02", 10.00, "Food", "B")
+        self.add_quietly(tracker, "2025-05-01", 20.00, "Food", "A")
+        tracker.flush()
+        tracker.expenses.close()
+
+        with ExpenseTracker(self.path) as tracker:
+            self.assertAlmostEqual(tracker.get_summary()['total'], 30.00, places=2)
+            self.assertEqual([e['Description'] for e in tracker.get_expenses("2025-05-01", "2025-05-01")], ["A"])
+        print("✓ Snapshot-free reopen test passed")
+
+    def test_currency_scale_is_stored(self):
+        """Test that a store keeps the currency scale it was created with."""
+        with ExpenseTracker(self.path, currency_scale=3) as tracker:
+            tracker.add_expenses_bulk([("2025-05-01", "1.2345", "Fees", "")])
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(tracker.expenses.currency_scale, 3)
+            self.assertEqual(tracker.get_summary(exact=True)['total'], Decimal("1.235"))
+        with self.assertRaises(ValueError):
+            ExpenseTracker(self.path, currency_scale=2)
+        print("✓ Stored currency scale test passed")
+
+    def test_summaries_reuse_period_totals(self):
+        """Test that date-filtered summaries add up saved year, month and day totals."""
+        rows = list(generate_expenses(3_000, seed=11))
+        with ExpenseTracker(self.path) as tracker:
+            tracker.add_expenses_bulk(rows[:2_000])
+        with ExpenseTracker(self.path) as tracker:
+            # Loads the saved totals and replays only the rows after them
+            tracker.add_expenses_bulk(rows[2_000:])
+            self.assertTrue(os.path.exists(os.path.join(self.path, "segments.dat")))
+            for start, end, category in [("2023-01-01", "2024-12-31", None),
+                                         ("2023-02-17", "2025-03-02", "FOOD"),
+                                         ("2024-02-29", "2024-03-01", None),
+                                         (None, "2024-06-15", "transport"),
+                                         ("2025-12-31", None, None)]:
+                expected_rows = [row for row in rows
+                                 if (start is None or row[0] >= start) and (end is None or row[0] <= end)
+                                 and (category is None or row[2].casefold() == category.casefold())]
+                summary = tracker.summarize(start, end, category, exact=True)
+                self.assertEqual(summary['count'], len(expected_rows))
+                self.assertEqual(summary['total'], sum(Decimal(str(row[1])) for row in expected_rows))
+                self.assertEqual(summary['count'], len(tracker.get_expenses(start, end, category)))
+        print("✓ Period totals reuse test passed")
+
+    def test_partial_record_is_discarded(self):
+        """Test recovery from a record that was only partly written."""
+        with ExpenseTracker(self.path) as tracker:
+            self.add_quietly(tracker, "2025-05-01", 15.99, "Food", "Lunch")
+        with open(os.path.join(self.path, "expenses.log"), "ab") as log:
+            log.write(b"\x01\x02\x03")
+
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(len(tracker.expenses), 1)
+            self.add_quietly(tracker, "2025-05-02", 1.00, "Food", "Snack")
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(tracker.expenses[1]['Description'], "Snack")
+        print("✓ Partial record recovery test passed")
+
+    def test_rejected_batch_is_not_written(self):
+        """Test that a batch failing in the store leaves no trace in the log."""
+        with ExpenseTracker(self.path) as tracker:
+            with self.assertRaises(OverflowError):
+                tracker.expenses.extend([(_parse_date("2025-05-01"), 2 ** 63, "Food", "huge")])
+            self.add_quietly(tracker, "2025-05-02", 5, "Food", "Snack")
+            self.assertEqual(tracker.get_expenses()[0]['Description'], "Snack")
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual([e['Description'] for e in tracker.get_expenses()], ["Snack"])
+        print("✓ Rejected batch test passed")
+
+    def test_deletes_survive_reopen_and_compaction(self):
+        """Test that tombstones, expense IDs and compacted files are read back on reopen."""
+        with ExpenseTracker(self.path) as tracker:
+            tracker.add_expenses_bulk([("2025-05-01", 10, "Food", "A"), ("2025-05-02", 20, "Food", "B"),
+                                       ("2025-05-03", 30, "Rent", "C")])
+            tracker.delete_expense(0)
+            tracker.update_expense(2, category="Food")
+
+        def contents(tracker):
+            return sorted((e.expense_id, e['Category'], e['Description']) for e in tracker.get_expenses())
+
+        expected = [(1, "Food", "B"), (2, "Food", "C")]
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(contents(tracker), expected)
+            self.assertEqual(tracker.get_summary()['total'], 50.0)
+            self.assertTrue(tracker.verify_summary())
+            log_size = os.path.getsize(os.path.join(self.path, "expenses.log"))
+            self.assertEqual(tracker.compact(), 4)
+            self.assertLess(os.path.getsize(os.path.join(self.path, "expenses.log")), log_size)
+            self.assertFalse(os.path.exists(os.path.join(self.path, "compact.tmp")))
+            tracker.add_expenses_bulk([("2025-05-04", 5, "Food", "D")])
+
+        # A compaction that never reached its commit marker is discarded
+        os.makedirs(os.path.join(self.path, "compact.tmp"))
+        with ExpenseTracker(self.path) as tracker:
+            self.assertEqual(contents(tracker), expected + [(6, "Food", "D")])
+            self.assertTrue(tracker.update_expense(1, amount=1))
+            self.assertEqual(tracker.summarize(category="food")['total'], 36.0)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "compact.tmp")))
+        print("✓ Persistent delete and compaction test passed")
+
+    def test_group_commit(self):
+        """Test that fsyncs are grouped every sync_every rows."""
+        with ExpenseTracker(self.path, sync_every=3) as tracker:
+            for day in range(1, 5):
+                self.add_quietly(tracker, f"2025-05-0{day}", day, "Food", "x")
+            self.assertEqual(tracker.expenses._unsynced, 1)
+            tracker.flush()
+            self.assertEqual(tracker.expenses._unsynced, 0)
+        print("✓ Group commit test passed")
+
+class TestSQLiteExpenseTracker(unittest.TestCase):
+    """Test suite for the SQLite storage backend."""
+
+    def setUp(self):
+        """Create a temporary directory for each database."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "expenses.db")
+
+    def tearDown(self):
+        """Remove the temporary database files."""
+        self.directory.cleanup()
+
+    def test_matches_in_memory_tracker(self):
+        """Test that filters and summaries agree with the in-memory tracker."""
+        rows = list(generate_expenses(2_000, seed=5))
+        memory = ExpenseTracker()
+        memory.add_expenses_bulk(rows)
+        with SQLiteExpenseTracker(self.path) as database:
+            report = database.add_expenses_bulk(rows + [("2025-13-01", 1, "Food", "Bad")], batch_size=500)
+            self.assertEqual((report['added'], report['rejected'][0]['reason']), (2_000, "invalid date"))
+            for filters in [("2024-03-01", "2024-03-31", None), (None, None, "FOOD"),
+                            ("2025-06-01", None, "travel"), ("2024-02-29", "2024-02-29", None)]:
+                self.assertEqual(database.get_expenses(*filters),
+                                 [dict(expense) for expense in memory.get_expenses(*filters)])
+                self.assertEqual(database.summarize(*filters, exact=True),
+                                 memory.summarize(*filters, exact=True))
+            self.assertEqual(database.get_summary(exact=True), memory.get_summary(exact=True))
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(database.get_expenses("2025-02-30"), [])
+            self.assertIn("Invalid date format", output.getvalue())
+        print("✓ SQLite backend consistency test passed")
+
+    def test_reopen_and_settings(self):
+        """Test that expenses and the currency scale survive a reopen."""
+        with SQLiteExpenseTracker(self.path, currency_scale=3) as database:
+            with contextlib.redirect_stdout(io.StringIO()):
+                database.add_expense("2025-05-01", 1.2345, "Food", "Lunch")
+        with SQLiteExpenseTracker(self.path) as database:
+            self.assertEqual(database.get_summary(exact=True)['total'], Decimal("1.235"))
+            self.assertEqual(database.get_expenses(category="food")[0]['Description'], "Lunch")
+        with self.assertRaises(ValueError):
+            SQLiteExpenseTracker(self.path, currency_scale=2)
+        print("✓ SQLite reopen test passed")
+
+class TestImportExport(unittest.TestCase):
+    """Test suite for streaming file import, export and the command line."""
+
+    def setUp(self):
+        """Create a tracker with sample data and a scratch directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.tracker = ExpenseTracker()
+        self.tracker.add_expenses_bulk([
+            ("2025-05-01", 15.99, "Food", "Lunch"),
+            ("2025-05-02", 50.00, "Transport", "Gas, premium"),
+            ("2025-05-03", 25.50, "Food", "Dinner \"special\""),
+        ])
+
+    def tearDown(self):
+        """Remove scratch files."""
+        self.directory.cleanup()
+
+    def path(self, name):
+        """Return a path inside the scratch directory."""
+        return os.path.join(self.directory.name, name)
+
+    def test_round_trip_each_format(self):
+        """Test that exported files import back unchanged, compressed or not."""
+        for name in ("out.csv", "out.jsonl", "out.csv.gz", "out.jsonl.gz"):
+            count = self.tracker.export_expenses(self.path(name))
+            self.assertEqual(count, 3)
+
+            copy = ExpenseTracker()
+            report = copy.import_expenses(self.path(name), chunk_size=2)
+            self.assertEqual(report, {'added': 3, 'rejected': []})
+            self.assertEqual([dict(e) for e in copy.get_expenses()],
+                             [dict(e) for e in self.tracker.get_expenses()])
+        print("✓ Import/export round trip test passed")
+
+    def test_round_trip_keeps_currency_scale(self):
+        """Test that CSV exports and listings keep every decimal place of finer currencies."""
+        dinar = ExpenseTracker(currency_scale=3)
+        dinar.add_expenses_bulk([("2025-05-01", "1.234", "Food", "Lunch"),
+                                 ("2025-05-02", "0.005", "Rent", "Fee")])
+        dinar.export_expenses(self.path("dinar.csv"))
+        self.assertEqual([row[1] for row in read_expenses(self.path("dinar.csv"))], ["1.234", "0.005"])
+
+        copy = ExpenseTracker(currency_scale=3)
+        self.assertEqual(copy.import_expenses(self.path("dinar.csv")), {'added': 2, 'rejected': []})
+        self.assertEqual(copy.get_summary(exact=True)['total'], Decimal("1.239"))
+
+        output = io.StringIO()
+        print_expenses(dinar.get_expenses(), stream=output, currency_scale=3)
+        self.assertIn("$    1.234 |", output.getvalue())
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            print_summary(dinar.get_summary(), 3)
+        self.assertIn("$    1.239", output.getvalue())
+        print("✓ Currency scale round trip test passed")
+
+    def test_filtered_export(self):
+        """Test that export applies the get_expenses() filters."""
+        count = self.tracker.export_expenses(self.path("food.csv"), category="FOOD",
+                                             start_date="2025-05-02")
+        self.assertEqual(count, 1)
+        self.assertEqual(list(read_expenses(self.path("food.csv"))),
+                         [("2025-05-03", "25.50", "Food", 'Dinner "special"')])
+        with self.assertRaises(ValueError):
+            self.tracker.export_expenses(self.path("bad.csv"), start_date="2025/05/01")
+        print("✓ Filtered export test passed")
+
+    def test_command_line_import_and_export(self):
+        """Test the non-interactive import and export commands."""
+        self.tracker.export_expenses(self.path("in.jsonl"))
+        with open(self.path("in.jsonl"), "a", encoding="utf-8") as handle:
+            handle.write("not json\n")
+        db = self.path("db")
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(main(["import", self.path("in.jsonl"), "--db", db]), 1)
+            self.assertEqual(main(["export", self.path("out.csv"), "--db", db, "--end", "2025-05-01"]), 0)
+
+        self.assertEqual(len(list(read_expenses(self.path("out.csv")))), 1)
+        with ExpenseTracker(db) as tracker:
+            self.assertEqual(len(tracker.expenses), 3)
+        print("✓ Command-line import/export test passed")
+
+    def test_command_line_reports(self):
+        """Test the add, list, summary and rollup commands and their output formats."""
+        db = self.path("db")
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(main(["add", "2025-05-01", "12.50", "Food", "Lunch, out", "--db", db]), 0)
+            self.assertEqual(main(["add", "2025-05-02", "abc", "Food", "Lunch", "--db", db]), 1)
+            with self.assertRaises(SystemExit):
+                main(["list", "--db", db, "--start", "2025-13-01"])
+        main(["add", "2025-06-03", "40", "Transport", "Taxi", "--db", db])
+
+        def run(*argv):
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(main(list(argv) + ["--db", db]), 0)
+            return output.getvalue()
+
+        self.assertEqual(run("list", "--output", "csv", "--limit", "1").splitlines(),
+                         ["Date,Amount,Category,Description", '2025-05-01,12.50,Food,"Lunch, out"'])
+        listing = json.loads(run("list", "--output", "json", "--category", "transport"))
+        self.assertEqual(listing, [{"Date": "2025-06-03", "Amount": 40.0,
+                                    "Category": "Transport", "Description": "Taxi"}])
+        self.assertEqual(json.loads(run("summary", "--output", "json"))["total"], 52.5)
+        self.assertIn("TOTAL,12.50,1", run("summary", "--output", "csv", "--end", "2025-05-31"))
+        self.assertEqual(json.loads(run("rollup", "month", "--output", "json")),
+                         {"2025-05": 12.5, "2025-06": 40.0})
+        self.assertIn("Transport", run("rollup", "year", "--by-category"))
+        print("✓ Command-line report test passed")
+
+    def test_command_line_batch(self):
+        """Test running a script of commands in one process."""
+        script = self.path("commands.txt")
+        with open(script, "w", encoding="utf-8") as handle:
+            handle.write("# load two expenses\n\n"
+                         "add 2025-05-01 10 Food 'Corner cafe'\n"
+                         "add 2025-05-02 5 Food Snack\n"
+                         "summary --output csv\n")
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(main(["batch", script]), 0)
+        self.assertEqual(output.getvalue().splitlines()[-1], "TOTAL,15.00")
+
+        with open(script, "a", encoding="utf-8") as handle:
+            handle.write("add 2025-05-03 oops Food Bad\nsummary\n")
+        db = self.path("db")
+        with contextlib.redirect_stdout(io.StringIO()) as output, \
+                contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(main(["batch", script, "--db", db]), 1)
+        self.assertIn("line 6", errors.getvalue())
+        self.assertEqual(output.getvalue().count("TOTAL"), 1)
+        with ExpenseTracker(db) as tracker:
+            self.assertEqual(len(tracker.expenses), 2)
+        print("✓ Command-line batch test passed")
+
+    def test_reimport_skips_duplicates(self):
+        """Test that running the same import twice adds its rows once."""
+        self.tracker.export_expenses(self.path("in.csv"))
+        report = self.tracker.import_expenses(self.path("in.csv"), deduplicate=True)
+        self.assertEqual(report, {'added': 0, 'rejected': [], 'duplicates': 3})
+        self.assertEqual(self.tracker.find_duplicates()['duplicates'], 0)
+
+        db = self.path("db")
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(main(["import", self.path("in.csv"), "--db", db]), 0)
+            self.assertEqual(main(["import", self.path("in.csv"), "--db", db, "--skip-duplicates"]), 0)
+        self.assertIn("Imported 0 expenses, skipped 3 duplicates", errors.getvalue())
+        with ExpenseTracker(db) as tracker:
+            self.assertEqual(len(tracker.expenses), 3)
+        print("✓ Duplicate-skipping import test passed")
+
+class TestBenchmark(unittest.TestCase):
+    """Smoke test for the benchmark harness."""
+
+    def test_benchmark_report(self):
+        """Test that synthetic data is reproducible and the report is complete."""
+        first = list(generate_expenses(200, seed=7))
+        self.assertEqual(first, list(generate_expenses(200, seed=7)))
+        self.assertEqual(ExpenseTracker().add_expenses_bulk(first)['rejected'], [])
+
+        report = run_suite([300], isolate=False, queries=2, samples=5, budget=0.1)
+        result = report['results'][0]
+        self.assertEqual(result['rows'], 300)
+        for name in ('add_expense', 'get_expenses[date+category]', 'get_summary', 'print_summary'):
+            self.assertIn('p99_ms', result['operations'][name])
+        self.assertEqual(result['operations']['add_expenses_bulk']['rows'], 300)
+
+        sqlite_result = run_suite([300], isolate=False, queries=2, samples=5, budget=0.1,
+                                  backend='sqlite')['results'][0]
+        self.assertEqual(sqlite_result['backend'], 'sqlite')
+        self.assertEqual(sqlite_result['operations']['get_expenses[all]']['rows'],
+                         result['operations']['get_expenses[all]']['rows'])
+        print("✓ Benchmark report test passed")
+
 def run_integration_test():
     """Simple integration test for complete workflow."""
     print("\n" + "="*40)